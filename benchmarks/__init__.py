@@ -0,0 +1,3 @@
+# FileName: __init__.py
+# Description: Synthetic datasets and timing runs for the finance data layer.
+#   Run with: python -m benchmarks --help
@@ -0,0 +1,278 @@
+# FileName: __main__.py
+# Description: Times the data-layer functions on synthetic databases of several sizes.
+#   Usage: python -m benchmarks [--scales N ...] [--json FILE] [--compare FILE]
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from src.finance import (
+    add_transaction, calculate_total_balance, clear_read_cache, close_connections,
+    create_snapshot, delete_transactions, export_transactions_file, get_connection, initialize_db,
+    load_balance_history, load_category_breakdown, load_category_transactions,
+    load_category_transactions_page, load_monthly_totals, load_statement,
+    load_transactions, load_transactions_page
+)
+from src.finance import analytics, database, profiling, reports
+
+from .synthetic import populate
+
+# Rows per statement page, as the GUI requests them (STATEMENT_PAGE_SIZE).
+PAGE_SIZE = 200
+# A case stops repeating once it has used this much time, so the full-history
+# loads stay affordable on the largest databases.
+CASE_BUDGET_SECONDS = 2.0
+# Category whose drill-down is timed; the most common expense category.
+DRILL_DOWN_CATEGORY = "Groceries"
+# The last month of the synthetic history, for the period queries.
+PERIOD = ("2024-12-01", "2025-01-01")
+# Slowdowns smaller than this are timer noise, whatever their ratio.
+MIN_REGRESSION_MS = 0.05
+
+
+def measure(func, repeat, setup=None):
+    """
+    Call func up to `repeat` times and return its timings in milliseconds;
+    setup, if given, runs untimed before each call.
+    """
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat and (
+            not timings or time.perf_counter() - started < CASE_BUDGET_SECONDS):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {"median_ms": statistics.median(timings),
+            "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            "runs": len(timings)}
+
+
+def open_dataset(data_dir, rows, users, seed):
+    """
+    Point the data layer at the synthetic database for these parameters,
+    generating it first if data_dir does not hold it yet. Returns
+    (heaviest user id, that user's row count, seconds spent generating or None).
+    """
+    database.DB_NAME = os.path.join(data_dir, f"bench-{rows}-{users}-{seed}.db")
+    generate = not os.path.exists(database.DB_NAME)
+    initialize_db()
+    seconds = None
+    if generate:
+        start = time.perf_counter()
+        populate(rows, users, seed)
+        seconds = time.perf_counter() - start
+        get_connection().execute("PRAGMA optimize")
+    user_id, count = get_connection().execute("""
+    SELECT user_id, transaction_count FROM user_balances
+    ORDER BY transaction_count DESC LIMIT 1
+    """).fetchone()
+    return user_id, count, seconds
+
+
+def run_scale(data_dir, rows, users, seed, repeat):
+    """Time every case against one database; returns {case name: timings}."""
+    user_id, count, seconds = open_dataset(data_dir, rows, users, seed)
+    results = {}
+    if seconds is not None:
+        results["populate (add_transactions_bulk)"] = {
+            "median_ms": seconds * 1000, "p95_ms": seconds * 1000, "runs": 1,
+            "rows_per_second": rows / seconds}
+
+    # Keys for paging from the middle of the heaviest user's history.
+    middle_key = get_connection().execute("""
+    SELECT date, id FROM transactions WHERE user_id = ?
+    ORDER BY date DESC, id DESC LIMIT 1 OFFSET ?
+    """, (user_id, count // 2)).fetchone()
+    category_key = (load_category_transactions_page(
+        user_id, DRILL_DOWN_CATEGORY, PAGE_SIZE, "amount") or [(0, 0, "", "", 0)])[-1]
+
+    cases = {
+        "statement refresh (load_statement)": lambda: load_statement(user_id, PAGE_SIZE),
+        "load_transactions_page (middle)":
+            lambda: load_transactions_page(user_id, PAGE_SIZE, middle_key),
+        "load_transactions (full history)": lambda: load_transactions(user_id),
+        "calculate_total_balance": lambda: calculate_total_balance(user_id),
+        "load_category_breakdown": lambda: load_category_breakdown(user_id),
+        "load_monthly_totals": lambda: load_monthly_totals(user_id),
+        "load_balance_history (1000 buckets)": lambda: load_balance_history(user_id, 1000),
+        "load_transactions (one month)": lambda: load_transactions(user_id, *PERIOD),
+        "calculate_total_balance (one month)":
+            lambda: calculate_total_balance(user_id, *PERIOD),
+        "load_category_breakdown (one month)":
+            lambda: load_category_breakdown(user_id, *PERIOD),
+        "export_transactions_file (csv, full history)": lambda: export_transactions_file(
+            user_id, os.path.join(data_dir, "export.csv")),
+        "load_category_transactions": lambda: load_category_transactions(
+            user_id, DRILL_DOWN_CATEGORY),
+        "load_category_transactions_page (by amount, 2nd page)":
+            lambda: load_category_transactions_page(
+                user_id, DRILL_DOWN_CATEGORY, PAGE_SIZE, "amount",
+                after=(category_key[4], category_key[0])),
+    }
+    # Every case reads from the database; the read cache is measured apart.
+    for name, func in cases.items():
+        results[name] = measure(func, repeat, clear_read_cache)
+    cached_cases = {
+        "load_transactions (full history, cached)": lambda: load_transactions(user_id),
+        "load_category_breakdown (one month, cached)":
+            lambda: load_category_breakdown(user_id, *PERIOD),
+        "calculate_total_balance (one month, cached)":
+            lambda: calculate_total_balance(user_id, *PERIOD),
+    }
+    for name, func in cached_cases.items():
+        func()
+        results[name] = measure(func, repeat)
+
+    columns = analytics.load_columns(user_id)
+
+    def analyze():
+        analytics.monthly_rollup(columns)
+        analytics.running_balance(columns)
+        analytics.moving_average(analytics.category_trends(columns)[1], 3)
+    results["analytics.load_columns (full history)"] = measure(
+        lambda: analytics.load_columns(user_id), repeat)
+    results["analytics (rollup, balance, trends, moving average)"] = measure(analyze, repeat)
+    results["render_user_report (png, one month)"] = measure(
+        lambda: reports.render_user_report(user_id, "benchmark",
+                                           os.path.join(data_dir, "report.png"), None, *PERIOD),
+        repeat, clear_read_cache)
+
+    # Writes are measured in pairs that cancel out, so a kept dataset is
+    # unchanged for the next run.
+    added = []
+    results["add_transaction"] = measure(lambda: added.append(add_transaction(
+        user_id, -1.0, "Benchmark", DRILL_DOWN_CATEGORY, "2020-01-01T00:00:00")), repeat)
+    results["delete_transactions (one id)"] = measure(
+        lambda: delete_transactions(user_id, [added.pop()]), len(added))
+    if added:
+        delete_transactions(user_id, added)
+
+    # A snapshot of the whole database, and how much it slows a writer down
+    # while it runs (compare with add_transaction).
+    snapshots = os.path.join(data_dir, "snapshots")
+    snapshot = {}
+    results["create_snapshot"] = measure(
+        lambda: snapshot.update(create_snapshot(snapshots, keep=1)), 1)
+    results["create_snapshot"]["mb_per_second"] = snapshot["mb_per_second"]
+    backup = threading.Thread(target=create_snapshot, args=(snapshots, 1))
+    timings, written = [], []
+    backup.start()
+    while backup.is_alive() or not timings:
+        start = time.perf_counter()
+        written.append(add_transaction(user_id, -1.0, "Benchmark", DRILL_DOWN_CATEGORY,
+                                       "2020-01-01T00:00:00"))
+        timings.append((time.perf_counter() - start) * 1000)
+    backup.join()
+    delete_transactions(user_id, written)
+    shutil.rmtree(snapshots)
+    timings.sort()
+    results["add_transaction (during create_snapshot)"] = {
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "runs": len(timings)}
+    for result in results.values():
+        result["user_rows"] = count
+    close_connections()
+    return results
+
+
+def format_report(report):
+    lines = [f"SQLite {report['meta']['sqlite']}, Python {report['meta']['python']}, "
+             f"{report['meta']['users']} users, seed {report['meta']['seed']}"]
+    for rows, results in report["results"].items():
+        lines.append("")
+        lines.append(f"{int(rows):,} rows (heaviest user: "
+                     f"{next(iter(results.values()))['user_rows']:,} rows)")
+        lines.append(f"  {'case':<56}{'median ms':>12}{'p95 ms':>12}{'runs':>6}")
+        for name, result in results.items():
+            lines.append(f"  {name:<56}{result['median_ms']:>12.3f}"
+                         f"{result['p95_ms']:>12.3f}{result['runs']:>6}")
+    return "\n".join(lines)
+
+
+def compare(report, baseline, tolerance):
+    """Return a line for every case whose median grew by more than `tolerance` times."""
+    regressions = []
+    for rows, results in report["results"].items():
+        for name, result in results.items():
+            before = baseline["results"].get(rows, {}).get(name)
+            # Generation only runs when a dataset is new, so it is not compared.
+            if before and before["median_ms"] > 0 and not name.startswith("populate"):
+                ratio = result["median_ms"] / before["median_ms"]
+                if ratio > tolerance and result["median_ms"] - before["median_ms"] > MIN_REGRESSION_MS:
+                    regressions.append(
+                        f"{int(rows):,} rows, {name}: {before['median_ms']:.3f} ms -> "
+                        f"{result['median_ms']:.3f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark the finance data layer.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000],
+                        help="total transaction counts to test (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=10,
+                        help="users sharing the transactions (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="maximum timed runs per case (default: %(default)s)")
+    parser.add_argument("--data-dir",
+                        help="keep generated databases here and reuse them on later runs "
+                             "(default: a temporary directory)")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    parser.add_argument("--compare", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="also record per-query timings to FILE as JSON "
+                             "(the reported times then include the profiling overhead)")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="slowdown factor reported as a regression (default: %(default)s)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="pfa-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    report = {"meta": {"sqlite": sqlite3.sqlite_version, "python": platform.python_version(),
+                       "users": args.users, "seed": args.seed},
+              "results": {}}
+    if args.profile:
+        profiling.enable_profiling()
+    try:
+        for rows in args.scales:
+            report["results"][str(rows)] = run_scale(
+                data_dir, rows, args.users, args.seed, args.repeat)
+    finally:
+        if args.profile:
+            profiling.disable_profiling()
+            profiling.export_profile(args.profile)
+        close_connections()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(report, json.load(handle), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nNo case is more than {args.tolerance}x slower than {args.compare}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# FileName: load_test.py
+# Description: Drives the JSON API with concurrent clients and reports requests per second.
+#   Usage: python -m benchmarks.load_test [--clients N] [--duration S] [--url HOST:PORT]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .synthetic import generate_transactions
+
+# Share of requests going to each call once the clients are signed in.
+REQUEST_MIX = {"GET /balance": 0.4, "GET /breakdown": 0.25,
+               "GET /transactions": 0.2, "POST /transactions": 0.15}
+# Rows each new user is given before timing starts.
+SEED_ROWS = 200
+PASSWORD = "loadtest"
+SERVER_START_SECONDS = 10.0
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection to the API."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.token = None
+        self._reader = self._writer = None
+
+    async def request(self, method, path, body=None):
+        """Send one request and return (status, decoded JSON body)."""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(data)}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        self._writer.write(head.encode() + b"\r\n" + data)
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while (line := await self._reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self._reader.readexactly(length))
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+
+async def sign_in(client, username, seed):
+    """Sign the client in as `username`, creating and seeding the user if it is new."""
+    credentials = {"username": username, "password": PASSWORD}
+    created, _ = await client.request("POST", "/users", credentials)
+    status, payload = await client.request("POST", "/sessions", credentials)
+    if status != 201:
+        raise RuntimeError(f"Could not sign in as {username}: {payload}")
+    client.token = payload["token"]
+    if created == 201:
+        for amount, description, category, date in generate_transactions(SEED_ROWS, seed):
+            await client.request("POST", "/transactions", {
+                "amount": amount, "description": description, "category": category,
+                "date": date.isoformat()})
+
+
+async def run_client(client, deadline, rng, latencies, errors):
+    """Send requests drawn from REQUEST_MIX until the deadline."""
+    names, weights = zip(*REQUEST_MIX.items())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path = name.split()
+        body = None
+        if name == "GET /transactions":
+            path += "?start=2024-01-01&limit=50"
+        elif name == "POST /transactions":
+            body = {"amount": -round(rng.uniform(1, 100), 2), "description": "Load test",
+                    "category": "Groceries", "date": "2024-06-01T12:00:00"}
+        start = time.perf_counter()
+        status, _ = await client.request(method, path, body)
+        latencies[name].append((time.perf_counter() - start) * 1000)
+        if status >= 400:
+            errors[name] = errors.get(name, 0) + 1
+
+
+async def load_test(host, port, clients, users, duration, seed):
+    """Run the load test against a server at host:port; returns the report dict."""
+    connections = [Client(host, port) for _ in range(clients)]
+    # Several clients may share a user, as one user's devices would.
+    for index, client in enumerate(connections):
+        await sign_in(client, f"load{seed}-{index % users:04d}", seed * 1000 + index % users)
+    latencies = {name: [] for name in REQUEST_MIX}
+    errors = {}
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(client, started + duration, random.Random(seed * 1000 + index),
+                   latencies, errors)
+        for index, client in enumerate(connections)))
+    elapsed = time.perf_counter() - started
+    for client in connections:
+        await client.close()
+
+    total = sum(len(values) for values in latencies.values())
+    report = {"clients": clients, "users": users, "seconds": elapsed, "requests": total,
+              "requests_per_second": total / elapsed, "errors": errors, "endpoints": {}}
+    for name, values in latencies.items():
+        if values:
+            values.sort()
+            report["endpoints"][name] = {
+                "requests": len(values), "median_ms": statistics.median(values),
+                "p95_ms": values[min(len(values) - 1, int(len(values) * 0.95))],
+                "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))]}
+    return report
+
+
+def format_report(report):
+    lines = [f"{report['clients']} clients, {report['users']} users, "
+             f"{report['seconds']:.1f}s: {report['requests']:,} requests, "
+             f"{report['requests_per_second']:,.0f} requests/s",
+             f"  {'request':<22}{'count':>9}{'median ms':>12}{'p95 ms':>10}{'p99 ms':>10}"]
+    for name, result in report["endpoints"].items():
+        lines.append(f"  {name:<22}{result['requests']:>9,}{result['median_ms']:>12.2f}"
+                     f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    if report["errors"]:
+        lines.append(f"  errors: {report['errors']}")
+    return "\n".join(lines)
+
+
+def start_server(db_path, workers):
+    """Start `python -m src.finance serve` on a free port; returns (process, port)."""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "src.finance", "--db", db_path, "serve",
+         "--port", str(port), "--workers", str(workers)],
+        stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + SERVER_START_SECONDS
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process, port
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("The API server did not start")
+            time.sleep(0.05)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load_test",
+                                     description="Load-test the finance JSON API.")
+    parser.add_argument("--clients", type=int, default=32,
+                        help="concurrent keep-alive connections (default: %(default)s)")
+    parser.add_argument("--users", type=int, default=8,
+                        help="users the clients sign in as (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="seconds of timed load (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="database threads of the server started for the test "
+                             "(default: %(default)s)")
+    parser.add_argument("--url", metavar="HOST:PORT",
+                        help="test an already running server instead of starting one "
+                             "on a temporary database")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    process = data_dir = None
+    if args.url:
+        host, _, port = args.url.rpartition(":")
+        port = int(port)
+    else:
+        data_dir = tempfile.mkdtemp(prefix="pfa-load-")
+        process, port = start_server(os.path.join(data_dir, "load.db"), args.workers)
+        host = "127.0.0.1"
+    try:
+        report = asyncio.run(load_test(host, port, args.clients, args.users,
+                                       args.duration, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+            shutil.rmtree(data_dir, ignore_errors=True)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(report, handle, indent=2)
+
+
+if __name__ == "__main__":
+    main()
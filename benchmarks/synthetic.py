@@ -0,0 +1,94 @@
+# FileName: synthetic.py
+# Description: Reproducible synthetic users and transaction histories for benchmarks.
+
+import datetime
+import random
+
+from src.finance import add_transactions_bulk, create_user, verify_user
+
+# The categories the app offers, with how often a generated expense uses each.
+INCOME_CATEGORIES = {"Pay": 0.75, "Bonus": 0.05, "Investment": 0.12, "Other": 0.08}
+EXPENSE_CATEGORIES = {"Bills": 0.25, "Subscriptions": 0.1, "Groceries": 0.35,
+                      "Entertainment": 0.2, "Travel": 0.1}
+# Typical size of an expense in each category; amounts are log-normal around it.
+EXPENSE_SCALE = {"Bills": 120.0, "Subscriptions": 15.0, "Groceries": 45.0,
+                 "Entertainment": 40.0, "Travel": 300.0}
+DESCRIPTIONS = {
+    "Pay": ("Salary", "Paycheck"),
+    "Bonus": ("Annual bonus", "Referral bonus"),
+    "Investment": ("Dividend", "Interest"),
+    "Other": ("Gift", "Refund", "Sold item"),
+    "Bills": ("Electric", "Water", "Rent", "Phone", "Internet"),
+    "Subscriptions": ("Streaming", "Music", "Cloud storage", "Gym"),
+    "Groceries": ("Supermarket", "Market", "Bakery", "Butcher"),
+    "Entertainment": ("Cinema", "Concert", "Games", "Restaurant"),
+    "Travel": ("Flight", "Hotel", "Train", "Fuel"),
+}
+# Share of expenses filed under two categories, e.g. "Bills, Travel".
+MULTI_CATEGORY_RATE = 0.05
+PASSWORD = "benchmark"
+END_DATE = datetime.datetime(2025, 1, 1)
+
+
+def user_sizes(total_rows, users, seed=0):
+    """
+    Split total_rows between users the way real usage is skewed: a few heavy
+    users hold most of the history (a Zipf-like 1/rank weighting).
+    """
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, users + 1)]
+    rng.shuffle(weights)
+    scale = total_rows / sum(weights)
+    sizes = [int(weight * scale) for weight in weights]
+    sizes[0] += total_rows - sum(sizes)
+    return sizes
+
+
+def generate_transactions(count, seed=0, years=5):
+    """
+    Yield `count` (amount, description, category, date) rows for one user,
+    spread over the `years` before END_DATE.
+
+    About one row in eight is income, the rest are expenses; dates cluster
+    during the day and income lands on the 1st and 15th of the month. The
+    same count and seed always give the same rows.
+    """
+    rng = random.Random(seed)
+    span = datetime.timedelta(days=365 * years).total_seconds()
+    start = END_DATE - datetime.timedelta(seconds=span)
+    offsets = sorted(rng.random() * span for _ in range(count))
+    income_names, income_weights = zip(*INCOME_CATEGORIES.items())
+    expense_names, expense_weights = zip(*EXPENSE_CATEGORIES.items())
+    for offset in offsets:
+        date = start + datetime.timedelta(seconds=offset)
+        if rng.random() < 0.125:
+            category = rng.choices(income_names, income_weights)[0]
+            amount = round(rng.lognormvariate(7.5, 0.4), 2)
+            date = date.replace(day=1 if date.day < 15 else 15, hour=9, minute=0)
+        else:
+            category = rng.choices(expense_names, expense_weights)[0]
+            amount = -round(rng.lognormvariate(0, 0.8) * EXPENSE_SCALE[category], 2)
+            date = date.replace(hour=rng.choice((8, 12, 13, 18, 19, 20)))
+        description = rng.choice(DESCRIPTIONS[category])
+        if amount < 0 and rng.random() < MULTI_CATEGORY_RATE:
+            second = rng.choices(expense_names, expense_weights)[0]
+            if second != category:
+                category = ", ".join(sorted((category, second)))
+        yield amount, description, category, date
+
+
+def populate(total_rows, users=10, seed=0):
+    """
+    Create `users` users in the current database and give them total_rows
+    transactions between them. Returns [(username, user_id, row count)],
+    heaviest user first.
+    """
+    created = []
+    for index, size in enumerate(user_sizes(total_rows, users, seed)):
+        username = f"bench{index:04d}"
+        create_user(username, PASSWORD)
+        user_id = verify_user(username, PASSWORD)
+        add_transactions_bulk(user_id, generate_transactions(size, seed=seed * 100003 + index))
+        created.append((username, user_id, size))
+    created.sort(key=lambda user: user[2], reverse=True)
+    return created
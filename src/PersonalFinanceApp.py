@@ -11,169 +11,80 @@
 #   - Python (https://www.python.org/downloads/)
 #   - Matplotlib (pip install matplotlib)
 
+# Usage: python -m src.PersonalFinanceApp (from the repository root)
+#   The data layer lives in the headless src.finance package; this module is
+#   only the Tkinter front end and creates no windows until main() runs.
+
+import datetime
+import functools
+import math
+import os
+import sys
 import tkinter as tk
 from tkinter import ttk, messagebox
-import sqlite3
-import datetime
-import hashlib
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.patches
-
-# Database setup
-DB_NAME = "finance_manager.db"
-
-
-def initialize_db():
-    """Initialize the SQLite database and create required tables."""
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        # Create users table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL
-        )
-        """)
-        # Create transactions table
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            amount REAL NOT NULL,
-            description TEXT,
-            category TEXT,
-            date TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-        """)
-    conn.close()
-
-# Hash a password
-
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
-
-# Add a new user to the database
-
-
-def create_user(username, password):
-    try:
-        hashed_password = hash_password(password)
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-            conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-
-# Verify user credentials
-
-
-def verify_user(username, password):
-    hashed_password = hash_password(password)
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT id FROM users WHERE username = ? AND password = ?", (username, hashed_password))
-        result = cursor.fetchone()
-        if result:
-            return result[0]  # Return user ID
-    return None
-
-# Add a transaction to the database
-
 
-def add_transaction(user_id, amount, description, category):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        INSERT INTO transactions (user_id, amount, description, category, date)
-        VALUES (?, ?, ?, ?, ?)
-        """, (user_id, amount, description, category, datetime.datetime.now().isoformat()))
-        conn.commit()
+# Allow "python src/PersonalFinanceApp.py" as well as running it as a module.
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Load transactions for a user
+from src.finance import (  # noqa: E402
+    DataService, add_transaction, create_user, delete_transactions, enable_profiling,
+    export_profile, format_transaction_date, initialize_db, load_category_transactions_page,
+    load_changed_balance_history, load_changed_breakdown, load_statement,
+    load_transactions_page, search_transactions, timed, verify_user
+)
+# Re-exported so existing "from src.PersonalFinanceApp import ..." callers keep working.
+from src.finance import (  # noqa: E402,F401
+    calculate_total_balance, hash_password, load_transactions
+)
 
 
-def load_transactions(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT amount, description, category, date FROM transactions WHERE user_id = ?
-        ORDER BY date DESC
-        """, (user_id,))
-        return cursor.fetchall()
-
-# Load category breakdown
-
-
-def load_category_breakdown(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT category, SUM(amount) FROM transactions WHERE user_id = ?
-        GROUP BY category
-        """, (user_id,))
-        return cursor.fetchall()
-
-# Calculate total balance for a user
-
+@functools.lru_cache(maxsize=None)
+def load_matplotlib():
+    """
+    Import matplotlib and its Tk backend on first use.
 
-def calculate_total_balance(user_id):
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT SUM(amount) FROM transactions WHERE user_id = ?
-        """, (user_id,))
-        result = cursor.fetchone()
-        return result[0] if result[0] else 0
+    They are the slowest part of startup, and only the Breakdown tab needs
+    them, so they are loaded when that tab is first opened.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
 
 
 def delete_transaction():
     """
-    Deletes the selected transaction from the database.
+    Deletes the selected transactions from the database.
     """
-    selected_item = statement_tree.selection()  # Get selected row
-    if not selected_item:
+    selected_items = statement_tree.selection()  # Get selected rows
+    if not selected_items:
         messagebox.showerror("Error", "No transaction selected.")
         return
 
-    # Retrieve transaction details from the selected row
-    values = statement_tree.item(selected_item, "values")
-    if not values:
-        messagebox.showerror(
-            "Error", "Unable to retrieve transaction details.")
-        return
+    # Statement rows are keyed by transaction id
+    transaction_ids = [int(item) for item in selected_items]
 
-    # Extract details
-    amount = float(values[0].replace("$", "").replace(",", ""))
-    description = values[1]
-    category = values[2]
-    date = values[3]
-
-    # Delete the transaction from the database
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        DELETE FROM transactions
-        WHERE user_id = ? AND amount = ? AND description = ? AND category = ? AND date = ?
-        """, (logged_in_user_id, amount, description, category, date))
-        conn.commit()
-
-    # Update the statement view
-    update_statement()
-    messagebox.showinfo("Success", "Transaction deleted successfully.")
+    # Update the statement view once deleted
+    def on_deleted(deleted):
+        remove_statement_rows(deleted)
+        if len(deleted) == 1:
+            messagebox.showinfo("Success", "Transaction deleted successfully.")
+        else:
+            messagebox.showinfo("Success", f"{len(deleted):,} transactions deleted successfully.")
+
+    # Delete the transactions from the database
+    data_service.submit(delete_transactions, (logged_in_user_id, transaction_ids),
+                        on_done=in_session(on_deleted), on_error=show_data_error)
 
 # Logout function
 
 
 def logout():
-    global logged_in_user_id
+    global logged_in_user_id, login_session
+    for key in ("statement", "statement-page", "breakdown", "trend"):
+        data_service.cancel(key)
+    # Writes still in flight complete, but their results belong to the old screen
+    login_session += 1
     logged_in_user_id = None
     username_var.set("")
     password_var.set("")
@@ -183,13 +94,17 @@ def logout():
 
 
 def show_main_screen():
+    global breakdown_chart, trend_chart
     for widget in root.winfo_children():
         widget.destroy()
+    breakdown_chart = trend_chart = None  # Their canvases went with the old widgets
 
     # Add a logout button
     logout_button = tk.Button(root, text="Logout", command=logout,
                               bg="darkred", fg="white", font=("Arial", 14), padx=10, pady=5)
     logout_button.pack(anchor="ne", padx=10, pady=10)
+    tk.Label(root, textvariable=loading_var, font=custom_font,
+             fg="gray").pack(anchor="ne", padx=10)
 
     notebook = ttk.Notebook(root, style="CustomNotebook.TNotebook")
     notebook.pack(pady=10, padx=10, expand=True, fill="both")
@@ -234,9 +149,20 @@ def show_main_screen():
     notebook.add(statement_tab, text="Statement")
     tk.Label(statement_tab, textvariable=total_balance_var,
              font=("Arial", 14)).pack(pady=10)
-    global statement_tree
-    statement_tree = ttk.Treeview(statement_tab, columns=(
-        "Amount", "Description", "Category", "Date"), show="headings", style="Custom.Treeview")
+    search_frame = tk.Frame(statement_tab)
+    search_frame.pack()
+    search_entry = tk.Entry(search_frame, textvariable=search_var, width=40, font=custom_font)
+    search_entry.pack(side="left")
+    search_entry.bind("<Return>", lambda event: show_search_popup(search_var.get()))
+    tk.Button(search_frame, text="Search",
+              command=lambda: show_search_popup(search_var.get()),
+              font=custom_font, padx=5).pack(side="left", padx=5)
+    global statement_tree, statement_scrollbar
+    statement_frame = tk.Frame(statement_tab)
+    statement_frame.pack(pady=10, fill="both", expand=True)
+    statement_tree = ttk.Treeview(statement_frame, columns=(
+        "Amount", "Description", "Category", "Date"), show="headings", style="Custom.Treeview",
+        selectmode="extended")
     statement_tree.heading("Amount", text="Amount")
     statement_tree.heading("Description", text="Description")
     statement_tree.heading("Category", text="Category")
@@ -245,12 +171,21 @@ def show_main_screen():
     statement_tree.column("Description", width=200)
     statement_tree.column("Category", width=150)
     statement_tree.column("Date", width=150)
-    statement_tree.pack(pady=10, fill="both", expand=True)
+    statement_tree.pack(fill="both", expand=True, side="left")
+    statement_tree.tag_configure("green", foreground="green")
+    statement_tree.tag_configure("red", foreground="red")
+
+    # Rows are paged in and out as the scrollbar nears either end
+    statement_scrollbar = ttk.Scrollbar(
+        statement_frame, orient="vertical", command=statement_tree.yview)
+    statement_tree.configure(yscrollcommand=on_statement_scroll)
+    statement_scrollbar.pack(side="right", fill="y")
 
     # Add Delete Button
     delete_button = tk.Button(statement_tab, text="Delete Selected", command=delete_transaction,
                               bg="darkred", fg="white", font=custom_font, padx=5, pady=5)
     delete_button.pack(pady=10)
+    statement_tree.bind("<Delete>", lambda event: delete_transaction())
 
     update_statement()
 
@@ -258,41 +193,252 @@ def show_main_screen():
     breakdown_tab = ttk.Frame(notebook)
     notebook.add(breakdown_tab, text="Breakdown")
 
-    # Automatically update pie chart when Breakdown tab is clicked
+    # Trend Tab
+    trend_tab = ttk.Frame(notebook)
+    notebook.add(trend_tab, text="Trend")
+
+    # Automatically update the charts when their tab is clicked
     def on_tab_changed(event):
         selected_tab = event.widget.index("current")
         if notebook.tab(selected_tab, "text") == "Breakdown":
             generate_pie_chart(breakdown_tab)
+        elif notebook.tab(selected_tab, "text") == "Trend":
+            generate_trend_chart(trend_tab)
 
     notebook.bind("<<NotebookTabChanged>>", on_tab_changed)
 
 
+# The Statement tab shows a sliding window of at most STATEMENT_MAX_ROWS rows,
+# fetched STATEMENT_PAGE_SIZE at a time as the user scrolls toward either end.
+STATEMENT_PAGE_SIZE = 200
+STATEMENT_MAX_ROWS = 1000
+# Fraction of the scroll range from an end at which the next page is fetched.
+STATEMENT_PREFETCH_MARGIN = 0.1
+
+
+def format_statement_row(amount, description, category, date):
+    formatted_amount = f"+${amount:,.2f}" if amount > 0 else f"-${abs(amount):,.2f}"
+    color = "green" if amount > 0 else "red"
+    return (formatted_amount, description, category, date), (color,)
+
+
+def insert_statement_rows(rows, index):
+    """Insert (id, amount, description, category, date) rows at position `index`, keyed by id."""
+    for offset, (transaction_id, amount, description, category, date) in enumerate(rows):
+        values, tags = format_statement_row(amount, description, category, date)
+        statement_tree.insert("", index + offset, iid=str(transaction_id),
+                              values=values, tags=tags)
+    statement_keys[index:index] = [(row[4], row[0]) for row in rows]
+
+
+@timed
 def update_statement():
     """
     Updates the statement tree view with transactions.
-    """
-    for row in statement_tree.get_children():
-        statement_tree.delete(row)
 
-    transactions = load_transactions(logged_in_user_id)
-    total_balance = calculate_total_balance(logged_in_user_id)
-    total_balance_var.set(f"Total Balance: ${total_balance:,.2f}")
+    Only the newest page is loaded here; older rows are fetched on demand by
+    on_statement_scroll.
+    """
+    global statement_fetch_pending
+    # Page fetches for the old contents would land in the new view.
+    data_service.cancel("statement-page")
+    statement_fetch_pending = True
+    data_service.submit(load_statement, (logged_in_user_id, STATEMENT_PAGE_SIZE),
+                        on_done=show_statement, on_error=show_data_error, key="statement")
+
+
+@timed
+def show_statement(result):
+    """Fill the statement from a load_statement result."""
+    global statement_has_older, statement_has_newer, statement_balance, statement_fetch_pending
+    statement_balance, rows = result
+    total_balance_var.set(f"Total Balance: ${statement_balance:,.2f}")
+
+    statement_tree.delete(*statement_tree.get_children())
+    statement_keys.clear()
+    insert_statement_rows(rows, 0)
+    statement_has_older = len(rows) == STATEMENT_PAGE_SIZE
+    statement_has_newer = False
+    statement_fetch_pending = False
+
+
+def statement_position(key):
+    """Index at which the (date, id) key belongs in the newest-first statement_keys."""
+    low, high = 0, len(statement_keys)
+    while low < high:
+        middle = (low + high) // 2
+        if statement_keys[middle] > key:
+            low = middle + 1
+        else:
+            high = middle
+    return low
 
-    for amount, description, category, date in transactions:
-        formatted_amount = f"+${amount:,.2f}" if amount > 0 else f"-${abs(amount):,.2f}"
-        color = "green" if amount > 0 else "red"
-        statement_tree.insert("", "end", values=(
-            formatted_amount, description, category, date), tags=(color,))
-    statement_tree.tag_configure("green", foreground="green")
-    statement_tree.tag_configure("red", foreground="red")
 
+def add_statement_row(transaction_id, amount, description, category, date):
+    """Show a newly stored transaction without reloading the statement."""
+    global statement_balance, statement_has_older
+    statement_balance = round(statement_balance + amount, 2)
+    total_balance_var.set(f"Total Balance: ${statement_balance:,.2f}")
 
+    key = (date, transaction_id)
+    index = statement_position(key)
+    # Rows that sort outside the loaded window are picked up when paged in.
+    if (index == 0 and statement_has_newer) or (
+            index == len(statement_keys) and statement_has_older):
+        return
+    insert_statement_rows([(transaction_id, amount, description, category, date)], index)
+    if len(statement_keys) > STATEMENT_MAX_ROWS:
+        statement_tree.delete(statement_tree.get_children()[-1])
+        statement_keys.pop()
+        statement_has_older = True
+
+
+def remove_statement_rows(deleted):
+    """Drop the rows of deleted (id, amount) transactions and take them off the balance."""
+    global statement_balance
+    statement_balance = round(statement_balance - sum(amount for _, amount in deleted), 2)
+    total_balance_var.set(f"Total Balance: ${statement_balance:,.2f}")
+    deleted_ids = {transaction_id for transaction_id, _ in deleted}
+    statement_tree.delete(*(str(transaction_id) for transaction_id in deleted_ids
+                            if statement_tree.exists(str(transaction_id))))
+    statement_keys[:] = [key for key in statement_keys if key[1] not in deleted_ids]
+
+
+def on_statement_scroll(first, last):
+    """yscrollcommand for the statement: move the scrollbar and page rows in or out."""
+    global statement_fetch_pending
+    statement_scrollbar.set(first, last)
+    if statement_fetch_pending:
+        return
+    first, last = float(first), float(last)
+    if last >= 1 - STATEMENT_PREFETCH_MARGIN and statement_has_older and statement_keys:
+        statement_fetch_pending = True
+        data_service.submit(load_transactions_page, (
+            logged_in_user_id, STATEMENT_PAGE_SIZE, statement_keys[-1]),
+            on_done=show_older_statement_rows, on_error=show_data_error, key="statement-page")
+    elif first <= STATEMENT_PREFETCH_MARGIN and statement_has_newer and statement_keys:
+        statement_fetch_pending = True
+        data_service.submit(load_transactions_page, (
+            logged_in_user_id, STATEMENT_PAGE_SIZE, None, statement_keys[0]),
+            on_done=show_newer_statement_rows, on_error=show_data_error, key="statement-page")
+
+
+@timed
+def show_older_statement_rows(rows):
+    """Append the next page of older rows, dropping rows off the top past the window size."""
+    global statement_has_older, statement_has_newer, statement_fetch_pending
+    statement_fetch_pending = False
+    statement_has_older = len(rows) == STATEMENT_PAGE_SIZE
+    insert_statement_rows(rows, len(statement_keys))
+
+    excess = len(statement_keys) - STATEMENT_MAX_ROWS
+    if excess > 0:
+        statement_tree.delete(*statement_tree.get_children()[:excess])
+        del statement_keys[:excess]
+        statement_has_newer = True
+        # Keep the rows the user was looking at in view.
+        statement_tree.yview_scroll(-excess, "units")
+
+
+@timed
+def show_newer_statement_rows(rows):
+    """Prepend the page of rows above the window, dropping rows off the bottom past the window size."""
+    global statement_has_older, statement_has_newer, statement_fetch_pending
+    statement_fetch_pending = False
+    statement_has_newer = len(rows) == STATEMENT_PAGE_SIZE
+    insert_statement_rows(rows, 0)
+    statement_tree.yview_scroll(len(rows), "units")
+
+    excess = len(statement_keys) - STATEMENT_MAX_ROWS
+    if excess > 0:
+        statement_tree.delete(*statement_tree.get_children()[-excess:])
+        del statement_keys[-excess:]
+        statement_has_older = True
+
+
+@timed
 def generate_pie_chart(parent):
-    for widget in parent.winfo_children():
-        widget.destroy()  # Clear previous content
+    """
+    Show the income/expense breakdown in `parent`.
 
-    # Load breakdown and split into income and expenses
-    breakdown = load_category_breakdown(logged_in_user_id)
+    The figure is built once per login and only redrawn when the user's data
+    version has moved on since the last draw, so revisiting the tab is free.
+    """
+    known_version = breakdown_chart["version"] if breakdown_chart else None
+    data_service.submit(load_changed_breakdown, (logged_in_user_id, known_version),
+                        on_done=lambda result: draw_pie_chart(parent, result),
+                        on_error=show_data_error, key="breakdown")
+
+
+def create_breakdown_chart(parent):
+    """Build the breakdown figure and canvas, with one click handler for both pies."""
+    Figure, FigureCanvasTkAgg = load_matplotlib()
+    fig = Figure(figsize=(10, 5), dpi=100)
+    chart = {
+        "figure": fig,
+        "income_axes": fig.add_subplot(121),   # Left pie chart for income
+        "expense_axes": fig.add_subplot(122),  # Right pie chart for expenses
+        "canvas": FigureCanvasTkAgg(fig, master=parent),
+        "empty_label": tk.Label(parent, text="No data available for chart.",
+                                font=("Arial", 12), fg="darkred"),
+        "wedges": {},   # axes -> [(label, center, radius, theta1, theta2)]
+        "version": None,
+    }
+
+    def on_click(event):
+        # Determine which pie slice was clicked
+        for ax, chart_type in ((chart["income_axes"], "Income"),
+                               (chart["expense_axes"], "Expense")):
+            if event.inaxes is ax:
+                label = find_wedge(chart["wedges"].get(ax, []), event.xdata, event.ydata)
+                if label is not None:
+                    show_details_popup(label, chart_type)
+                break
+
+    chart["canvas"].mpl_connect("button_press_event", on_click)
+    return chart
+
+
+def find_wedge(wedges, x, y):
+    """Return the label of the (label, center, radius, theta1, theta2) wedge containing (x, y)."""
+    if x is None or y is None:
+        return None
+    for label, (center_x, center_y), radius, theta1, theta2 in wedges:
+        dx, dy = x - center_x, y - center_y
+        if dx * dx + dy * dy > radius * radius:
+            continue
+        angle = math.degrees(math.atan2(dy, dx))
+        if (angle - theta1) % 360 <= theta2 - theta1:
+            return label
+    return None
+
+
+def draw_pie(ax, amounts, labels, title, empty_text):
+    """Draw one pie into `ax` and return its wedge geometry for hit-testing."""
+    ax.clear()
+    if not amounts:
+        ax.text(0.5, 0.5, empty_text, ha="center",
+                va="center", fontsize=12, color="gray")
+        return []
+    wedges, texts, autotexts = ax.pie(
+        amounts, labels=labels, autopct="%1.1f%%", startangle=140)
+    ax.set_title(title)
+    return [(label, wedge.center, wedge.r, wedge.theta1, wedge.theta2)
+            for wedge, label in zip(wedges, labels)]
+
+
+@timed
+def draw_pie_chart(parent, result):
+    """Redraw the breakdown from a load_changed_breakdown result (None: unchanged)."""
+    global breakdown_chart
+    if breakdown_chart is None:
+        breakdown_chart = create_breakdown_chart(parent)
+    if result is None:
+        return
+    breakdown_chart["version"], breakdown = result
+    canvas_widget = breakdown_chart["canvas"].get_tk_widget()
+
+    # Split the breakdown into income and expenses
     income_categories = [item[0] for item in breakdown if item[1] > 0]
     income_amounts = [item[1] for item in breakdown if item[1] > 0]
     expense_categories = [item[0] for item in breakdown if item[1] < 0]
@@ -300,55 +446,91 @@ def generate_pie_chart(parent):
 
     # Check if there's data to display
     if not income_categories and not expense_categories:
-        tk.Label(parent, text="No data available for chart.",
-                 font=("Arial", 12), fg="darkred").pack()
+        canvas_widget.pack_forget()
+        breakdown_chart["empty_label"].pack()
         return
+    breakdown_chart["empty_label"].pack_forget()
 
-    fig = Figure(figsize=(10, 5), dpi=100)
-    ax1 = fig.add_subplot(121)  # Left pie chart for income
-    ax2 = fig.add_subplot(122)  # Right pie chart for expenses
+    income_axes = breakdown_chart["income_axes"]
+    expense_axes = breakdown_chart["expense_axes"]
+    breakdown_chart["wedges"] = {
+        income_axes: draw_pie(income_axes, income_amounts, income_categories,
+                              "Income Breakdown", "No Income Data"),
+        expense_axes: draw_pie(expense_axes, expense_amounts, expense_categories,
+                               "Expense Breakdown", "No Expense Data"),
+    }
 
-    def on_click(event, labels, ax, chart_type):
-        # Determine which pie slice was clicked
-        wedges = [w for w in ax.patches if isinstance(
-            w, matplotlib.patches.Wedge)]
-        for wedge, label in zip(wedges, labels):
-            if wedge.contains_point((event.x, event.y)):
-                show_details_popup(label, chart_type)
-                break
+    # Render the figure in the Tkinter application
+    breakdown_chart["canvas"].draw_idle()
+    if not canvas_widget.winfo_ismapped():
+        canvas_widget.pack()
 
-    # Income Pie Chart
-    if income_categories:
-        wedges1, texts1, autotexts1 = ax1.pie(
-            income_amounts, labels=income_categories, autopct="%1.1f%%", startangle=140)
-        ax1.set_title("Income Breakdown")
 
-        def income_click(event):
-            on_click(event, income_categories, ax1, "Income")
+# The trend chart is TREND_BUCKETS pixels wide (figsize 10in at 100 dpi); the
+# balance history is downsampled to about four points per pixel column.
+TREND_BUCKETS = 1000
 
-        fig.canvas.mpl_connect("button_press_event", income_click)
-    else:
-        ax1.text(0.5, 0.5, "No Income Data", ha="center",
-                 va="center", fontsize=12, color="gray")
 
-    # Expense Pie Chart
-    if expense_categories:
-        wedges2, texts2, autotexts2 = ax2.pie(
-            expense_amounts, labels=expense_categories, autopct="%1.1f%%", startangle=140)
-        ax2.set_title("Expense Breakdown")
+@timed
+def generate_trend_chart(parent):
+    """
+    Show the balance over time in `parent`. As with the breakdown, the chart
+    is only redrawn once the user's data version has moved on.
+    """
+    known_version = trend_chart["version"] if trend_chart else None
+    data_service.submit(load_changed_balance_history,
+                        (logged_in_user_id, known_version, TREND_BUCKETS),
+                        on_done=lambda result: draw_trend_chart(parent, result),
+                        on_error=show_data_error, key="trend")
 
-        def expense_click(event):
-            on_click(event, expense_categories, ax2, "Expense")
 
-        fig.canvas.mpl_connect("button_press_event", expense_click)
-    else:
-        ax2.text(0.5, 0.5, "No Expense Data", ha="center",
-                 va="center", fontsize=12, color="gray")
+def create_trend_chart(parent):
+    """Build the trend figure and canvas."""
+    Figure, FigureCanvasTkAgg = load_matplotlib()
+    fig = Figure(figsize=(10, 5), dpi=100)
+    return {
+        "figure": fig,
+        "axes": fig.add_subplot(111),
+        "canvas": FigureCanvasTkAgg(fig, master=parent),
+        "empty_label": tk.Label(parent, text="No data available for chart.",
+                                font=("Arial", 12), fg="darkred"),
+        "version": None,
+    }
+
+
+@timed
+def draw_trend_chart(parent, result):
+    """Redraw the trend from a load_changed_balance_history result (None: unchanged)."""
+    global trend_chart
+    if trend_chart is None:
+        trend_chart = create_trend_chart(parent)
+    if result is None:
+        return
+    trend_chart["version"], points = result
+    canvas_widget = trend_chart["canvas"].get_tk_widget()
+    if not points:
+        canvas_widget.pack_forget()
+        trend_chart["empty_label"].pack()
+        return
+    trend_chart["empty_label"].pack_forget()
 
-    # Render the figure in the Tkinter application
-    canvas = FigureCanvasTkAgg(fig, master=parent)
-    canvas.draw()
-    canvas.get_tk_widget().pack()
+    ax = trend_chart["axes"]
+    ax.clear()
+    ax.plot([datetime.datetime.fromisoformat(date) for date, _ in points],
+            [balance for _, balance in points], color="steelblue", linewidth=1)
+    ax.axhline(0, color="gray", linewidth=0.5)
+    ax.set_title("Balance Over Time")
+    ax.set_ylabel("Balance ($)")
+    trend_chart["figure"].autofmt_xdate()
+    trend_chart["canvas"].draw_idle()
+    if not canvas_widget.winfo_ismapped():
+        canvas_widget.pack(fill="both", expand=True)
+
+
+# The category details popup loads DETAILS_PAGE_SIZE rows at a time, in the
+# order of the column last clicked, as the user scrolls to the bottom.
+DETAILS_PAGE_SIZE = 200
+DETAILS_SORT_KEYS = {"Amount": "amount", "Description": "description", "Date": "date"}
 
 
 def show_details_popup(category, chart_type):
@@ -366,12 +548,9 @@ def show_details_popup(category, chart_type):
     # Treeview widget
     tree = ttk.Treeview(frame, columns=(
         "Amount", "Description", "Date"), show="headings", style="Custom.Treeview")
-    tree.heading("Amount", text="Amount",
-                 command=lambda: sort_tree(tree, "Amount", False))
-    tree.heading("Description", text="Description",
-                 command=lambda: sort_tree(tree, "Description", False))
-    tree.heading("Date", text="Date",
-                 command=lambda: sort_tree(tree, "Date", False))
+    for column in DETAILS_SORT_KEYS:
+        tree.heading(column, text=column,
+                     command=lambda column=column: sort_tree(details, column))
     tree.column("Amount", anchor="center", width=100)
     tree.column("Description", anchor="w", width=250)
     tree.column("Date", anchor="center", width=150)
@@ -379,22 +558,22 @@ def show_details_popup(category, chart_type):
 
     # Add a scrollbar
     scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
-    tree.configure(yscrollcommand=scrollbar.set)
     scrollbar.pack(side="right", fill="y")
 
-    # Load transactions for the selected category
-    with sqlite3.connect(DB_NAME) as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-        SELECT amount, description, date FROM transactions
-        WHERE user_id = ? AND category = ?
-        """, (logged_in_user_id, category))
-        transactions = cursor.fetchall()
-
-    # Populate the treeview
-    for amount, description, date in transactions:
-        formatted_amount = f"+${amount:,.2f}" if amount > 0 else f"-${abs(amount):,.2f}"
-        tree.insert("", "end", values=(formatted_amount, description, date))
+    # Sort order and paging state for this popup, newest first to start. The
+    # (sort key, id) of the last row shown is kept typed, so fetching the next
+    # page never re-parses the formatted cells.
+    details = {"tree": tree, "category": category, "sort": "Date", "descending": True,
+               "last_key": None, "has_more": False, "pending": False}
+
+    def on_scroll(first, last):
+        scrollbar.set(first, last)
+        if float(last) >= 1 - STATEMENT_PREFETCH_MARGIN and details["has_more"] \
+                and not details["pending"]:
+            load_details_page(details)
+
+    tree.configure(yscrollcommand=on_scroll)
+    load_details_page(details)
 
     # Close button
     close_button = tk.Button(popup, text="Close", command=popup.destroy,
@@ -402,26 +581,109 @@ def show_details_popup(category, chart_type):
     close_button.pack(pady=10)
 
 
-def sort_tree(tree, column, reverse):
+def load_details_page(details):
+    """Request the next page of a details popup in its current order."""
+    details["pending"] = True
+    data_service.submit(load_category_transactions_page, (
+        logged_in_user_id, details["category"], DETAILS_PAGE_SIZE,
+        DETAILS_SORT_KEYS[details["sort"]], details["descending"], details["last_key"]),
+        on_done=lambda rows: show_details_page(details, rows), on_error=show_data_error,
+        key=f"details-{details['tree']}")
+
+
+@timed
+def show_details_page(details, rows):
+    """Append a page of (id, amount, description, date, sort key) rows to a details popup."""
+    tree = details["tree"]
+    if not tree.winfo_exists():
+        return  # Popup closed while loading
+    details["pending"] = False
+    details["has_more"] = len(rows) == DETAILS_PAGE_SIZE
+    for transaction_id, amount, description, date, _ in rows:
+        formatted_amount = f"+${amount:,.2f}" if amount > 0 else f"-${abs(amount):,.2f}"
+        tree.insert("", "end", values=(formatted_amount, description, date))
+    if rows:
+        details["last_key"] = (rows[-1][4], rows[-1][0])
+
+
+def sort_tree(details, column):
     """
-    Sort the treeview by the specified column.
+    Sort the details popup by the specified column, reversing the order when
+    the column is already the sort column. Rows are re-read from the database
+    in the new order, one page at a time.
     """
-    data = [(tree.set(child, column), child)
-            for child in tree.get_children("")]
+    details["descending"] = column == details["sort"] and not details["descending"]
+    details["sort"] = column
+    details["last_key"] = None
+    details["tree"].delete(*details["tree"].get_children())
+    load_details_page(details)
+
+
+def show_search_popup(text):
+    """
+    Display the transactions whose description matches `text`, newest first,
+    loading more as the list is scrolled to the bottom.
+    """
+    if not text.strip():
+        return
+    popup = tk.Toplevel(root)
+    popup.title(f"Search - {text}")
+    popup.geometry("900x400")
+
+    frame = tk.Frame(popup)
+    frame.pack(fill="both", expand=True, padx=10, pady=10)
+    tree = ttk.Treeview(frame, columns=("Amount", "Description", "Category", "Date"),
+                        show="headings", style="Custom.Treeview")
+    for column, width in (("Amount", 100), ("Description", 250),
+                          ("Category", 150), ("Date", 150)):
+        tree.heading(column, text=column)
+        tree.column(column, anchor="w" if column == "Description" else "center", width=width)
+    tree.tag_configure("green", foreground="green")
+    tree.tag_configure("red", foreground="red")
+    tree.pack(fill="both", expand=True, side="left")
+    scrollbar = ttk.Scrollbar(frame, orient="vertical", command=tree.yview)
+    scrollbar.pack(side="right", fill="y")
+
+    search = {"tree": tree, "text": text, "last_key": None, "has_more": False,
+              "pending": False}
+
+    def on_scroll(first, last):
+        scrollbar.set(first, last)
+        if float(last) >= 1 - STATEMENT_PREFETCH_MARGIN and search["has_more"] \
+                and not search["pending"]:
+            load_search_page(search)
+
+    tree.configure(yscrollcommand=on_scroll)
+    load_search_page(search)
+
+    tk.Button(popup, text="Close", command=popup.destroy,
+              bg="darkred", fg="white", font=custom_font).pack(pady=10)
 
-    # Sort data based on the column type (numbers vs text)
-    if column == "Amount":
-        data.sort(key=lambda t: float(t[0].replace("$", "").replace(
-            ",", "").replace("+", "").replace("-", "")), reverse=reverse)
-    else:
-        data.sort(key=lambda t: t[0], reverse=reverse)
 
-    # Rearrange items in sorted order
-    for index, (value, child) in enumerate(data):
-        tree.move(child, "", index)
+def load_search_page(search):
+    """Request the next page of a search popup."""
+    search["pending"] = True
+    data_service.submit(search_transactions, (
+        logged_in_user_id, search["text"], DETAILS_PAGE_SIZE, search["last_key"]),
+        on_done=lambda rows: show_search_page(search, rows), on_error=show_data_error,
+        key=f"search-{search['tree']}")
 
-    # Reverse the sort order for the next click
-    tree.heading(column, command=lambda: sort_tree(tree, column, not reverse))
+
+@timed
+def show_search_page(search, rows):
+    """Append a page of (id, amount, description, category, date) rows to a search popup."""
+    tree = search["tree"]
+    if not tree.winfo_exists():
+        return  # Popup closed while loading
+    search["pending"] = False
+    search["has_more"] = len(rows) == DETAILS_PAGE_SIZE
+    for transaction_id, amount, description, category, date in rows:
+        values, tags = format_statement_row(amount, description, category, date)
+        tree.insert("", "end", values=values, tags=tags)
+    if rows:
+        search["last_key"] = (rows[-1][4], rows[-1][0])
+    elif search["last_key"] is None:
+        tree.insert("", "end", values=("", "No matching transactions.", "", ""))
 
 
 def add_income():
@@ -431,8 +693,12 @@ def add_income():
         category = ", ".join(
             [cat for cat, var in income_categories.items() if var.get()])
         if amount > 0 and description and category:
-            add_transaction(logged_in_user_id, amount, description, category)
-            update_statement()
+            date = format_transaction_date()
+            data_service.submit(
+                add_transaction, (logged_in_user_id, amount, description, category, date),
+                on_done=in_session(lambda transaction_id: add_statement_row(
+                    transaction_id, amount, description, category, date)),
+                on_error=show_data_error)
             income_amount_var.set("")
             income_description_var.set("")
             for var in income_categories.values():
@@ -450,8 +716,12 @@ def add_expense():
         category = ", ".join(
             [cat for cat, var in expense_categories.items() if var.get()])
         if amount > 0 and description and category:
-            add_transaction(logged_in_user_id, -amount, description, category)
-            update_statement()
+            date = format_transaction_date()
+            data_service.submit(
+                add_transaction, (logged_in_user_id, -amount, description, category, date),
+                on_done=in_session(lambda transaction_id: add_statement_row(
+                    transaction_id, -amount, description, category, date)),
+                on_error=show_data_error)
             expense_amount_var.set("")
             expense_description_var.set("")
             for var in expense_categories.values():
@@ -483,13 +753,19 @@ def show_login_screen():
               bg="blue", fg="white", width=15).pack(pady=10)
     tk.Button(frame, text="Register", command=register,
               font=custom_font, bg="green", fg="white", width=15).pack()
+    tk.Label(frame, textvariable=loading_var, font=custom_font,
+             fg="gray").pack(pady=5)
 
 
 def login():
-    global logged_in_user_id
     username = username_var.get()
     password = password_var.get()
-    user_id = verify_user(username, password)
+    data_service.submit(verify_user, (username, password),
+                        on_done=on_login_checked, on_error=show_data_error, key="login")
+
+
+def on_login_checked(user_id):
+    global logged_in_user_id
     if user_id:
         logged_in_user_id = user_id
         show_main_screen()
@@ -500,43 +776,111 @@ def login():
 def register():
     username = username_var.get()
     password = password_var.get()
-    if create_user(username, password):
+    data_service.submit(create_user, (username, password),
+                        on_done=on_user_created, on_error=show_data_error)
+
+
+def on_user_created(created):
+    if created:
         messagebox.showinfo("Success", "Account created successfully!")
         show_login_screen()
     else:
         messagebox.showerror("Error", "Username already exists.")
 
 
-# Initialize database and GUI
-initialize_db()
-
-root = tk.Tk()
-root.title("Personal Finance Manager")
-root.geometry("1000x600")
-
-# Set custom style for notebooks
-style = ttk.Style()
-style.configure("CustomNotebook.TNotebook.Tab",
-                font=("Arial", 12), padding=[10, 5])
-style.configure("Custom.Treeview", font=("Arial", 12))
-style.configure("Custom.Treeview.Heading", font=("Arial", 12, "bold"))
-custom_font = ("Arial", 12)
-
-username_var = tk.StringVar()
-password_var = tk.StringVar()
-total_balance_var = tk.StringVar(value="Total Balance: $0.00")
-income_amount_var = tk.StringVar()
-income_description_var = tk.StringVar()
-income_categories = {"Pay": tk.BooleanVar(), "Other": tk.BooleanVar(
-), "Bonus": tk.BooleanVar(), "Investment": tk.BooleanVar()}
-expense_amount_var = tk.StringVar()
-expense_description_var = tk.StringVar()
-expense_categories = {"Bills": tk.BooleanVar(), "Subscriptions": tk.BooleanVar(
-), "Groceries": tk.BooleanVar(), "Entertainment": tk.BooleanVar(), "Travel": tk.BooleanVar()}
+def show_data_error(error):
+    messagebox.showerror("Error", f"Database error: {error}")
 
-logged_in_user_id = None
 
+# How often the Tk thread collects results from the data service, in ms
+DATA_POLL_INTERVAL = 30
 
-if __name__ == "__main__":
+
+def poll_data_service():
+    """Deliver background results and keep the loading indicator current."""
+    try:
+        data_service.poll()
+    finally:
+        # A failing callback is reported by Tk; polling must go on regardless
+        loading_var.set("Loading..." if data_service.outstanding else "")
+        root.after(DATA_POLL_INTERVAL, poll_data_service)
+
+
+def in_session(callback):
+    """Wrap a data-service callback so it is dropped if the user logs out first."""
+    session = login_session
+
+    def deliver(result):
+        if login_session == session:
+            callback(result)
+    return deliver
+
+
+# Tk state, created by main(); the GUI functions above use these globals.
+root = None
+data_service = None
+logged_in_user_id = None
+# Bumped by logout() so in_session callbacks from before it are dropped
+login_session = 0
+
+# (date, id) keys of the rows currently in the statement, top to bottom
+statement_keys = []
+statement_has_older = False
+statement_has_newer = False
+statement_fetch_pending = False
+# Balance shown above the statement, adjusted in place as rows are added/removed
+statement_balance = 0
+# Breakdown figure, canvas and cached wedge geometry; built on first use per login
+breakdown_chart = None
+# Trend figure and canvas, likewise
+trend_chart = None
+
+
+def main():
+    """Initialize the database and run the GUI."""
+    global root, style, custom_font, data_service
+    global username_var, password_var, total_balance_var, loading_var, search_var
+    global income_amount_var, income_description_var, income_categories
+    global expense_amount_var, expense_description_var, expense_categories
+    # PFA_PROFILE=file.json records query and refresh timings for this session.
+    profile_path = os.environ.get("PFA_PROFILE")
+    if profile_path:
+        enable_profiling()
+    initialize_db()
+
+    root = tk.Tk()
+    root.title("Personal Finance Manager")
+    root.geometry("1000x600")
+
+    # Set custom style for notebooks
+    style = ttk.Style()
+    style.configure("CustomNotebook.TNotebook.Tab",
+                    font=("Arial", 12), padding=[10, 5])
+    style.configure("Custom.Treeview", font=("Arial", 12))
+    style.configure("Custom.Treeview.Heading", font=("Arial", 12, "bold"))
+    custom_font = ("Arial", 12)
+
+    username_var = tk.StringVar()
+    password_var = tk.StringVar()
+    total_balance_var = tk.StringVar(value="Total Balance: $0.00")
+    loading_var = tk.StringVar()
+    search_var = tk.StringVar()
+    income_amount_var = tk.StringVar()
+    income_description_var = tk.StringVar()
+    income_categories = {"Pay": tk.BooleanVar(), "Other": tk.BooleanVar(
+    ), "Bonus": tk.BooleanVar(), "Investment": tk.BooleanVar()}
+    expense_amount_var = tk.StringVar()
+    expense_description_var = tk.StringVar()
+    expense_categories = {"Bills": tk.BooleanVar(), "Subscriptions": tk.BooleanVar(
+    ), "Groceries": tk.BooleanVar(), "Entertainment": tk.BooleanVar(), "Travel": tk.BooleanVar()}
+
+    data_service = DataService()
     show_login_screen()
+    poll_data_service()
     root.mainloop()
+    if profile_path:
+        export_profile(profile_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+# FileName: __init__.py
+# Description: Headless data layer for the Personal Finance Manager.
+#   Importing this package has no GUI side effects and does not touch the
+#   database until a function is called.
+
+from .archive import archive_transactions
+from .backup import BackupError, create_snapshot, list_snapshots
+from .cache import clear_read_cache, read_cache_stats
+from .database import (
+    SCHEMA_VERSION, archive_path, check_aggregates, close_connections, get_connection,
+    initialize_db, rebuild_aggregates
+)
+from .data import (
+    add_transaction, add_transactions_bulk, calculate_total_balance, create_user,
+    delete_transactions, format_transaction_date, get_data_version, hash_password,
+    iter_transactions, load_balance_history, load_category_breakdown,
+    load_changed_balance_history, load_changed_breakdown, load_category_transactions,
+    load_category_transactions_page, load_monthly_totals, load_statement, load_transactions,
+    load_transactions_page, search_transactions, to_timestamp, verify_user
+)
+from .exporters import export_transactions_file
+from .importers import import_transactions_file
+from .profiling import (
+    disable_profiling, enable_profiling, export_profile, profile_report, reset_profile, timed
+)
+from .service import DataService
@@ -0,0 +1,200 @@
+# FileName: __main__.py
+# Description: Command-line maintenance for the finance database.
+#   Usage: python -m src.finance [--db FILE] <command> ...
+
+import argparse
+import getpass
+import sqlite3
+import sys
+import time
+
+from . import database, profiling
+from .archive import archive_transactions
+from .backup import (
+    BACKUP_PAGES_PER_STEP, BACKUP_STEP_SLEEP_SECONDS, BackupError, create_snapshot
+)
+from .data import verify_user
+from .database import check_aggregates, initialize_db, rebuild_aggregates
+from .exporters import EXPORT_FORMATS, export_transactions_file
+from .importers import import_transactions_file
+from .server import DEFAULT_WORKERS, serve
+
+
+def login(username):
+    user_id = verify_user(username, getpass.getpass(f"Password for {username}: "))
+    if user_id is None:
+        sys.exit("Invalid username or password.")
+    return user_id
+
+
+def run_import(args):
+    result = import_transactions_file(login(args.username), args.file, args.format)
+    print(f"Imported {result['rows']:,} transactions in {result['seconds']:.2f}s "
+          f"({result['rows_per_second']:,.0f} rows/s)")
+
+
+def run_export(args):
+    result = export_transactions_file(login(args.username), args.file, args.format,
+                                      args.start, args.end, args.category)
+    print(f"Exported {result['rows']:,} transactions ({result['bytes']:,} bytes) in "
+          f"{result['seconds']:.2f}s ({result['rows_per_second']:,.0f} rows/s)")
+
+
+def run_check_aggregates(args):
+    mismatches = check_aggregates()
+    for table, count in mismatches.items():
+        print(f"{table}: {'ok' if count == 0 else f'{count} rows differ'}")
+    if any(mismatches.values()):
+        if not args.rebuild:
+            sys.exit("Aggregates are inconsistent; rerun with --rebuild to repair.")
+        rebuild_aggregates()
+        print("Aggregates rebuilt.")
+
+
+def run_archive(args):
+    result = archive_transactions(args.before)
+    if not result["rows"]:
+        print(f"Nothing left to archive before {args.before}.")
+        return
+    for year in result["years"]:
+        print(f"{year}: {database.archive_path(year)}")
+    print(f"Archived {result['rows']:,} transactions in {result['seconds']:.2f}s")
+
+
+def run_reports(args):
+    from .reports import generate_reports  # Imports Matplotlib; only needed here
+    result = generate_reports(args.output_dir, args.format, args.start, args.end,
+                              args.workers, args.username)
+    for username, error in result["failed"].items():
+        print(f"{username}: {error}", file=sys.stderr)
+    print(f"Wrote {result['reports']:,} reports to {args.output_dir} in "
+          f"{result['seconds']:.2f}s ({result['reports_per_second']:,.1f} reports/s)")
+    if result["failed"]:
+        sys.exit(f"{len(result['failed']):,} reports failed.")
+
+
+def run_backup(args):
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                result = create_snapshot(args.directory, args.keep, args.pages,
+                                         args.sleep / 1000)
+            except (BackupError, sqlite3.OperationalError, OSError) as error:
+                if args.every is None:
+                    sys.exit(f"Backup failed: {error}")
+                # A locked database, a full disk or a bad copy must not end the schedule
+                print(f"Backup failed: {error}", file=sys.stderr)
+            else:
+                print(f"{result['path']}: {result['bytes'] / 1e6:,.1f} MB in "
+                      f"{result['seconds']:.2f}s ({result['mb_per_second']:,.1f} MB/s), "
+                      f"integrity ok; longest lock {result['longest_step_seconds'] * 1000:.1f} ms, "
+                      f"{result['restarts']} restarts")
+                for name in result["removed"]:
+                    print(f"Removed {name}")
+                if args.every is None:
+                    return
+            time.sleep(max(0.0, args.every * 60 - (time.perf_counter() - started)))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_serve(args):
+    serve(args.host, args.port, args.workers)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.finance",
+                                     description="Personal Finance Manager data tools.")
+    parser.add_argument("--db", default=database.DB_NAME,
+                        help="database file (default: %(default)s)")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="time every query and data function, and write the results "
+                             "to FILE as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("import", help="import a CSV or OFX/QFX bank export")
+    command.add_argument("file")
+    command.add_argument("--username", required=True)
+    command.add_argument("--format", choices=("csv", "ofx", "qfx"),
+                         help="file format (default: from the file extension)")
+    command.set_defaults(handler=run_import)
+
+    command = commands.add_parser("export",
+                                  help="write a user's transactions to CSV or JSON Lines")
+    command.add_argument("file")
+    command.add_argument("--username", required=True)
+    command.add_argument("--format", choices=EXPORT_FORMATS,
+                         help="file format (default: from the file extension)")
+    command.add_argument("--start", metavar="DATE",
+                         help="only transactions dated on or after DATE (YYYY-MM-DD)")
+    command.add_argument("--end", metavar="DATE",
+                         help="only transactions dated before DATE (YYYY-MM-DD)")
+    command.add_argument("--category", help="only transactions filed under this category")
+    command.set_defaults(handler=run_export)
+
+    command = commands.add_parser("check-aggregates",
+                                  help="verify the balance and category summary tables")
+    command.add_argument("--rebuild", action="store_true",
+                         help="recompute the summary tables if they are inconsistent")
+    command.set_defaults(handler=run_check_aggregates)
+
+    command = commands.add_parser("archive",
+                                  help="move old transactions into per-year archive files")
+    command.add_argument("--before", required=True, metavar="DATE",
+                         help="archive every transaction dated before DATE (YYYY-MM-DD)")
+    command.set_defaults(handler=run_archive)
+
+    command = commands.add_parser("backup",
+                                  help="snapshot the database while it is in use")
+    command.add_argument("directory", help="where snapshots are kept")
+    command.add_argument("--every", type=float, metavar="MINUTES",
+                         help="keep taking a snapshot every MINUTES until interrupted")
+    command.add_argument("--keep", type=int, metavar="N",
+                         help="delete all but the N newest snapshots after each one")
+    command.add_argument("--pages", type=int, default=BACKUP_PAGES_PER_STEP,
+                         help="pages copied per step (default: %(default)s)")
+    command.add_argument("--sleep", type=float, default=BACKUP_STEP_SLEEP_SECONDS * 1000,
+                         metavar="MS", help="pause between steps (default: %(default)s)")
+    command.set_defaults(handler=run_backup)
+
+    command = commands.add_parser("reports",
+                                  help="render every user's statement to PNG or PDF files")
+    command.add_argument("output_dir")
+    command.add_argument("--format", choices=("png", "pdf"), default="png",
+                         help="(default: %(default)s)")
+    command.add_argument("--start", metavar="DATE",
+                         help="only transactions dated on or after DATE (YYYY-MM-DD)")
+    command.add_argument("--end", metavar="DATE",
+                         help="only transactions dated before DATE (YYYY-MM-DD)")
+    command.add_argument("--workers", type=int,
+                         help="rendering processes (default: one per CPU core)")
+    command.add_argument("--username", action="append",
+                         help="only this user's report; may be repeated")
+    command.set_defaults(handler=run_reports)
+
+    command = commands.add_parser("serve", help="serve the data layer as a local JSON API")
+    command.add_argument("--host", default="127.0.0.1", help="(default: %(default)s)")
+    command.add_argument("--port", type=int, default=8080, help="(default: %(default)s)")
+    command.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                         help="threads running database calls (default: %(default)s)")
+    command.set_defaults(handler=run_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    database.DB_NAME = args.db
+    if args.profile:
+        profiling.enable_profiling()
+    try:
+        initialize_db()
+        args.handler(args)
+    finally:
+        if args.profile:
+            profiling.disable_profiling()
+            profiling.export_profile(args.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+# FileName: archive.py
+# Description: Moves old transactions out of the main database into per-year files.
+
+import calendar
+import time
+
+from .data import to_timestamp
+from .database import (
+    AGGREGATE_COLUMNS, AGGREGATE_KEYS, AGGREGATE_TABLES, LIVE_AGGREGATE_SQL,
+    attach_archive, get_connection
+)
+from .profiling import timed
+
+# The transactions of one year that archive_transactions moves, on alias t;
+# parameters are the start and end of the range.
+_ARCHIVED_ROWS = """
+t.user_id IN (SELECT id FROM users) AND t.timestamp >= ? AND t.timestamp < ?
+"""
+
+
+def _roll_up_sql(table, schema):
+    """Add the archived rows' share of `table` to its archived_ counterpart."""
+    keys = AGGREGATE_KEYS[table].split(", ")
+    totals = ", ".join(f"{column} = {column} + excluded.{column}"
+                       for column in AGGREGATE_COLUMNS[table].split(", ")
+                       if column not in keys)
+    where = f"WHERE {_ARCHIVED_ROWS} AND t.id IN (SELECT id FROM {schema}.transactions)"
+    return f"""
+    INSERT INTO archived_{table} ({AGGREGATE_COLUMNS[table]})
+    SELECT * FROM ({LIVE_AGGREGATE_SQL[table].format(where=where)}) WHERE true
+    ON CONFLICT ({AGGREGATE_KEYS[table]}) DO UPDATE SET {totals}
+    """
+
+
+def _archive_year(conn, year, start, end):
+    """Move the transactions with start <= timestamp < end into year's archive file."""
+    schema = attach_archive(conn, year)
+    # The copy and the delete are separate transactions: a commit spanning
+    # attached databases is not atomic in WAL mode. Copies replace by id, so
+    # rerunning after an interruption between the two is harmless.
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(f"""
+        INSERT OR REPLACE INTO {schema}.transactions
+            (id, user_id, amount, description, category, date, timestamp)
+        SELECT id, user_id, amount, description, category, date, timestamp
+        FROM main.transactions t WHERE {_ARCHIVED_ROWS}
+        """, (start, end))
+        conn.execute(f"""
+        INSERT OR REPLACE INTO {schema}.transaction_categories
+            (transaction_id, category_id, user_id)
+        SELECT tc.transaction_id, tc.category_id, tc.user_id
+        FROM main.transactions t
+        JOIN main.transaction_categories tc ON tc.transaction_id = t.id
+        WHERE {_ARCHIVED_ROWS}
+        """, (start, end))
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in AGGREGATE_TABLES:
+            conn.execute(_roll_up_sql(table, schema), (start, end))
+        # The totals are unchanged, but the statements are not.
+        conn.execute(f"""
+        UPDATE user_balances SET version = version + 1
+        WHERE user_id IN (SELECT DISTINCT t.user_id FROM main.transactions t
+                          WHERE {_ARCHIVED_ROWS})
+        """, (start, end))
+        conn.execute("INSERT INTO archiving (year) VALUES (?)", (year,))
+        moved = conn.execute(f"""
+        DELETE FROM main.transactions AS t
+        WHERE {_ARCHIVED_ROWS} AND t.id IN (SELECT id FROM {schema}.transactions)
+        """, (start, end)).rowcount
+        conn.execute("DELETE FROM archiving")
+        conn.execute("""
+        INSERT INTO archives (year, transaction_count) VALUES (?, ?)
+        ON CONFLICT (year) DO UPDATE SET
+            transaction_count = transaction_count + excluded.transaction_count
+        """, (year, moved))
+    return moved
+
+
+@timed
+def archive_transactions(before):
+    """
+    Move every transaction dated before `before` into one archive file per
+    calendar year (database.archive_path), attached to a connection only
+    when a query needs one of those years.
+
+    The balance, category and monthly totals are unchanged: the moved rows
+    stay counted through the archived_* roll-ups. Date-range queries read
+    the archive files they overlap, and the category drill-down reads them
+    all; only the statement pages (load_transactions_page) and description
+    search (search_transactions) cover the main database alone.
+    Returns {"rows", "years", "seconds"}.
+    """
+    started = time.perf_counter()
+    cutoff = to_timestamp(before)
+    conn = get_connection()
+    # One index lookup per user rather than a scan of the whole table.
+    oldest = conn.execute("""
+    SELECT MIN((SELECT MIN(timestamp) FROM transactions WHERE user_id = users.id))
+    FROM users
+    """).fetchone()[0]
+    rows, years = 0, []
+    if oldest is not None and oldest < cutoff:
+        for year in range(time.gmtime(oldest).tm_year, time.gmtime(cutoff - 1).tm_year + 1):
+            start = calendar.timegm((year, 1, 1, 0, 0, 0))
+            end = min(calendar.timegm((year + 1, 1, 1, 0, 0, 0)), cutoff)
+            if conn.execute(f"SELECT 1 FROM transactions t WHERE {_ARCHIVED_ROWS} LIMIT 1",
+                            (start, end)).fetchone():
+                rows += _archive_year(conn, year, start, end)
+                years.append(year)
+    return {"rows": rows, "years": years, "seconds": time.perf_counter() - started}
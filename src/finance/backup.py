@@ -0,0 +1,209 @@
+# FileName: backup.py
+# Description: Online snapshots of the database and its archive files, with retention.
+#   Usage: python -m src.finance [--db FILE] backup DIR [--every MINUTES] [--keep N]
+
+import datetime
+import os
+import shutil
+import sqlite3
+import time
+import urllib.parse
+
+from . import database
+from .profiling import timed
+
+# Pages copied per backup step (4 MB at SQLite's default 4 KiB page size),
+# and the pause after each one, during which the source is not locked at all.
+BACKUP_PAGES_PER_STEP = 1024
+BACKUP_STEP_SLEEP_SECONDS = 0.005
+# A backup restarts from the first page whenever another connection writes to
+# the source. After this many restarts the rest is copied in a single step.
+MAX_BACKUP_RESTARTS = 3
+SNAPSHOT_PREFIX = "snapshot-"
+# UTC, to the microsecond, so names sort in the order they were taken.
+SNAPSHOT_TIME_FORMAT = "%Y%m%dT%H%M%S.%fZ"
+PARTIAL_SUFFIX = ".partial"
+
+
+class BackupError(Exception):
+    """A snapshot could not be completed or failed its integrity check."""
+
+
+class _RestartLimit(Exception):
+    pass
+
+
+def backup_file(source_path, target_path, pages=BACKUP_PAGES_PER_STEP,
+                sleep=BACKUP_STEP_SLEEP_SECONDS):
+    """
+    Copy the SQLite database at source_path to target_path while it stays in use.
+
+    Pages are copied `pages` at a time with Connection.backup, sleeping
+    `sleep` seconds between steps. Each step reads the source in its own
+    short read transaction: in WAL mode that never blocks writers, and with a
+    rollback journal a writer waits at most one step. The copy is a single
+    file in rollback-journal mode. Returns a dict with bytes, steps,
+    restarts, seconds and longest_step_seconds.
+    """
+    stats = {"steps": 0, "restarts": 0, "longest_step_seconds": 0.0}
+    started = time.perf_counter()
+    # Own connections, not the pool's: the copy must not hold up this thread's queries.
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        for step_pages in (pages, -1):
+            remaining = None
+            step_started = time.perf_counter()
+
+            def progress(status, left, total):
+                nonlocal remaining, step_started
+                stats["steps"] += 1
+                stats["longest_step_seconds"] = max(stats["longest_step_seconds"],
+                                                    time.perf_counter() - step_started)
+                if remaining is not None and left >= remaining:
+                    stats["restarts"] += 1
+                    if step_pages > 0 and stats["restarts"] >= MAX_BACKUP_RESTARTS:
+                        raise _RestartLimit
+                remaining = left
+                if left:
+                    time.sleep(sleep)
+                step_started = time.perf_counter()
+            try:
+                source.backup(target, pages=step_pages, progress=progress)
+                break
+            except _RestartLimit:
+                continue
+        target.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        source.close()
+        target.close()
+    stats["bytes"] = os.path.getsize(target_path)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def check_integrity(path):
+    """Return the problems PRAGMA integrity_check finds in the database at path, or []."""
+    conn = sqlite3.connect(f"file:{urllib.parse.quote(path)}?mode=ro", uri=True)
+    try:
+        problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+    return [] if problems == ["ok"] else problems
+
+
+def _drop_unfinished_moves(archive_file, main_file):
+    """
+    Delete from a copied archive the rows the copied main database still
+    holds. archive_transactions copies a year's rows and then deletes them
+    from the main database in a second transaction; a snapshot taken between
+    the two would otherwise hold them twice.
+    """
+    conn = sqlite3.connect(archive_file)
+    try:
+        conn.execute("ATTACH DATABASE ? AS snapshot", (main_file,))
+        with conn:
+            conn.execute("""
+            DELETE FROM main.transaction_categories
+            WHERE transaction_id IN (SELECT id FROM snapshot.transactions)
+            """)
+            conn.execute("""
+            DELETE FROM main.transactions WHERE id IN (SELECT id FROM snapshot.transactions)
+            """)
+    finally:
+        conn.close()
+
+
+def list_snapshots(backup_dir):
+    """Names of the completed snapshots in backup_dir, oldest first."""
+    if not os.path.isdir(backup_dir):
+        return []
+    return sorted(name for name in os.listdir(backup_dir)
+                  if name.startswith(SNAPSHOT_PREFIX) and not name.endswith(PARTIAL_SUFFIX))
+
+
+def remove_partial_snapshots(backup_dir):
+    """Delete the .partial directories of interrupted snapshots; returns their names."""
+    if not os.path.isdir(backup_dir):
+        return []
+    removed = sorted(name for name in os.listdir(backup_dir)
+                     if name.startswith(SNAPSHOT_PREFIX) and name.endswith(PARTIAL_SUFFIX))
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name), ignore_errors=True)
+    return removed
+
+
+def prune_snapshots(backup_dir, keep):
+    """Delete all but the `keep` newest snapshots; returns the names removed."""
+    removed = list_snapshots(backup_dir)[:-keep] if keep > 0 else list_snapshots(backup_dir)
+    for name in removed:
+        shutil.rmtree(os.path.join(backup_dir, name))
+    return removed
+
+
+@timed
+def create_snapshot(backup_dir, keep=None, pages=BACKUP_PAGES_PER_STEP,
+                    sleep=BACKUP_STEP_SLEEP_SECONDS):
+    """
+    Copy DB_NAME and its archive files (see backup_file) into a new
+    snapshot directory in backup_dir while the database stays in use, then
+    verify every copy with an integrity check.
+
+    The snapshot is written under a .partial name and only renamed to
+    snapshot-<UTC time> once it has passed the check, so a listed snapshot
+    is always complete; one that fails is deleted and BackupError raised.
+    Its files keep their names, so restoring is copying them back. With
+    `keep`, older snapshots beyond the newest `keep` are then removed.
+    .partial directories left by runs that were killed before they could
+    clean up are deleted first, so only one backup may write to backup_dir
+    at a time.
+
+    Returns a dict with path, bytes, seconds (in all), mb_per_second (of
+    the copying alone), restarts,
+    longest_step_seconds (the longest the source was read-locked at once)
+    and removed (the names of the pruned snapshots and of the deleted
+    .partial directories).
+    """
+    if keep is not None and keep < 1:
+        raise ValueError("keep must be at least 1")
+    started = time.perf_counter()
+    abandoned = remove_partial_snapshots(backup_dir)
+    name = SNAPSHOT_PREFIX + datetime.datetime.now(datetime.timezone.utc).strftime(
+        SNAPSHOT_TIME_FORMAT)
+    path = os.path.join(backup_dir, name)
+    partial = path + PARTIAL_SUFFIX
+    os.makedirs(partial)
+    try:
+        main_file = os.path.join(partial, os.path.basename(database.DB_NAME))
+        copies = [backup_file(database.DB_NAME, main_file, pages, sleep)]
+        # The archives to copy are those the copied main database lists;
+        # they are copied after it, so they hold every row it has moved out.
+        conn = sqlite3.connect(main_file)
+        try:
+            years = [row[0] for row in conn.execute("SELECT year FROM archives ORDER BY year")]
+        finally:
+            conn.close()
+        for year in years:
+            archive_file = os.path.join(partial, os.path.basename(database.archive_path(year)))
+            copies.append(backup_file(database.archive_path(year), archive_file, pages, sleep))
+            _drop_unfinished_moves(archive_file, main_file)
+
+        for file_name in sorted(os.listdir(partial)):
+            problems = check_integrity(os.path.join(partial, file_name))
+            if problems:
+                raise BackupError(f"{file_name} failed its integrity check: "
+                                  f"{'; '.join(problems[:5])}")
+        os.rename(partial, path)
+    except BaseException:
+        shutil.rmtree(partial, ignore_errors=True)
+        raise
+    removed = abandoned + (prune_snapshots(backup_dir, keep) if keep is not None else [])
+
+    seconds = time.perf_counter() - started
+    size = sum(copy["bytes"] for copy in copies)
+    copying = sum(copy["seconds"] for copy in copies)
+    return {"path": path, "bytes": size, "seconds": seconds,
+            "mb_per_second": size / 1e6 / copying if copying else 0.0,
+            "restarts": sum(copy["restarts"] for copy in copies),
+            "longest_step_seconds": max(copy["longest_step_seconds"] for copy in copies),
+            "removed": removed}
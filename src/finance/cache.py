@@ -0,0 +1,127 @@
+# FileName: cache.py
+# Description: In-process LRU cache of query results, invalidated by the per-user data version.
+
+import collections
+import functools
+import inspect
+import threading
+
+# Bounds of the shared read cache: entries kept, and rows held by all of
+# them together (a result counts one row per list item, a scalar one).
+READ_CACHE_MAX_ENTRIES = 256
+READ_CACHE_MAX_ROWS = 200_000
+
+
+def _size(value):
+    return len(value) if isinstance(value, (list, tuple)) else 1
+
+
+class VersionedCache:
+    """
+    Least-recently-used cache whose entries are valid for one data version.
+
+    Each entry is stored with the version of the user's data it was read
+    at; a lookup with any other version is a miss and drops the entry, so
+    nothing is served once the user's transactions have changed. Memory is
+    bounded by both the entry count and the total rows held. Thread-safe.
+    """
+
+    def __init__(self, max_entries=READ_CACHE_MAX_ENTRIES, max_rows=READ_CACHE_MAX_ROWS):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._entries = collections.OrderedDict()  # key -> (version, value, rows)
+        self._rows = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "evictions": 0}
+
+    def get(self, key, version):
+        """Return (True, value) if key was cached at `version`, else (False, None)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return True, entry[1]
+            if entry is not None:
+                self._remove(key)
+                self._stats["invalidations"] += 1
+            self._stats["misses"] += 1
+            return False, None
+
+    def put(self, key, version, value):
+        rows = _size(value)
+        if rows > self.max_rows:  # Would evict everything else; not worth keeping
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, value, rows)
+            self._rows += rows
+            while len(self._entries) > self.max_entries or self._rows > self.max_rows:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        self._rows -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self):
+        """Return hit/miss/invalidation/eviction counts and the current size."""
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {**self._stats, "entries": len(self._entries), "rows": self._rows,
+                    "hit_rate": self._stats["hits"] / lookups if lookups else 0.0}
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+read_cache = VersionedCache()
+
+
+def versioned(version_of, key_prefix=lambda: None):
+    """
+    Decorator caching a per-user read function in read_cache.
+
+    The function must take the user id as its first argument and return a
+    value that depends only on its arguments and that user's data. Every
+    call first reads version_of(user_id), a cheap primary-key lookup, and
+    reuses the cached result if the data is still at that version. Lists are
+    cached as tuples and handed out as fresh lists, so callers may modify
+    what they get back. key_prefix() is added to every key, to keep results
+    from different databases apart.
+    """
+    def decorate(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple(bound.arguments.values())
+            version = version_of(arguments[0])
+            key = (key_prefix(), func.__qualname__, arguments)
+            found, value = read_cache.get(key, version)
+            if not found:
+                value = func(*args, **kwargs)
+                read_cache.put(key, version, tuple(value) if isinstance(value, list) else value)
+                return value
+            return list(value) if isinstance(value, tuple) else value
+        return wrapper
+    return decorate
+
+
+def read_cache_stats():
+    """Return read_cache's statistics (see VersionedCache.stats)."""
+    return read_cache.stats()
+
+
+def clear_read_cache():
+    """Drop every cached result; statistics are kept."""
+    read_cache.clear()
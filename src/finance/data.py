@@ -0,0 +1,787 @@
+# FileName: data.py
+# Description: Users, transactions and the per-user queries behind each screen.
+
+import calendar
+import datetime
+import hashlib
+import heapq
+import itertools
+import re
+import sqlite3
+
+from . import database
+from .cache import versioned
+from .database import (
+    AGGREGATE_COLUMNS, AGGREGATE_KEYS, AGGREGATE_TABLES, LIVE_AGGREGATE_SQL, TIMESTAMP_SQL,
+    archive_schemas, get_connection
+)
+from .profiling import timed
+
+# Hash a password
+
+
+def hash_password(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+# Add a new user to the database
+
+
+@timed
+def create_user(username, password):
+    try:
+        hashed_password = hash_password(password)
+        with get_connection() as conn:
+            conn.execute(
+                "INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+# Verify user credentials
+
+
+@timed
+def verify_user(username, password):
+    hashed_password = hash_password(password)
+    cursor = get_connection().execute(
+        "SELECT id FROM users WHERE username = ? AND password = ?", (username, hashed_password))
+    result = cursor.fetchone()
+    if result:
+        return result[0]  # Return user ID
+    return None
+
+# Add a transaction to the database
+
+INSERT_TRANSACTION_SQL = f"""
+INSERT INTO transactions (user_id, amount, description, category, date, timestamp)
+VALUES (?1, ?2, ?3, ?4, ?5, {TIMESTAMP_SQL.format(date="?5")})
+"""
+# Rows handed to executemany at a time by add_transactions_bulk.
+BULK_BATCH_SIZE = 10000
+
+
+def format_transaction_date(date=None):
+    """
+    Return the stored ISO-8601 form of a date, datetime or ISO string (default: now).
+
+    Raises ValueError for text that is not an ISO-8601 date, which would
+    otherwise be stored without a timestamp and missed by every date range.
+    Dates are stored as naive UTC, the way the timestamp column reads them:
+    times with a UTC offset are converted, and the default is the current
+    UTC time, so a moment is filed under the same month however it was
+    entered. Naive times are taken to be UTC already.
+    """
+    if date is None:
+        return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None).isoformat()
+    if isinstance(date, str):
+        try:
+            date = datetime.datetime.fromisoformat(date)
+        except ValueError:
+            raise ValueError(f"Not an ISO-8601 date: {date!r}") from None
+    if isinstance(date, datetime.datetime):
+        if date.tzinfo is not None:
+            date = date.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return date.isoformat()
+    if isinstance(date, datetime.date):
+        return datetime.datetime.combine(date, datetime.time()).isoformat()
+    raise ValueError(f"Not a date: {date!r}")
+
+
+def to_timestamp(value):
+    """
+    Return the transactions.timestamp form (integer seconds since 1970-01-01)
+    of a date, datetime, ISO-8601 string or number. Naive times count as UTC,
+    exactly as the timestamp column is computed.
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple())
+    return calendar.timegm(value.timetuple())
+
+
+def _date_range_sql(start, end, column="timestamp"):
+    """SQL conditions and parameters for start <= date < end; either bound may be None."""
+    conditions, parameters = "", []
+    if start is not None:
+        conditions += f" AND {column} >= ?"
+        parameters.append(to_timestamp(start))
+    if end is not None:
+        conditions += f" AND {column} < ?"
+        parameters.append(to_timestamp(end))
+    return conditions, parameters
+
+
+def _schemas(conn, start=None, end=None):
+    """
+    "main" followed by the schema of each archive file that may hold rows
+    dated start <= date < end, attached to conn as needed.
+    """
+    yield "main"
+    yield from archive_schemas(
+        conn, None if start is None else to_timestamp(start),
+        None if end is None else to_timestamp(end))
+
+
+@timed
+def add_transaction(user_id, amount, description, category, date=None):
+    """Store one transaction and return its id."""
+    with get_connection() as conn:
+        cursor = conn.execute(INSERT_TRANSACTION_SQL, (
+            user_id, amount, description, category, format_transaction_date(date)))
+    return cursor.lastrowid
+
+
+@timed
+def add_transactions_bulk(user_id, transactions, batch_size=BULK_BATCH_SIZE):
+    """
+    Insert many (amount, description, category, date) rows in one transaction.
+
+    The rows may come from any iterable, including a generator; they are
+    consumed batch_size at a time, so memory use does not grow with the input.
+    Either every row is stored or, on error, none are. Returns the row count.
+    """
+    rows = ((user_id, amount, description, category, format_transaction_date(date))
+            for amount, description, category, date in transactions)
+    count = 0
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # Index the descriptions once at the end rather than row by row.
+        conn.execute("""
+        INSERT INTO search_index_deferred (after_id)
+        SELECT COALESCE(MAX(id), 0) FROM transactions
+        """)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                break
+            conn.executemany(INSERT_TRANSACTION_SQL, batch)
+            count += len(batch)
+        conn.execute("""
+        INSERT INTO transactions_fts (rowid, description)
+        SELECT id, description FROM transactions
+        WHERE id > (SELECT after_id FROM search_index_deferred)
+        """)
+        conn.execute("DELETE FROM search_index_deferred")
+    return count
+
+# Search transaction descriptions
+
+_SEARCH_TERM = re.compile(r'"([^"]*)"?|(\S+)')
+
+
+def build_search_query(text):
+    """
+    Turn what the user typed into an FTS5 query: each word matches as a
+    prefix ("gro" finds "Groceries") and "quoted words" match as a phrase.
+    All terms must match. Returns None if there is nothing to search for.
+    """
+    terms = []
+    for phrase, word in _SEARCH_TERM.findall(text):
+        if phrase.strip():
+            terms.append('"' + phrase.replace('"', '""') + '"')
+        elif word:
+            terms.append('"' + word.replace('"', '""') + '"*')
+    return " ".join(terms) or None
+
+
+@timed
+def search_transactions(user_id, text, limit, older_than=None):
+    """
+    Return up to `limit` (id, amount, description, category, date) rows whose
+    description matches `text` (see build_search_query), newest first.
+
+    Matches come from the transactions_fts index rather than a scan. Pass
+    the (date, id) of the last row shown as older_than for the next page.
+    """
+    query = build_search_query(text)
+    if query is None:
+        return []
+    keyset = "AND (t.date, t.id) < (?, ?)" if older_than is not None else ""
+    return get_connection().execute(f"""
+    SELECT t.id, t.amount, t.description, t.category, t.date
+    FROM transactions_fts f CROSS JOIN transactions t ON t.id = f.rowid
+    WHERE transactions_fts MATCH ? AND t.user_id = ? {keyset}
+    ORDER BY t.date DESC, t.id DESC
+    LIMIT ?
+    """, (query, user_id, *(older_than or ()), limit)).fetchall()
+
+# Load transactions for a user
+
+
+# Results of the read functions below are cached until the user's data
+# version moves on; the database file is part of the key.
+_cached = versioned(lambda user_id: get_data_version(user_id), lambda: database.DB_NAME)
+
+
+@timed
+@_cached
+def load_transactions(user_id, start=None, end=None):
+    """
+    Return the user's (amount, description, category, date) rows, newest
+    first; with start and/or end, only those dated start <= date < end,
+    read as a range of the timestamp index. Archived years are included.
+    """
+    conn = get_connection()
+    conditions, parameters = _date_range_sql(start, end)
+    order = "date" if start is None and end is None else "timestamp"
+    # Rows can be added to an archived year after it was archived, so the
+    # schemas overlap in time: each is read in order, in full (attaching the
+    # next archive may detach it), and the results are merged.
+    sources = [conn.execute(f"""
+    SELECT {order}, id, amount, description, category, date FROM {schema}.transactions
+    WHERE user_id = ? {conditions}
+    ORDER BY {order} DESC, id DESC
+    """, (user_id, *parameters)).fetchall() for schema in _schemas(conn, start, end)]
+    return [row[2:] for row in heapq.merge(*sources, reverse=True)]
+
+# Stream a user's transactions, oldest first
+
+# Rows fetched from SQLite at a time by iter_transactions.
+STREAM_BATCH_SIZE = 1000
+
+
+def _fetch_batches(cursor, batch_size):
+    """Yield the rows of cursor, fetching batch_size of them at a time."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def _time_segments(conn, start, end):
+    """
+    Split start <= timestamp < end (timestamps; either may be None) into
+    consecutive stretches of time, oldest first. Each is a list of
+    (schema, low, high) parts whose rows together are that stretch's rows:
+    an archived year is read from its archive and from the main database,
+    the years between from the main database alone.
+
+    The archive of a stretch is attached just before it is yielded and may
+    be detached for the next one, so read each stretch in full first.
+    """
+    position = start
+    for schema in archive_schemas(conn, start, end, newest_first=False):
+        year = int(schema.rsplit("_", 1)[1])
+        year_start = calendar.timegm((year, 1, 1, 0, 0, 0))
+        year_end = calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+        if start is not None:
+            year_start = max(year_start, start)
+        if end is not None:
+            year_end = min(year_end, end)
+        yield [("main", position, year_start)]
+        yield [(schema, year_start, year_end), ("main", year_start, year_end)]
+        position = year_end
+    yield [("main", position, end)]
+
+
+def iter_transactions(user_id, start=None, end=None, category=None,
+                      batch_size=STREAM_BATCH_SIZE, after=None):
+    """
+    Yield the user's (id, date, amount, description, category) rows, oldest
+    first, optionally only those dated start <= date < end and filed under
+    `category` (None matches every row, "" the uncategorized ones). Pass the
+    (date, id) key of the last row read as `after` to carry on from it.
+
+    Rows are read batch_size at a time, so memory use does not depend on the
+    length of the history. Archived years are included: each is merged with
+    the rows of that year still in the main database, one archive at a time.
+    """
+    conn = get_connection()
+    category_id = None
+    if category is not None:
+        row = conn.execute("SELECT id FROM categories WHERE name = ?", (category,)).fetchone()
+        if row is None:
+            return
+        category_id = row[0]
+
+    def select(schema, low, high):
+        conditions, parameters = _date_range_sql(low, high, "t.timestamp")
+        if after is not None:
+            conditions += " AND (t.timestamp, t.id) > (?, ?)"
+            parameters += [after_timestamp, after[1]]
+        if category_id is not None:
+            conditions += f"""
+            AND EXISTS (SELECT 1 FROM {schema}.transaction_categories tc
+                        WHERE tc.transaction_id = t.id AND tc.category_id = ?)"""
+            parameters.append(category_id)
+        cursor = conn.execute(f"""
+        SELECT t.timestamp, t.id, t.date, t.amount, t.description, t.category
+        FROM {schema}.transactions t
+        WHERE t.user_id = ? {conditions}
+        ORDER BY t.timestamp, t.id
+        """, (user_id, *parameters))
+        return _fetch_batches(cursor, batch_size)
+
+    lower = None if start is None else to_timestamp(start)
+    upper = None if end is None else to_timestamp(end)
+    if after is not None:
+        # Rows are in (timestamp, id) order, so the key is compared the same way.
+        after_timestamp = to_timestamp(after[0])
+        lower = after_timestamp if lower is None else max(lower, after_timestamp)
+    for parts in _time_segments(conn, lower, upper):
+        for row in heapq.merge(*(select(*part) for part in parts)):
+            yield row[1:]
+
+# Load one page of a user's statement
+
+
+@timed
+def load_transactions_page(user_id, limit, older_than=None, newer_than=None):
+    """
+    Return up to `limit` (id, amount, description, category, date) rows, newest first.
+
+    Pages are addressed by keyset rather than OFFSET: pass the (date, id) key
+    of the last row shown as older_than to get the next page down, or of the
+    first row shown as newer_than to get the page above it. Either way the
+    query is a range scan on the (user_id, date) index, so every page costs
+    the same no matter how deep into the history it is.
+    """
+    conn = get_connection()
+    if newer_than is not None:
+        rows = conn.execute("""
+        SELECT id, amount, description, category, date FROM transactions
+        WHERE user_id = ? AND (date, id) > (?, ?)
+        ORDER BY date, id
+        LIMIT ?
+        """, (user_id, *newer_than, limit)).fetchall()
+        rows.reverse()
+        return rows
+    if older_than is not None:
+        return conn.execute("""
+        SELECT id, amount, description, category, date FROM transactions
+        WHERE user_id = ? AND (date, id) < (?, ?)
+        ORDER BY date DESC, id DESC
+        LIMIT ?
+        """, (user_id, *older_than, limit)).fetchall()
+    return conn.execute("""
+    SELECT id, amount, description, category, date FROM transactions
+    WHERE user_id = ?
+    ORDER BY date DESC, id DESC
+    LIMIT ?
+    """, (user_id, limit)).fetchall()
+
+# Load category breakdown
+
+
+@timed
+@_cached
+def load_category_breakdown(user_id, start=None, end=None):
+    """
+    Return (category, total) rows ordered by name, None being uncategorized.
+    Without a date range they come from the running totals; with one they
+    are summed over that range of the timestamp index, archived years included.
+    """
+    if start is None and end is None:
+        cursor = get_connection().execute("""
+        SELECT NULLIF(c.name, ''), ct.total_cents / 100.0
+        FROM category_totals ct JOIN categories c ON c.id = ct.category_id
+        WHERE ct.user_id = ?
+        ORDER BY c.name
+        """, (user_id,))
+        return cursor.fetchall()
+    conn = get_connection()
+    conditions, parameters = _date_range_sql(start, end, "t.timestamp")
+    totals = {}
+    for schema in _schemas(conn, start, end):
+        for category_id, cents in conn.execute(f"""
+        SELECT tc.category_id, SUM(CAST(ROUND(t.amount * 100) AS INTEGER))
+        FROM {schema}.transactions t
+        JOIN {schema}.transaction_categories tc ON tc.transaction_id = t.id
+        WHERE t.user_id = ? {conditions}
+        GROUP BY tc.category_id
+        """, (user_id, *parameters)):
+            totals[category_id] = totals.get(category_id, 0) + cents
+    if not totals:
+        return []
+    names = conn.execute(f"""
+    SELECT id, NULLIF(name, '') FROM categories
+    WHERE id IN ({", ".join("?" * len(totals))})
+    ORDER BY name
+    """, list(totals))
+    return [(name, totals[category_id] / 100.0) for category_id, name in names]
+
+# Load income and expense totals per month
+
+
+@timed
+def load_monthly_totals(user_id):
+    """Return (month "YYYY-MM", income, expense) rows, oldest first; expenses are negative."""
+    cursor = get_connection().execute("""
+    SELECT month, income_cents / 100.0, expense_cents / 100.0 FROM monthly_totals
+    WHERE user_id = ?
+    ORDER BY month
+    """, (user_id,))
+    return cursor.fetchall()
+
+# Calculate total balance for a user
+
+
+@timed
+@_cached
+def calculate_total_balance(user_id, start=None, end=None):
+    """
+    Return the sum of the user's transactions, or of those dated
+    start <= date < end when a range is given (answered from the
+    (user_id, timestamp, amount) index alone, in each archive it reaches).
+    """
+    conn = get_connection()
+    if start is None and end is None:
+        result = conn.execute("""
+        SELECT balance_cents FROM user_balances WHERE user_id = ?
+        """, (user_id,)).fetchone()
+        return result[0] / 100 if result and result[0] else 0
+    conditions, parameters = _date_range_sql(start, end)
+    cents = 0
+    for schema in _schemas(conn, start, end):
+        result = conn.execute(f"""
+        SELECT SUM(CAST(ROUND(amount * 100) AS INTEGER)) FROM {schema}.transactions
+        WHERE user_id = ? {conditions}
+        """, (user_id, *parameters)).fetchone()
+        cents += result[0] or 0
+    return cents / 100 if cents else 0
+
+# Running balance over time, downsampled for a chart
+
+# Picks, from each bucket of a stretch's running balance, its first, last,
+# lowest and highest point (the M4 downsampling of a line chart): drawn one
+# bucket per pixel column, they give the same picture as every point would.
+# {parts} is a UNION ALL of the stretch's (id, timestamp, cents) rows; the
+# parameters are the opening balance, then those of {parts}, then the first
+# timestamp, the bucket count and the span of the whole period.
+_BALANCE_HISTORY_SQL = """
+WITH history AS (
+    SELECT timestamp, ROW_NUMBER() OVER w AS seq, ? + SUM(cents) OVER w AS balance
+    FROM ({parts})
+    WINDOW w AS (ORDER BY timestamp, id ROWS UNBOUNDED PRECEDING)
+),
+buckets AS (
+    SELECT seq, timestamp, balance, (timestamp - ?) * ? / ? AS bucket FROM history
+)
+SELECT strftime('%Y-%m-%dT%H:%M:%S', timestamp, 'unixepoch'), balance FROM buckets
+WHERE seq IN (
+    SELECT MIN(seq) FROM buckets GROUP BY bucket
+    UNION SELECT MAX(seq) FROM buckets GROUP BY bucket
+    UNION SELECT seq FROM (SELECT seq, MIN(balance) FROM buckets GROUP BY bucket)
+    UNION SELECT seq FROM (SELECT seq, MAX(balance) FROM buckets GROUP BY bucket)
+)
+ORDER BY seq
+"""
+
+
+@timed
+@_cached
+def load_balance_history(user_id, buckets, start=None, end=None):
+    """
+    Return the user's balance after each transaction as (date, balance)
+    points, oldest first, optionally only for start <= date < end.
+
+    The running sum is a window function over the (timestamp, id) order.
+    The period is cut into `buckets` equal spans of time and only the first,
+    last, lowest and highest point of each is kept, so a chart `buckets`
+    pixels wide looks the same as with every point but never gets more than
+    about 4 * buckets of them, however long the history.
+    """
+    conn = get_connection()
+    lower = None if start is None else to_timestamp(start)
+    upper = None if end is None else to_timestamp(end)
+    conditions, parameters = _date_range_sql(lower, upper)
+    first = last = None
+    for schema in _schemas(conn, lower, upper):
+        low, high = conn.execute(f"""
+        SELECT (SELECT MIN(timestamp) FROM {schema}.transactions
+                WHERE user_id = ? AND timestamp IS NOT NULL {conditions}),
+               (SELECT MAX(timestamp) FROM {schema}.transactions
+                WHERE user_id = ? {conditions})
+        """, (user_id, *parameters, user_id, *parameters)).fetchone()
+        if low is not None:
+            first = low if first is None else min(first, low)
+            last = high if last is None else max(last, high)
+    if first is None:
+        return []
+    # With a start date the line opens at the balance of everything before
+    # it: the running total less whatever is dated from the start on.
+    opening = 0
+    if lower is not None:
+        opening = conn.execute("""
+        SELECT COALESCE(SUM(balance_cents), 0) FROM user_balances WHERE user_id = ?
+        """, (user_id,)).fetchone()[0]
+        for schema in _schemas(conn, lower):
+            opening -= conn.execute(f"""
+            SELECT COALESCE(SUM(CAST(ROUND(amount * 100) AS INTEGER)), 0)
+            FROM {schema}.transactions WHERE user_id = ? AND timestamp >= ?
+            """, (user_id, lower)).fetchone()[0]
+
+    points = []
+    for parts in _time_segments(conn, lower, upper):
+        union, part_parameters = [], []
+        for schema, low, high in parts:
+            part_conditions, bounds = _date_range_sql(low, high)
+            union.append(f"""
+            SELECT id, timestamp, CAST(ROUND(amount * 100) AS INTEGER) AS cents
+            FROM {schema}.transactions
+            WHERE user_id = ? AND timestamp IS NOT NULL {part_conditions}""")
+            part_parameters += [user_id, *bounds]
+        rows = conn.execute(_BALANCE_HISTORY_SQL.format(parts=" UNION ALL ".join(union)), (
+            opening, *part_parameters, first, buckets, last - first + 1)).fetchall()
+        if rows:
+            opening = rows[-1][1]
+            points += rows
+    return [(date, cents / 100) for date, cents in points]
+
+
+@timed
+def load_changed_balance_history(user_id, known_version, buckets):
+    """
+    Return (version, load_balance_history(user_id, buckets)), or None if the
+    user's data is still at known_version.
+    """
+    # Not one read transaction as in load_changed_breakdown: the history may
+    # need to attach archives, which SQLite refuses inside a transaction. The
+    # version is read first, so a change made in between only means the
+    # next call reloads once more.
+    version = get_data_version(user_id)
+    if version == known_version:
+        return None
+    return version, load_balance_history(user_id, buckets)
+
+# Track changes to a user's transactions
+
+
+@timed
+def get_data_version(user_id):
+    """Return a number that grows every time the user's transactions change."""
+    result = get_connection().execute("""
+    SELECT version FROM user_balances WHERE user_id = ?
+    """, (user_id,)).fetchone()
+    return result[0] if result else 0
+
+
+@timed
+def load_changed_breakdown(user_id, known_version):
+    """
+    Return (version, category breakdown), or None if the user's data is
+    still at known_version and whatever was built from it is current.
+    """
+    conn = get_connection()
+    # One read transaction, so the version matches the breakdown read with it.
+    with conn:
+        conn.execute("BEGIN")
+        version = get_data_version(user_id)
+        if version == known_version:
+            return None
+        return version, load_category_breakdown(user_id)
+
+# Delete transactions by id
+
+# Ids bound per statement; stays well under SQLite's host-parameter limit.
+DELETE_BATCH_SIZE = 500
+
+
+def _delete_from_main(conn, user_id, transaction_ids):
+    """Delete the user's rows with these ids from the main database; returns their (id, amount)."""
+    deleted = []
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for start in range(0, len(transaction_ids), DELETE_BATCH_SIZE):
+            batch = transaction_ids[start:start + DELETE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            deleted += conn.execute(f"""
+            SELECT id, amount FROM transactions
+            WHERE id IN ({placeholders}) AND user_id = ?
+            """, (*batch, user_id)).fetchall()
+            conn.execute(f"""
+            DELETE FROM transactions
+            WHERE id IN ({placeholders}) AND user_id = ?
+            """, (*batch, user_id))
+    return deleted
+
+
+def _unarchive_sql(table, placeholders):
+    """Take the main-database rows with the given ids back out of archived_{table}."""
+    keys = AGGREGATE_KEYS[table].split(", ")
+    totals = ", ".join(f"{column} = {column} - excluded.{column}"
+                       for column in AGGREGATE_COLUMNS[table].split(", ")
+                       if column not in keys)
+    where = f"WHERE t.id IN ({placeholders})"
+    return f"""
+    INSERT INTO archived_{table} ({AGGREGATE_COLUMNS[table]})
+    SELECT * FROM ({LIVE_AGGREGATE_SQL[table].format(where=where)}) WHERE true
+    ON CONFLICT ({AGGREGATE_KEYS[table]}) DO UPDATE SET {totals}
+    """
+
+
+def _unarchive(conn, user_id, transaction_ids):
+    """
+    Move the user's archived rows with these ids back into the main
+    database, archive by archive, and return their ids.
+
+    Each archive takes two transactions, as a commit across attached files
+    is not atomic in WAL mode. The first copies the rows back, with
+    `archiving` set so the aggregates are left as they are, and takes them
+    out of the archived_* roll-ups: they are now counted through the main
+    database instead. The second drops them from the archive. A row found
+    in both places was copied back by an interrupted run and only needs the
+    second step.
+    """
+    moved = []
+    for schema in archive_schemas(conn):
+        year = int(schema.rsplit("_", 1)[1])
+        for start in range(0, len(transaction_ids), DELETE_BATCH_SIZE):
+            batch = transaction_ids[start:start + DELETE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            found = [row[0] for row in conn.execute(f"""
+            SELECT id FROM {schema}.transactions WHERE id IN ({placeholders}) AND user_id = ?
+            """, (*batch, user_id))]
+            if not found:
+                continue
+            placeholders = ", ".join("?" * len(found))
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("INSERT INTO archiving (year) VALUES (?)", (year,))
+                restored = conn.execute(f"""
+                INSERT INTO main.transactions
+                    (id, user_id, amount, description, category, date, timestamp)
+                SELECT id, user_id, amount, description, category, date, timestamp
+                FROM {schema}.transactions
+                WHERE id IN ({placeholders}) AND id NOT IN (SELECT id FROM main.transactions)
+                """, found).rowcount
+                if restored:
+                    for table in AGGREGATE_TABLES:
+                        conn.execute(_unarchive_sql(table, placeholders), found)
+                        conn.execute(f"DELETE FROM archived_{table} WHERE transaction_count = 0")
+                    conn.execute("""
+                    UPDATE archives SET transaction_count = transaction_count - ? WHERE year = ?
+                    """, (restored, year))
+                conn.execute("DELETE FROM archiving")
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(f"""
+                DELETE FROM {schema}.transaction_categories
+                WHERE transaction_id IN ({placeholders})
+                """, found)
+                conn.execute(f"""
+                DELETE FROM {schema}.transactions WHERE id IN ({placeholders})
+                """, found)
+            moved += found
+    return moved
+
+
+@timed
+def delete_transactions(user_id, transaction_ids):
+    """
+    Delete the user's transactions with the given ids.
+
+    Every lookup is by primary key, and ids that do not exist or belong to
+    another user are ignored. Rows in the main database go in one
+    transaction; ids not found there are looked up in the archive files and
+    deleted from them as well, with the totals adjusted. Returns the
+    (id, amount) of each deleted row.
+    """
+    transaction_ids = list(transaction_ids)
+    conn = get_connection()
+    deleted = _delete_from_main(conn, user_id, transaction_ids)
+    found = {row[0] for row in deleted}
+    missing = [transaction_id for transaction_id in transaction_ids
+               if transaction_id not in found]
+    if missing:
+        moved = _unarchive(conn, user_id, missing)
+        if moved:
+            deleted += _delete_from_main(conn, user_id, moved)
+    return deleted
+
+# Load the first statement page together with the balance
+
+
+@timed
+def load_statement(user_id, limit):
+    """Return (balance, newest `limit` rows) for the Statement tab."""
+    return calculate_total_balance(user_id), load_transactions_page(user_id, limit)
+
+# Load the transactions in one category
+
+
+@timed
+def load_category_transactions(user_id, category):
+    """
+    Return the (amount, description, date) of every transaction filed under
+    `category`, including those that also name other categories. None means
+    the uncategorized transactions, as in load_category_breakdown. Archived
+    years are included, so the rows add up to the category's total.
+    """
+    conn = get_connection()
+    row = conn.execute("SELECT id FROM categories WHERE name = ?", (category or "",)).fetchone()
+    if row is None:
+        return []
+    rows = []
+    for schema in _schemas(conn):
+        rows += conn.execute(f"""
+        SELECT t.amount, t.description, t.date
+        FROM {schema}.transaction_categories tc
+        JOIN {schema}.transactions t ON t.id = tc.transaction_id
+        WHERE tc.user_id = ? AND tc.category_id = ?
+        """, (user_id, row[0])).fetchall()
+    return rows
+
+# Load one sorted page of the transactions in one category
+
+# Typed expression behind each sortable column of the category details.
+CATEGORY_SORT_KEYS = {
+    "amount": "t.amount",
+    "description": "COALESCE(t.description, '')",
+    "date": "t.date",
+}
+
+
+@timed
+def load_category_transactions_page(user_id, category, limit, sort="date",
+                                    descending=False, after=None):
+    """
+    Return up to `limit` (id, amount, description, date, sort key) rows of one
+    category, ordered by the CATEGORY_SORT_KEYS column `sort` and then id.
+
+    Pass the (sort key, id) of the last row shown as `after` to get the next
+    page. Large categories are read in index order from transactions, probing
+    the category links, so a page never sorts the whole category; small ones
+    are read through their links and sorted, which is cheaper than scanning
+    the user's history for them. Archived years are read through their links
+    and merged in, so the pages cover every row in the category's total.
+    """
+    expression = CATEGORY_SORT_KEYS[sort]
+    conn = get_connection()
+    category_id, category_count, user_count = conn.execute("""
+    SELECT c.id, ct.transaction_count, ub.transaction_count
+    FROM categories c
+    JOIN category_totals ct ON ct.user_id = ? AND ct.category_id = c.id
+    JOIN user_balances ub ON ub.user_id = ct.user_id
+    WHERE c.name = ?
+    """, (user_id, category or "")).fetchone() or (None, 0, 0)
+    if not category_count:
+        return []
+    # Reading in index order visits about limit * user_count / category_count
+    # rows; reading through the links visits and sorts category_count rows.
+    # The archives have no sort indexes, so they are always read through links.
+    index_order = category_count * category_count > limit * user_count
+    direction, comparison = ("DESC", "<") if descending else ("ASC", ">")
+    keyset = f"AND ({expression}, t.id) {comparison} (?, ?)" if after is not None else ""
+    pages = []
+    for schema in _schemas(conn):
+        if schema == "main" and index_order:
+            tables = "transactions t CROSS JOIN transaction_categories tc"
+        else:
+            tables = (f"{schema}.transaction_categories tc "
+                      f"CROSS JOIN {schema}.transactions t")
+        pages.append(conn.execute(f"""
+        SELECT t.id, t.amount, t.description, t.date, {expression} FROM {tables}
+        WHERE t.user_id = ? AND tc.transaction_id = t.id
+            AND tc.user_id = t.user_id AND tc.category_id = ? {keyset}
+        ORDER BY {expression} {direction}, t.id {direction}
+        LIMIT ?
+        """, (user_id, category_id, *(after or ()), limit)).fetchall())
+    if len(pages) == 1:
+        return pages[0]
+    rows = heapq.merge(*pages, key=lambda row: (row[4], row[0]), reverse=descending)
+    return list(itertools.islice(rows, limit))
@@ -0,0 +1,782 @@
+# FileName: database.py
+# Description: SQLite connection pool and schema migrations for the finance data layer.
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from . import cache, profiling
+
+# Database setup
+DB_NAME = "finance_manager.db"
+# Open DB_NAME read-only (SQLite's mode=ro), as report workers do; writes then
+# fail with sqlite3.OperationalError.
+READ_ONLY = False
+
+# Connection tuning. synchronous=NORMAL is safe in WAL mode (a power loss can
+# only lose the last commits, never corrupt the file) and avoids an fsync per
+# commit. A negative cache_size is in KiB, so this is a 20 MB page cache.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",
+    "PRAGMA temp_store = MEMORY",
+)
+# Number of prepared statements sqlite3 keeps per connection.
+STATEMENT_CACHE_SIZE = 256
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+# Bumped by close_connections so other threads notice their handle is stale.
+_pool_generation = 0
+
+
+def get_connection():
+    """
+    Return the calling thread's shared connection to DB_NAME.
+
+    Each thread gets one long-lived connection, opened on first use, so data
+    functions no longer pay for a connect, pragma setup and statement
+    compilation on every call. Use the connection as a context manager
+    ("with get_connection() as conn:") to commit or roll back a transaction.
+
+    While profiling is enabled the connection is a ProfilingConnection, which
+    times every query it runs. While READ_ONLY is set it is opened read-only.
+    """
+    conn = getattr(_local, "conn", None)
+    profiled = profiling.is_enabled()
+    if (conn is not None and _local.db_name == DB_NAME
+            and _local.generation == _pool_generation and _local.profiled == profiled
+            and _local.read_only == READ_ONLY):
+        return conn
+
+    factory = profiling.ProfilingConnection if profiled else sqlite3.Connection
+    if READ_ONLY:
+        # The journal mode is a property of the file, set by a writer.
+        conn = sqlite3.connect(f"file:{urllib.parse.quote(DB_NAME)}?mode=ro", uri=True,
+                               cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False, factory=factory)
+        pragmas = CONNECTION_PRAGMAS[1:]
+    else:
+        conn = sqlite3.connect(DB_NAME, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False, factory=factory)
+        pragmas = CONNECTION_PRAGMAS
+    if profiled:
+        conn.set_trace_callback(profiling.record_statement)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    _local.conn = conn
+    _local.db_name = DB_NAME
+    _local.generation = _pool_generation
+    _local.profiled = profiled
+    _local.read_only = READ_ONLY
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def close_connections():
+    """Close every pooled connection, from all threads, and drop the cached reads."""
+    global _pool_generation
+    with _connections_lock:
+        connections = _connections[:]
+        _connections.clear()
+        _pool_generation += 1
+    for conn in connections:
+        conn.close()
+    cache.clear_read_cache()
+
+
+def _migration_1_base_tables(cursor):
+    """Create the users and transactions tables."""
+    # IF NOT EXISTS lets databases created before versioning adopt the schema.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        category TEXT,
+        date TEXT NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    """)
+
+
+def _migration_2_transaction_indexes(cursor):
+    """Index the per-user statement and category lookups."""
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_date
+    ON transactions (user_id, date)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_category
+    ON transactions (user_id, category)
+    """)
+
+
+# Aggregates are kept in integer cents so that adding and subtracting
+# amounts in triggers never accumulates floating-point drift.
+AGGREGATE_TABLES = ("user_balances", "category_totals", "monthly_totals")
+_CENTS = "CAST(ROUND({row}.amount * 100) AS INTEGER)"
+
+
+def _aggregate_add_sql(row):
+    """Trigger statements that count the transaction `row` (new/old) into the aggregates."""
+    cents = _CENTS.format(row=row)
+    return f"""
+    INSERT INTO user_balances (user_id, balance_cents, transaction_count, version)
+    VALUES ({row}.user_id, {cents}, 1, 1)
+    ON CONFLICT (user_id) DO UPDATE SET
+        balance_cents = balance_cents + excluded.balance_cents,
+        transaction_count = transaction_count + 1,
+        version = version + 1;
+    INSERT INTO monthly_totals (user_id, month, income_cents, expense_cents, transaction_count)
+    VALUES ({row}.user_id, substr({row}.date, 1, 7),
+            MAX({cents}, 0), MIN({cents}, 0), 1)
+    ON CONFLICT (user_id, month) DO UPDATE SET
+        income_cents = income_cents + excluded.income_cents,
+        expense_cents = expense_cents + excluded.expense_cents,
+        transaction_count = transaction_count + 1;
+    """
+
+
+def _aggregate_remove_sql(row):
+    """Trigger statements that take the transaction `row` (new/old) out of the aggregates."""
+    cents = _CENTS.format(row=row)
+    return f"""
+    UPDATE user_balances SET
+        balance_cents = balance_cents - {cents},
+        transaction_count = transaction_count - 1,
+        version = version + 1
+    WHERE user_id = {row}.user_id;
+    UPDATE monthly_totals SET
+        income_cents = income_cents - MAX({cents}, 0),
+        expense_cents = expense_cents - MIN({cents}, 0),
+        transaction_count = transaction_count - 1
+    WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7);
+    DELETE FROM monthly_totals
+    WHERE user_id = {row}.user_id AND month = substr({row}.date, 1, 7)
+        AND transaction_count = 0;
+    """
+
+
+# Columns of each aggregate table that are derived from the transactions.
+AGGREGATE_COLUMNS = {
+    "user_balances": "user_id, balance_cents, transaction_count",
+    "category_totals": "user_id, category_id, total_cents, transaction_count",
+    "monthly_totals": "user_id, month, income_cents, expense_cents, transaction_count",
+}
+AGGREGATE_KEYS = {
+    "user_balances": "user_id",
+    "category_totals": "user_id, category_id",
+    "monthly_totals": "user_id, month",
+}
+# AGGREGATE_COLUMNS computed from the rows of transactions t that pass
+# `{where}` (an optional WHERE clause on t).
+LIVE_AGGREGATE_SQL = {
+    "user_balances": f"""
+    SELECT user_id, SUM({_CENTS.format(row="t")}), COUNT(*)
+    FROM transactions t {{where}} GROUP BY user_id
+    """,
+    "category_totals": f"""
+    SELECT t.user_id, tc.category_id, SUM({_CENTS.format(row="t")}), COUNT(*)
+    FROM transaction_categories tc JOIN transactions t ON t.id = tc.transaction_id
+    {{where}} GROUP BY t.user_id, tc.category_id
+    """,
+    "monthly_totals": f"""
+    SELECT user_id, substr(date, 1, 7),
+           SUM(MAX({_CENTS.format(row="t")}, 0)), SUM(MIN({_CENTS.format(row="t")}, 0)), COUNT(*)
+    FROM transactions t {{where}} GROUP BY user_id, substr(date, 1, 7)
+    """,
+}
+
+
+def _sum_columns(table):
+    """AGGREGATE_COLUMNS of `table` with each non-key column wrapped in SUM()."""
+    keys = AGGREGATE_KEYS[table].split(", ")
+    return ", ".join(column if column in keys else f"SUM({column})"
+                     for column in AGGREGATE_COLUMNS[table].split(", "))
+
+
+# Recompute AGGREGATE_COLUMNS from scratch; used to backfill and to repair.
+# Transactions moved to the archive files are counted through the
+# archived_* roll-ups kept for them (see archive.py).
+AGGREGATE_REBUILD_SQL = {
+    table: f"""
+    SELECT {_sum_columns(table)} FROM (
+        SELECT {AGGREGATE_COLUMNS[table]} FROM archived_{table}
+        UNION ALL {LIVE_AGGREGATE_SQL[table].format(where="")}
+    ) GROUP BY {AGGREGATE_KEYS[table]}
+    """
+    for table in AGGREGATE_TABLES
+}
+
+
+# Seconds since 1970-01-01 of an ISO-8601 date text (times without an offset
+# count as UTC); NULL if the text is not a date.
+TIMESTAMP_SQL = "CAST(strftime('%s', {date}) AS INTEGER)"
+
+
+def _split_categories_sql(row):
+    """
+    FROM and WHERE clauses that give one `names` row per category in the
+    comma-joined category label of `row`, with the name in trim(names.value).
+
+    The label is split by quoting it as a JSON array, because triggers cannot
+    use recursive CTEs. A label with no names in it (empty or NULL) yields
+    the single name '', which stands for "uncategorized".
+    """
+    return f"""
+    json_each('[' || replace(json_quote(COALESCE({row}.category, '')), ',', '","') || ']') AS names
+    WHERE (trim(names.value) <> '' OR trim(COALESCE({row}.category, ''), ' ,') = '')
+    """
+
+
+def _link_categories_sql(row):
+    """Statements that file the transaction `row` under each of its categories."""
+    return f"""
+    INSERT OR IGNORE INTO categories (name)
+    SELECT trim(names.value) FROM {_split_categories_sql(row)};
+    INSERT OR IGNORE INTO transaction_categories (transaction_id, category_id, user_id)
+    SELECT {row}.id, c.id, {row}.user_id
+    FROM categories c, {_split_categories_sql(row)} AND c.name = trim(names.value);
+    """
+
+
+def _rebuild_aggregates(cursor):
+    # user_balances rows are kept rather than recreated so each user's data
+    # version only ever moves forward; a rebuild counts as a change.
+    cursor.execute("""
+    UPDATE user_balances SET balance_cents = 0, transaction_count = 0, version = version + 1
+    """)
+    cursor.execute(f"""
+    INSERT INTO user_balances ({AGGREGATE_COLUMNS["user_balances"]})
+    SELECT * FROM ({AGGREGATE_REBUILD_SQL["user_balances"]}) WHERE true
+    ON CONFLICT (user_id) DO UPDATE SET
+        balance_cents = excluded.balance_cents,
+        transaction_count = excluded.transaction_count
+    """)
+    for table in AGGREGATE_TABLES[1:]:
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"INSERT INTO {table} ({AGGREGATE_COLUMNS[table]}) {AGGREGATE_REBUILD_SQL[table]}")
+
+
+def _create_triggers(cursor):
+    """(Re)create every trigger from its current definition and record their digest."""
+    for name, definition in TRIGGERS.items():
+        cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cursor.execute(f"CREATE TRIGGER {name} {definition}")
+    cursor.execute("CREATE TABLE IF NOT EXISTS trigger_definitions (digest TEXT NOT NULL)")
+    cursor.execute("DELETE FROM trigger_definitions")
+    cursor.execute("INSERT INTO trigger_definitions (digest) VALUES (?)", (TRIGGERS_DIGEST,))
+
+
+def _stored_trigger_digest(conn):
+    """The TRIGGERS_DIGEST the database's triggers were created from, or None."""
+    if not conn.execute("""
+    SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'trigger_definitions'
+    """).fetchone():
+        return None
+    row = conn.execute("SELECT digest FROM trigger_definitions").fetchone()
+    return row[0] if row else None
+
+
+# Triggers are not versioned like tables: migrate() drops and recreates all of
+# them from these definitions whenever it applies a migration or finds that
+# they were created from different definitions (see TRIGGERS_DIGEST).
+TRIGGERS = {
+    # Rows being moved to or from an archive file stay counted in the
+    # aggregates as they are, so these skip them while `archiving` holds a row.
+    "transactions_aggregates_insert": f"""
+    AFTER INSERT ON transactions
+    WHEN NOT EXISTS (SELECT 1 FROM archiving)
+    BEGIN {_aggregate_add_sql("new")} END
+    """,
+    "transactions_aggregates_delete": f"""
+    AFTER DELETE ON transactions
+    WHEN NOT EXISTS (SELECT 1 FROM archiving)
+    BEGIN {_aggregate_remove_sql("old")} END
+    """,
+    "transactions_aggregates_update": f"""
+    AFTER UPDATE OF user_id, amount, category, date ON transactions
+    BEGIN {_aggregate_remove_sql("old")} {_aggregate_add_sql("new")} END
+    """,
+    # Category membership lives in transaction_categories; the category label
+    # on the transaction row is kept as entered, for display.
+    "transactions_categories_insert": f"""
+    AFTER INSERT ON transactions
+    BEGIN {_link_categories_sql("new")} END
+    """,
+    # Unlinking happens before the row changes, so that the totals triggers
+    # below still see the amount that was counted.
+    "transactions_categories_delete": """
+    BEFORE DELETE ON transactions
+    BEGIN DELETE FROM transaction_categories WHERE transaction_id = old.id; END
+    """,
+    "transactions_categories_unlink": """
+    BEFORE UPDATE OF user_id, amount, category ON transactions
+    BEGIN DELETE FROM transaction_categories WHERE transaction_id = old.id; END
+    """,
+    "transactions_categories_relink": f"""
+    AFTER UPDATE OF user_id, amount, category ON transactions
+    BEGIN {_link_categories_sql("new")} END
+    """,
+    # The data layer fills timestamp itself when it inserts; these cover any
+    # other writer and date edits.
+    "transactions_timestamp_insert": f"""
+    AFTER INSERT ON transactions
+    WHEN new.timestamp IS NULL
+    BEGIN
+    UPDATE transactions SET timestamp = {TIMESTAMP_SQL.format(date="new.date")} WHERE id = new.id;
+    END
+    """,
+    "transactions_timestamp_update": f"""
+    AFTER UPDATE OF date ON transactions
+    BEGIN
+    UPDATE transactions SET timestamp = {TIMESTAMP_SQL.format(date="new.date")} WHERE id = new.id;
+    END
+    """,
+    # transactions_fts is an external-content index, so it has to be told the
+    # old description of a row it should forget. Bulk inserts index their rows
+    # in one statement instead (see search_index_deferred).
+    "transactions_fts_insert": """
+    AFTER INSERT ON transactions
+    WHEN NOT EXISTS (SELECT 1 FROM search_index_deferred)
+    BEGIN
+    INSERT INTO transactions_fts (rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    "transactions_fts_delete": """
+    AFTER DELETE ON transactions
+    BEGIN
+    INSERT INTO transactions_fts (transactions_fts, rowid, description)
+    VALUES ('delete', old.id, old.description);
+    END
+    """,
+    "transactions_fts_update": """
+    AFTER UPDATE OF description ON transactions
+    BEGIN
+    INSERT INTO transactions_fts (transactions_fts, rowid, description)
+    VALUES ('delete', old.id, old.description);
+    INSERT INTO transactions_fts (rowid, description) VALUES (new.id, new.description);
+    END
+    """,
+    # Changes the aggregates do not see still change what the user is shown.
+    "transactions_version_update": """
+    AFTER UPDATE OF description ON transactions
+    WHEN old.description IS NOT new.description
+    BEGIN
+    UPDATE user_balances SET version = version + 1 WHERE user_id = new.user_id;
+    END
+    """,
+    "transaction_categories_totals_insert": f"""
+    AFTER INSERT ON transaction_categories
+    WHEN NOT EXISTS (SELECT 1 FROM archiving)
+    BEGIN
+    INSERT INTO category_totals (user_id, category_id, total_cents, transaction_count)
+    SELECT t.user_id, new.category_id, {_CENTS.format(row="t")}, 1
+    FROM transactions t WHERE t.id = new.transaction_id
+    ON CONFLICT (user_id, category_id) DO UPDATE SET
+        total_cents = total_cents + excluded.total_cents,
+        transaction_count = transaction_count + 1;
+    END
+    """,
+    "transaction_categories_totals_delete": f"""
+    AFTER DELETE ON transaction_categories
+    WHEN NOT EXISTS (SELECT 1 FROM archiving)
+    BEGIN
+    UPDATE category_totals SET
+        total_cents = total_cents - (
+            SELECT {_CENTS.format(row="t")} FROM transactions t WHERE t.id = old.transaction_id),
+        transaction_count = transaction_count - 1
+    WHERE user_id = old.user_id AND category_id = old.category_id;
+    DELETE FROM category_totals
+    WHERE user_id = old.user_id AND category_id = old.category_id
+        AND transaction_count = 0;
+    END
+    """,
+}
+TRIGGERS_DIGEST = hashlib.sha256(json.dumps(TRIGGERS, sort_keys=True).encode()).hexdigest()
+
+
+def _migration_3_aggregate_tables(cursor):
+    """Add trigger-maintained balance, category and monthly totals."""
+    cursor.execute("""
+    CREATE TABLE user_balances (
+        user_id INTEGER PRIMARY KEY,
+        balance_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE category_totals (
+        user_id INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        total_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE monthly_totals (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        income_cents INTEGER NOT NULL,
+        expense_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID
+    """)
+    return True
+
+
+def _migration_4_data_versions(cursor):
+    """Count every change to a user's transactions, for cache invalidation."""
+    cursor.execute("""
+    ALTER TABLE user_balances ADD COLUMN version INTEGER NOT NULL DEFAULT 0
+    """)
+
+
+def _migration_5_category_links(cursor):
+    """Store each category once and link transactions to every category they name."""
+    cursor.execute("""
+    CREATE TABLE categories (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL
+    )
+    """)
+    # user_id is copied from the transaction so that a user's rows in one
+    # category are a single range of the index below.
+    cursor.execute("""
+    CREATE TABLE transaction_categories (
+        transaction_id INTEGER NOT NULL REFERENCES transactions (id),
+        category_id INTEGER NOT NULL REFERENCES categories (id),
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (transaction_id, category_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE INDEX idx_transaction_categories_user_category
+    ON transaction_categories (user_id, category_id, transaction_id)
+    """)
+    cursor.execute(f"""
+    INSERT OR IGNORE INTO categories (name)
+    SELECT DISTINCT trim(names.value) FROM transactions t, {_split_categories_sql("t")}
+    """)
+    cursor.execute(f"""
+    INSERT OR IGNORE INTO transaction_categories (transaction_id, category_id, user_id)
+    SELECT t.id, c.id, t.user_id
+    FROM transactions t, categories c, {_split_categories_sql("t")} AND c.name = trim(names.value)
+    """)
+    # Totals were kept per comma-joined label; they are now per category.
+    cursor.execute("DROP TABLE category_totals")
+    cursor.execute("""
+    CREATE TABLE category_totals (
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category_id)
+    ) WITHOUT ROWID
+    """)
+    return True
+
+
+def _migration_6_sort_indexes(cursor):
+    """Index the columns the category details can be sorted by."""
+    # Date order is already served by idx_transactions_user_date.
+    cursor.execute("""
+    CREATE INDEX idx_transactions_user_amount
+    ON transactions (user_id, amount)
+    """)
+    cursor.execute("""
+    CREATE INDEX idx_transactions_user_description
+    ON transactions (user_id, COALESCE(description, ''))
+    """)
+
+
+def _migration_7_description_search(cursor):
+    """Add a full-text index over transaction descriptions."""
+    # Prefix indexes make the "word*" queries of search-as-you-type cheap.
+    cursor.execute("""
+    CREATE VIRTUAL TABLE transactions_fts USING fts5 (
+        description,
+        content = 'transactions', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """)
+    cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    # FTS5 flushes its pending terms whenever a trigger statement ends, which
+    # makes indexing from the insert trigger about ten times slower per row.
+    # While a bulk insert holds a row here, the trigger is skipped and rows
+    # with ids above after_id are indexed when the insert finishes.
+    cursor.execute("""
+    CREATE TABLE search_index_deferred (
+        after_id INTEGER NOT NULL
+    )
+    """)
+
+
+def _migration_8_numeric_timestamps(cursor):
+    """Store each transaction's date as an indexed integer timestamp as well."""
+    # The text date stays for display and for statement paging; range
+    # filters compare integers on the index below. amount is included so
+    # period balances are answered from the index alone.
+    cursor.execute("ALTER TABLE transactions ADD COLUMN timestamp INTEGER")
+    cursor.execute(f"UPDATE transactions SET timestamp = {TIMESTAMP_SQL.format(date='date')}")
+    cursor.execute("""
+    CREATE INDEX idx_transactions_user_timestamp
+    ON transactions (user_id, timestamp, amount)
+    """)
+
+
+def _migration_9_archives(cursor):
+    """Track the per-year archive files and the totals of the rows moved there."""
+    cursor.execute("""
+    CREATE TABLE archives (
+        year INTEGER PRIMARY KEY,
+        transaction_count INTEGER NOT NULL
+    )
+    """)
+    # Holds a row while archive_transactions deletes the rows it has copied,
+    # which keeps the delete triggers from taking them out of the aggregates.
+    cursor.execute("""
+    CREATE TABLE archiving (
+        year INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE archived_user_balances (
+        user_id INTEGER PRIMARY KEY,
+        balance_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE archived_category_totals (
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category_id)
+    ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+    CREATE TABLE archived_monthly_totals (
+        user_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        income_cents INTEGER NOT NULL,
+        expense_cents INTEGER NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, month)
+    ) WITHOUT ROWID
+    """)
+
+
+def _migration_10_drop_category_index(cursor):
+    """Drop the index on the category label, which nothing reads since migration 5."""
+    # Category lookups go through transaction_categories; the label index
+    # only cost every insert and update of a transaction.
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_user_category")
+
+
+# Schema migrations, applied in order. A database at PRAGMA user_version N has
+# had the first N applied. Only ever append to this list. A migration returns
+# True when the aggregate tables must be recomputed once it has run.
+MIGRATIONS = [
+    _migration_1_base_tables,
+    _migration_2_transaction_indexes,
+    _migration_3_aggregate_tables,
+    _migration_4_data_versions,
+    _migration_5_category_links,
+    _migration_6_sort_indexes,
+    _migration_7_description_search,
+    _migration_8_numeric_timestamps,
+    _migration_9_archives,
+    _migration_10_drop_category_index,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _schema_is_current(conn):
+    """Whether conn's database is at SCHEMA_VERSION with triggers from TRIGGERS."""
+    version = get_schema_version(conn)
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than this app ({SCHEMA_VERSION}).")
+    return version == SCHEMA_VERSION and _stored_trigger_digest(conn) == TRIGGERS_DIGEST
+
+
+def migrate(conn):
+    """
+    Bring the database up to SCHEMA_VERSION and its triggers up to TRIGGERS.
+
+    All pending migrations, the trigger rebuild and the user_version bump
+    commit as one transaction, so an interrupted upgrade leaves the file at
+    its previous version and is simply retried on the next start. A trigger
+    change alone needs no migration: the triggers are rebuilt whenever their
+    recorded digest differs from TRIGGERS_DIGEST.
+
+    The version is checked again once the write lock is held, so when
+    several processes open an old database at once only the first upgrades it.
+    """
+    if _schema_is_current(conn):
+        return
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if _schema_is_current(conn):
+            return
+        version = get_schema_version(conn)
+        cursor = conn.cursor()
+        rebuild = False
+        for migration in MIGRATIONS[version:]:
+            rebuild = migration(cursor) or rebuild
+        _create_triggers(cursor)
+        if rebuild:
+            _rebuild_aggregates(cursor)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("PRAGMA optimize")
+
+
+# Per-year archive files
+#
+# archive_transactions moves old transactions out of the main database into
+# one file per calendar year. The files are attached to a connection only
+# when a query reaches back into their years.
+
+# Archives attached to one connection at a time; SQLite allows 10 by default.
+MAX_ATTACHED_ARCHIVES = 8
+ARCHIVE_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.transactions (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        category TEXT,
+        date TEXT NOT NULL,
+        timestamp INTEGER
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_user_date
+    ON transactions (user_id, date)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS {schema}.idx_transactions_user_timestamp
+    ON transactions (user_id, timestamp, amount)
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS {schema}.transaction_categories (
+        transaction_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        PRIMARY KEY (transaction_id, category_id)
+    ) WITHOUT ROWID
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS {schema}.idx_transaction_categories_user_category
+    ON transaction_categories (user_id, category_id, transaction_id)
+    """,
+)
+
+
+def archive_path(year):
+    """The archive file for `year`, kept next to DB_NAME."""
+    return f"{os.path.splitext(DB_NAME)[0]}.archive-{year}.db"
+
+
+def attach_archive(conn, year):
+    """
+    Attach the archive file for `year` to conn, creating it if needed, and
+    return its schema name. Must be called outside a transaction.
+    """
+    schema = f"archive_{year}"
+    attached = [row[1] for row in conn.execute("PRAGMA database_list")]
+    if schema in attached:
+        return schema
+    archives = [name for name in attached if name.startswith("archive_")]
+    if len(archives) >= MAX_ATTACHED_ARCHIVES:
+        conn.execute(f"DETACH DATABASE {archives[0]}")
+    conn.execute(f"ATTACH DATABASE ? AS {schema}", (archive_path(year),))
+    # A read-only connection cannot add what an older archive file lacks;
+    # the next writer to attach it will.
+    if not READ_ONLY:
+        for statement in ARCHIVE_SCHEMA:
+            conn.execute(statement.format(schema=schema))
+    return schema
+
+
+def archive_schemas(conn, start=None, end=None, newest_first=True):
+    """
+    Yield the schema name of each archive holding rows with start <= timestamp
+    < end (either bound may be None), newest year first unless newest_first
+    is false, attaching each one just before it is yielded.
+    """
+    first_year = time.gmtime(start).tm_year if start is not None else None
+    last_year = time.gmtime(end - 1).tm_year if end is not None else None
+    years = [row[0] for row in conn.execute(f"""
+    SELECT year FROM archives
+    WHERE (? IS NULL OR year >= ?) AND (? IS NULL OR year <= ?)
+    ORDER BY year {"DESC" if newest_first else "ASC"}
+    """, (first_year, first_year, last_year, last_year))]
+    for year in years:
+        yield attach_archive(conn, year)
+
+
+@profiling.timed
+def initialize_db():
+    """Initialize the SQLite database and apply any pending schema migrations."""
+    # The database file may have been replaced or removed since the pool was
+    # filled, so start from fresh connections.
+    close_connections()
+    migrate(get_connection())
+
+# Verify or repair the trigger-maintained aggregates
+
+
+@profiling.timed
+def check_aggregates():
+    """
+    Compare every aggregate table against a full recomputation.
+
+    Returns {table: number of rows that differ}; all zeros means consistent.
+    """
+    conn = get_connection()
+    mismatches = {}
+    for table in AGGREGATE_TABLES:
+        rebuilt = AGGREGATE_REBUILD_SQL[table]
+        # Users keep their user_balances row (and version) after their last
+        # transaction is deleted, so only rows with transactions are compared.
+        stored = f"SELECT {AGGREGATE_COLUMNS[table]} FROM {table} WHERE transaction_count > 0"
+        mismatches[table] = conn.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM (SELECT * FROM ({rebuilt}) EXCEPT {stored}))
+            + (SELECT COUNT(*) FROM ({stored} EXCEPT SELECT * FROM ({rebuilt})))
+        """).fetchone()[0]
+    return mismatches
+
+
+@profiling.timed
+def rebuild_aggregates():
+    """Recompute all aggregate tables from the transactions table."""
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _rebuild_aggregates(conn.cursor())
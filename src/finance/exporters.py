@@ -0,0 +1,69 @@
+# FileName: exporters.py
+# Description: Streaming export of a user's transactions to CSV and JSON Lines.
+
+import csv
+import itertools
+import json
+import os
+import time
+
+from .data import STREAM_BATCH_SIZE, iter_transactions
+from .profiling import timed
+
+# The CSV header; import_transactions_file reads these columns back.
+CSV_EXPORT_COLUMNS = ("id", "date", "description", "amount", "category")
+EXPORT_FORMATS = ("csv", "jsonl")
+
+
+def write_csv_transactions(handle, rows):
+    """Write (id, date, amount, description, category) rows as CSV; returns the row count."""
+    writer = csv.writer(handle)
+    writer.writerow(CSV_EXPORT_COLUMNS)
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, STREAM_BATCH_SIZE))
+        if not batch:
+            return count
+        writer.writerows((row_id, date, description or "", f"{amount:.2f}", category or "")
+                         for row_id, date, amount, description, category in batch)
+        count += len(batch)
+
+
+def write_jsonl_transactions(handle, rows):
+    """Write (id, date, amount, description, category) rows as JSON Lines; returns the row count."""
+    count = 0
+    while True:
+        batch = list(itertools.islice(rows, STREAM_BATCH_SIZE))
+        if not batch:
+            return count
+        handle.write("".join(
+            json.dumps({"id": row_id, "date": date, "description": description,
+                        "amount": amount, "category": category}) + "\n"
+            for row_id, date, amount, description, category in batch))
+        count += len(batch)
+
+
+@timed
+def export_transactions_file(user_id, path, file_format=None, start=None, end=None,
+                             category=None):
+    """
+    Stream the user's transactions, oldest first, into a CSV or JSON Lines file.
+
+    The format is taken from the file extension unless file_format ("csv" or
+    "jsonl") is given. start, end and category filter the rows as in
+    iter_transactions. Rows are read and written a batch at a time, so
+    memory use is constant however long the history is. Returns a dict with
+    rows, bytes, seconds and rows_per_second.
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip(".").lower()
+    writers = {"csv": write_csv_transactions, "jsonl": write_jsonl_transactions}
+    if file_format not in writers:
+        raise ValueError(f"Unsupported export format: {file_format!r}")
+
+    started = time.perf_counter()
+    with open(path, "w", newline="", encoding="utf-8") as handle:
+        rows = writers[file_format](handle, iter_transactions(user_id, start, end, category))
+    seconds = time.perf_counter() - started
+    return {"rows": rows, "bytes": os.path.getsize(path), "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0}
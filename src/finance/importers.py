@@ -0,0 +1,171 @@
+# FileName: importers.py
+# Description: Streaming import of bank history from CSV and OFX/QFX exports.
+
+import csv
+import datetime
+import functools
+import html
+import os
+import re
+import time
+
+from .data import add_transactions_bulk
+from .profiling import timed
+
+IMPORT_DEFAULT_CATEGORY = "Uncategorized"
+CSV_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y%m%d")
+CSV_COLUMN_ALIASES = {
+    "date": ("date", "posted date", "transaction date", "posting date"),
+    "description": ("description", "payee", "name", "memo"),
+    "amount": ("amount",),
+    "debit": ("debit", "withdrawal"),
+    "credit": ("credit", "deposit"),
+    "category": ("category",),
+}
+OFX_TAG_PATTERN = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+OFX_READ_SIZE = 64 * 1024
+
+
+def _parse_import_amount(text):
+    """Parse "$1,234.50", "-12.00" or "(12.00)" into a float."""
+    text = text.strip().replace("$", "").replace(",", "")
+    if text.startswith("(") and text.endswith(")"):
+        return -float(text[1:-1])
+    return float(text)
+
+
+# Bank exports repeat the same few thousand dates, so parsed dates are memoized
+# (already in their stored ISO-8601 form).
+@functools.lru_cache(maxsize=65536)
+def _parse_csv_date(text):
+    text = text.strip()
+    try:
+        return datetime.datetime.fromisoformat(text).isoformat()
+    except ValueError:
+        pass
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).isoformat()
+        except ValueError:
+            pass
+    raise ValueError(f"Unrecognized date: {text!r}")
+
+
+def _parse_ofx_date(text):
+    """
+    Parse an OFX date such as 20250131120000.000[-5:EST]. The bracketed
+    offset is in hours from UTC; without one the time is already UTC, as
+    OFX specifies.
+    """
+    digits, _, zone = text.partition("[")
+    date = datetime.datetime.strptime(
+        digits.split(".")[0].strip()[:14].ljust(14, "0"), "%Y%m%d%H%M%S")
+    offset = zone.split(":")[0].rstrip("]").strip()
+    if offset:
+        date = date.replace(tzinfo=datetime.timezone(datetime.timedelta(hours=float(offset))))
+    return date
+
+
+def iter_csv_transactions(handle):
+    """
+    Yield (amount, description, category, date) rows from a bank CSV export.
+
+    The header row names the columns; a signed "Amount" column or separate
+    "Debit"/"Credit" columns are accepted, and "Category" is optional.
+    """
+    reader = csv.reader(handle)
+    header = [name.strip().lower() for name in next(reader, [])]
+    columns = {}
+    for field, aliases in CSV_COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias in header:
+                columns[field] = header.index(alias)
+                break
+    if "date" not in columns or "description" not in columns or not (
+            "amount" in columns or "debit" in columns or "credit" in columns):
+        raise ValueError("CSV needs date, description and amount (or debit/credit) columns.")
+
+    for line_number, record in enumerate(reader, start=2):
+        if not any(record):
+            continue
+        try:
+            if "amount" in columns:
+                amount = _parse_import_amount(record[columns["amount"]])
+            else:
+                debit = record[columns["debit"]].strip() if "debit" in columns else ""
+                credit = record[columns["credit"]].strip() if "credit" in columns else ""
+                amount = (_parse_import_amount(credit) if credit else 0.0) - \
+                    (abs(_parse_import_amount(debit)) if debit else 0.0)
+            date = _parse_csv_date(record[columns["date"]])
+        except (ValueError, IndexError) as error:
+            raise ValueError(f"Line {line_number}: {error}") from None
+        category = record[columns["category"]].strip() if "category" in columns else ""
+        yield (amount, record[columns["description"]].strip(),
+               category or IMPORT_DEFAULT_CATEGORY, date)
+
+
+def _iter_ofx_tags(handle):
+    """Yield (is_closing, TAG, value) from an OFX file, reading it in fixed-size chunks."""
+    buffer = ""
+    while True:
+        chunk = handle.read(OFX_READ_SIZE)
+        if not chunk:
+            break
+        buffer += chunk
+        # Only scan up to the last "<" so a tag split across chunks is kept whole.
+        cut = buffer.rfind("<")
+        if cut <= 0:
+            continue
+        for match in OFX_TAG_PATTERN.finditer(buffer, 0, cut):
+            yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+        buffer = buffer[cut:]
+    for match in OFX_TAG_PATTERN.finditer(buffer):
+        yield match.group(1) == "/", match.group(2).upper(), match.group(3).strip()
+
+
+def iter_ofx_transactions(handle):
+    """Yield (amount, description, category, date) rows from the STMTTRN records of an OFX/QFX file."""
+    fields = None
+    for is_closing, tag, value in _iter_ofx_tags(handle):
+        if tag == "STMTTRN":
+            if not is_closing:
+                fields = {}
+                continue
+            if fields is None:
+                continue
+            try:
+                amount = _parse_import_amount(fields["TRNAMT"])
+                date = _parse_ofx_date(fields["DTPOSTED"])
+            except (KeyError, ValueError) as error:
+                raise ValueError(f"Invalid OFX transaction {fields.get('FITID', '')}: {error}") from None
+            description = html.unescape(fields.get("NAME") or fields.get("MEMO", ""))
+            yield amount, description, IMPORT_DEFAULT_CATEGORY, date
+            fields = None
+        elif fields is not None and not is_closing:
+            fields[tag] = value
+
+
+@timed
+def import_transactions_file(user_id, path, file_format=None):
+    """
+    Stream a CSV or OFX/QFX bank export into the user's transactions.
+
+    The format is taken from the file extension unless file_format ("csv" or
+    "ofx") is given. The file is parsed lazily and inserted in batches inside
+    one database transaction, so memory use is constant and a bad row leaves
+    the database untouched. Returns a dict with rows, seconds and
+    rows_per_second.
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip(".").lower()
+    parsers = {"csv": iter_csv_transactions, "ofx": iter_ofx_transactions,
+               "qfx": iter_ofx_transactions}
+    if file_format not in parsers:
+        raise ValueError(f"Unsupported import format: {file_format!r}")
+
+    start = time.perf_counter()
+    with open(path, newline="", encoding="utf-8-sig", errors="replace") as handle:
+        rows = add_transactions_bulk(user_id, parsers[file_format](handle))
+    seconds = time.perf_counter() - start
+    return {"rows": rows, "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else 0.0}
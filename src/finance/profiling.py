@@ -0,0 +1,230 @@
+# FileName: profiling.py
+# Description: Opt-in timing of SQL statements, data functions and GUI refreshes.
+
+import functools
+import json
+import re
+import sqlite3
+import threading
+import time
+
+# Upper bounds, in milliseconds, of the latency histogram buckets; a last
+# bucket catches everything slower.
+HISTOGRAM_BOUNDS_MS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50,
+                       100, 200, 500, 1000, 2000, 5000)
+# Placeholder lists such as "IN (?, ?, ?)" vary in length with the batch; they
+# are folded together so each query keeps one entry.
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+_enabled = False
+_lock = threading.Lock()
+_queries = {}     # normalized SQL -> stats
+_functions = {}   # qualified function name -> stats
+_statements = {}  # leading SQL keyword -> count, from the trace callback
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable_profiling():
+    """
+    Start recording. Connections opened from now on are profiled; threads
+    that already hold one switch over on their next get_connection().
+    """
+    global _enabled
+    _enabled = True
+
+
+def disable_profiling():
+    """Stop recording; what was recorded so far is kept until reset_profile()."""
+    global _enabled
+    _enabled = False
+
+
+def reset_profile():
+    with _lock:
+        _queries.clear()
+        _functions.clear()
+        _statements.clear()
+
+
+def normalize_sql(sql):
+    return _PLACEHOLDER_LIST.sub("?, ...", " ".join(sql.split()))
+
+
+def _new_stats():
+    return {"calls": 0, "rows": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "histogram": [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)}
+
+
+def _record(table, name, milliseconds, rows=0):
+    bucket = 0
+    while bucket < len(HISTOGRAM_BOUNDS_MS) and milliseconds > HISTOGRAM_BOUNDS_MS[bucket]:
+        bucket += 1
+    with _lock:
+        stats = table.get(name)
+        if stats is None:
+            stats = table[name] = _new_stats()
+        stats["calls"] += 1
+        stats["rows"] += rows
+        stats["total_ms"] += milliseconds
+        stats["max_ms"] = max(stats["max_ms"], milliseconds)
+        stats["histogram"][bucket] += 1
+
+
+def record_statement(sql):
+    """Trace callback: count every statement SQLite starts, by its first keyword."""
+    # The traced text has the parameters filled in, so only the keyword is
+    # kept. This also counts the BEGIN and COMMIT statements sqlite3 issues
+    # on its own, which never pass through execute().
+    keyword = sql.split(None, 1)[0].upper() if sql.strip() else ""
+    with _lock:
+        _statements[keyword] = _statements.get(keyword, 0) + 1
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """
+    Cursor that records each query's time and row count, from execute()
+    until its rows have been fetched (or the cursor is dropped).
+    """
+
+    _query = None
+
+    def _start(self, sql):
+        self._flush()
+        self._query = normalize_sql(sql)
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _flush(self):
+        if self._query is not None:
+            _record(_queries, self._query, self._elapsed * 1000, self._rows)
+            self._query = None
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._query is not None:
+                self._elapsed += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        self._timed(super().execute, sql, parameters)
+        if self.description is None:  # Not a query; nothing left to fetch
+            self._rows = max(self.rowcount, 0)
+            self._flush()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        self._timed(super().executemany, sql, seq_of_parameters)
+        self._rows = max(self.rowcount, 0)
+        self._flush()
+        return self
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._flush()
+        elif self._query is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if self._query is not None:
+            self._rows += len(rows)
+        if len(rows) < size:
+            self._flush()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._query is not None:
+            self._rows += len(rows)
+        self._flush()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
+
+    def close(self):
+        self._flush()
+        super().close()
+
+    def __del__(self):
+        self._flush()
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of execute(), are ProfilingCursors."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def timed(func):
+    """Decorator recording each call of func while profiling is enabled."""
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _record(_functions, name, (time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+def _summarize(table):
+    summary = {}
+    for name, stats in sorted(table.items(), key=lambda item: -item[1]["total_ms"]):
+        labels = [f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS]
+        labels.append(f">{HISTOGRAM_BOUNDS_MS[-1]}ms")
+        summary[name] = {
+            "calls": stats["calls"],
+            "rows": stats["rows"],
+            "total_ms": round(stats["total_ms"], 3),
+            "mean_ms": round(stats["total_ms"] / stats["calls"], 4),
+            "max_ms": round(stats["max_ms"], 3),
+            "histogram": {label: count for label, count
+                          in zip(labels, stats["histogram"]) if count},
+        }
+    return summary
+
+
+def profile_report():
+    """
+    Return everything recorded so far: per-query and per-function stats
+    (calls, rows, total/mean/max milliseconds and a latency histogram),
+    slowest total first, and the traced statement counts.
+    """
+    with _lock:
+        return {"queries": _summarize(_queries),
+                "functions": _summarize(_functions),
+                "statements": dict(sorted(_statements.items()))}
+
+
+def export_profile(path):
+    """Write profile_report() to `path` as JSON."""
+    with open(path, "w") as handle:
+        json.dump(profile_report(), handle, indent=2)
@@ -0,0 +1,199 @@
+# FileName: reports.py
+# Description: Headless batch rendering of per-user statements to PNG or PDF.
+#   Usage: python -m src.finance [--db FILE] reports OUTPUT_DIR [--format png|pdf] ...
+#   Imported on its own, like analytics, so the rest of the data layer does not
+#   pay for importing Matplotlib.
+
+import concurrent.futures
+import multiprocessing
+import os
+import re
+import time
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from . import analytics, database
+from .data import calculate_total_balance, load_category_breakdown
+from .profiling import timed
+
+REPORT_FORMATS = ("png", "pdf")
+# A4 landscape.
+REPORT_SIZE_INCHES = (11.69, 8.27)
+REPORT_DPI = 100
+# Users handed to a worker at a time, at most; fewer when there are few users.
+MAX_CHUNK_SIZE = 16
+
+
+def report_filename(user_id, username, file_format):
+    """File name of a user's report: zero-padded id, then the username made path-safe."""
+    return f"{user_id:06d}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', username)}.{file_format}"
+
+
+def get_users(usernames=None):
+    """Return (id, username) of every user, or of those named, in id order."""
+    conn = database.get_connection()
+    if usernames is None:
+        return conn.execute("SELECT id, username FROM users ORDER BY id").fetchall()
+    rows = conn.execute(f"""
+    SELECT id, username FROM users WHERE username IN ({", ".join("?" * len(usernames))})
+    ORDER BY id
+    """, list(usernames)).fetchall()
+    missing = set(usernames) - {username for _, username in rows}
+    if missing:
+        raise ValueError(f"No such user(s): {', '.join(sorted(missing))}")
+    return rows
+
+
+def _draw_pie(ax, amounts, labels, title, empty_text):
+    if not amounts:
+        ax.text(0.5, 0.5, empty_text, ha="center", va="center", fontsize=12, color="gray")
+        ax.set_axis_off()
+        return
+    ax.pie(amounts, labels=labels, autopct="%1.1f%%", startangle=140)
+    ax.set_title(title)
+
+
+def _period_label(start, end):
+    if start is None and end is None:
+        return "All transactions"
+    if end is None:
+        return f"From {start}"
+    if start is None:
+        return f"Before {end}"
+    return f"{start} to before {end}"
+
+
+def render_user_report(user_id, username, path, file_format=None, start=None, end=None):
+    """
+    Render one user's income and expense breakdown and statement summary
+    (opening and closing balance, income, expenses and a month-by-month
+    chart) for start <= date < end into `path`, as PNG or PDF. The format is
+    taken from the file extension unless file_format is given. Draws on a
+    bare Agg canvas, so no display or GUI toolkit is needed. Returns the
+    number of transactions in the period.
+    """
+    if file_format is None:
+        file_format = os.path.splitext(path)[1].lstrip(".").lower()
+    if file_format not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {file_format!r}")
+
+    breakdown = load_category_breakdown(user_id, start, end)
+    columns = analytics.load_columns(user_id, start, end)
+    rollup = analytics.monthly_rollup(columns)
+    opening = calculate_total_balance(user_id, end=start) if start is not None else 0
+    income = rollup["income"].sum() / 100
+    expense = rollup["expense"].sum() / 100
+
+    figure = Figure(figsize=REPORT_SIZE_INCHES, dpi=REPORT_DPI)
+    FigureCanvasAgg(figure)
+    figure.suptitle(f"Statement for {username}: {_period_label(start, end)}", fontsize=14)
+    grid = figure.add_gridspec(2, 3)
+
+    _draw_pie(figure.add_subplot(grid[0, 0]),
+              [total for _, total in breakdown if total > 0],
+              [name or "Uncategorized" for name, total in breakdown if total > 0],
+              "Income Breakdown", "No Income Data")
+    _draw_pie(figure.add_subplot(grid[0, 1]),
+              [-total for _, total in breakdown if total < 0],
+              [name or "Uncategorized" for name, total in breakdown if total < 0],
+              "Expense Breakdown", "No Expense Data")
+
+    summary = figure.add_subplot(grid[0, 2])
+    summary.set_axis_off()
+    summary.set_title("Summary")
+    lines = [("Opening balance", f"${opening:,.2f}"),
+             ("Income", f"${income:,.2f}"),
+             ("Expenses", f"${-expense:,.2f}"),
+             ("Closing balance", f"${opening + income + expense:,.2f}"),
+             ("Transactions", f"{len(columns):,}")]
+    for row, (label, value) in enumerate(lines):
+        y = 0.85 - row * 0.15
+        summary.text(0.0, y, label, fontsize=11, transform=summary.transAxes)
+        summary.text(1.0, y, value, fontsize=11, ha="right", transform=summary.transAxes)
+
+    monthly = figure.add_subplot(grid[1, :])
+    if len(columns):
+        # Each month's totals span the month; one filled step line per series
+        # draws as a single shape, where bars would be a patch per month.
+        edges = np.append(rollup["months"], rollup["months"][-1] + 1)
+        edges = edges.astype("datetime64[D]").astype(object)
+        monthly.stairs(rollup["income"] / 100, edges, fill=True, color="tab:green",
+                       alpha=0.7, label="Income")
+        monthly.stairs(rollup["expense"] / 100, edges, fill=True, color="tab:red",
+                       alpha=0.7, label="Expenses")
+        monthly.axhline(0, color="black", linewidth=0.8)
+        monthly.set_ylabel("Per month")
+        balance = monthly.twinx()
+        balance.plot(edges[1:], opening + np.cumsum(rollup["net"]) / 100, color="tab:blue",
+                     marker="o", markersize=3, label="Balance at month end")
+        balance.set_ylabel("Balance")
+        handles = monthly.get_legend_handles_labels()
+        extra = balance.get_legend_handles_labels()
+        monthly.legend(handles[0] + extra[0], handles[1] + extra[1], loc="upper left", fontsize="small")
+    else:
+        monthly.text(0.5, 0.5, "No transactions in this period", ha="center", va="center",
+                     fontsize=12, color="gray", transform=monthly.transAxes)
+        monthly.set_axis_off()
+    monthly.set_title("Income, Expenses and Balance by Month")
+
+    figure.savefig(path, format=file_format)
+    return len(columns)
+
+
+def _start_worker(db_name):
+    """Process pool initializer: use the same database, read-only."""
+    database.DB_NAME = db_name
+    database.READ_ONLY = True
+
+
+def _render(task):
+    """Render one report in a worker; returns (username, error message or None)."""
+    user_id, username, path, file_format, start, end = task
+    try:
+        render_user_report(user_id, username, path, file_format, start, end)
+    except Exception as error:  # One bad report must not end the batch
+        return username, f"{type(error).__name__}: {error}"
+    return username, None
+
+
+@timed
+def generate_reports(output_dir, file_format="png", start=None, end=None, workers=None,
+                     usernames=None):
+    """
+    Render a report (see render_user_report) for every user, or only those
+    in `usernames`, into output_dir, named by report_filename.
+
+    Users are spread over `workers` processes (default: one per CPU core),
+    each rendering on its own Agg canvas with its own read-only connection,
+    so the batch scales with cores and can run while the database is in use.
+    A report that fails is recorded and the rest carry on. Returns a dict
+    with reports, failed ({username: error}), seconds and reports_per_second.
+    """
+    if file_format not in REPORT_FORMATS:
+        raise ValueError(f"Unsupported report format: {file_format!r}")
+    users = get_users(usernames)
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(user_id, username,
+              os.path.join(output_dir, report_filename(user_id, username, file_format)),
+              file_format, start, end)
+             for user_id, username in users]
+    workers = workers or os.cpu_count() or 1
+    chunk_size = max(1, min(MAX_CHUNK_SIZE, len(tasks) // (workers * 4)))
+
+    started = time.perf_counter()
+    failed = {}
+    if tasks:
+        # Spawned rather than forked, so no worker inherits the parent's connections.
+        with concurrent.futures.ProcessPoolExecutor(
+                min(workers, len(tasks)), mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_worker, initargs=(os.path.abspath(database.DB_NAME),)) as pool:
+            for username, error in pool.map(_render, tasks, chunksize=chunk_size):
+                if error is not None:
+                    failed[username] = error
+    seconds = time.perf_counter() - started
+    reports = len(tasks) - len(failed)
+    return {"reports": reports, "failed": failed, "seconds": seconds,
+            "reports_per_second": reports / seconds if seconds else 0.0}
+
@@ -0,0 +1,305 @@
+# FileName: server.py
+# Description: Local HTTP/JSON API over the data layer, for many users at once.
+#   Usage: python -m src.finance [--db FILE] serve [--host H] [--port N] [--workers N]
+
+import asyncio
+import concurrent.futures
+import functools
+import itertools
+import json
+import secrets
+import time
+import urllib.parse
+
+from .data import (
+    add_transaction, calculate_total_balance, create_user, delete_transactions,
+    iter_transactions, load_category_breakdown, verify_user
+)
+from .database import close_connections
+
+# Threads running data-layer calls; each one keeps its own pooled connection.
+DEFAULT_WORKERS = 8
+# Idle sessions are dropped after this long.
+SESSION_TTL_SECONDS = 12 * 60 * 60
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+# Rows GET /transactions returns when the request gives no limit, and at most.
+DEFAULT_TRANSACTION_LIMIT = 1000
+MAX_TRANSACTION_LIMIT = 100_000
+STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 401: "Unauthorized",
+               404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+               413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    """Ends a request with an HTTP error status and a JSON {"error": message} body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ApiServer:
+    """
+    Serves the data layer over HTTP/1.1 with JSON bodies.
+
+    Users sign in with POST /sessions and pass the returned token as
+    "Authorization: Bearer <token>"; every other call acts on that token's
+    user, so any number of users can share one server and one database.
+    Connections are kept alive between requests. SQLite calls never run on
+    the event loop: they are handed to a pool of worker threads, each with
+    its own connection from the data layer's per-thread pool.
+
+        POST   /users          {"username", "password"}          create a user
+        POST   /sessions       {"username", "password"}          -> {"token"}
+        DELETE /sessions                                         sign out
+        GET    /transactions   ?start=&end=&category=&limit=     oldest first,
+                               &after_date=&after_id=            -> {"transactions", "next"}
+        POST   /transactions   {"amount", "description", "category", "date"}
+        DELETE /transactions   {"ids": [...]}                    -> {"deleted"}
+        GET    /balance        ?start=&end=
+        GET    /breakdown      ?start=&end=
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="ApiServer")
+        self._sessions = {}  # token -> [user id, expiry]; only touched on the loop
+        self._routes = {
+            ("POST", "/users"): self.create_user,
+            ("POST", "/sessions"): self.sign_in,
+            ("DELETE", "/sessions"): self.sign_out,
+            ("GET", "/transactions"): self.list_transactions,
+            ("POST", "/transactions"): self.add_transaction,
+            ("DELETE", "/transactions"): self.delete_transactions,
+            ("GET", "/balance"): self.balance,
+            ("GET", "/breakdown"): self.breakdown,
+        }
+        self._server = None
+
+    async def start(self, host="127.0.0.1", port=8080):
+        """Start listening; returns the (host, port) actually bound."""
+        self._server = await asyncio.start_server(self._serve_client, host, port)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown()
+        close_connections()
+
+    async def _call(self, func, *args, **kwargs):
+        """Run a data-layer call on a worker thread."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs))
+
+    # Requests
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                status, payload = await self._dispatch(method, target, headers, body)
+                keep_alive = headers.get("connection", "").lower() != "close"
+                self._write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ApiError as error:  # The request could not be read; answer and hang up
+            self._write_response(writer, error.status, {"error": str(error)}, False)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        """Return (method, target, headers, body), or None once the client is done."""
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, target, _ = line.decode("latin-1").split()
+        except ValueError:
+            raise ApiError(400, "Malformed request line") from None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise ApiError(400, "Too many headers")
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise ApiError(400, "Invalid Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            raise ApiError(413, "Request body too large")
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method.upper(), target, headers, body
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urllib.parse.urlsplit(target)
+        query = {name: values[-1] for name, values
+                 in urllib.parse.parse_qs(url.query, keep_blank_values=True).items()}
+        handler = self._routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self._routes):
+                return 405, {"error": f"{method} is not allowed on {url.path}"}
+            return 404, {"error": f"No such resource: {url.path}"}
+        try:
+            if body:
+                try:
+                    body = json.loads(body)
+                except ValueError:
+                    raise ApiError(400, "Body is not valid JSON") from None
+                if not isinstance(body, dict):
+                    raise ApiError(400, "Body must be a JSON object")
+            return await handler(headers=headers, query=query, body=body or {})
+        except ApiError as error:
+            return error.status, {"error": str(error)}
+        except (ValueError, TypeError) as error:  # Bad dates, amounts and the like
+            return 400, {"error": str(error)}
+        except Exception as error:
+            return 500, {"error": f"{type(error).__name__}: {error}"}
+
+    def _user_id(self, headers):
+        """The signed-in user of a request; raises ApiError(401) without a live session."""
+        scheme, _, token = headers.get("authorization", "").partition(" ")
+        session = self._sessions.get(token) if scheme.lower() == "bearer" else None
+        now = time.monotonic()
+        if session is None or session[1] < now:
+            self._sessions.pop(token, None)
+            raise ApiError(401, "Sign in with POST /sessions and send the token "
+                                "as 'Authorization: Bearer <token>'")
+        session[1] = now + SESSION_TTL_SECONDS
+        return session[0]
+
+    @staticmethod
+    def _fields(body, *names):
+        missing = [name for name in names if name not in body]
+        if missing:
+            raise ApiError(400, f"Missing field(s): {', '.join(missing)}")
+        return [body[name] for name in names]
+
+    # Endpoints
+
+    async def create_user(self, headers, query, body):
+        username, password = self._fields(body, "username", "password")
+        if not username or not password:
+            raise ApiError(400, "Username and password must not be empty")
+        if not await self._call(create_user, str(username), str(password)):
+            raise ApiError(409, "Username already exists")
+        return 201, {"username": username}
+
+    async def sign_in(self, headers, query, body):
+        username, password = self._fields(body, "username", "password")
+        user_id = await self._call(verify_user, str(username), str(password))
+        if user_id is None:
+            raise ApiError(401, "Invalid username or password")
+        now = time.monotonic()
+        # Expired sessions are swept whenever someone signs in.
+        for token in [token for token, (_, expiry) in self._sessions.items() if expiry < now]:
+            del self._sessions[token]
+        token = secrets.token_urlsafe(32)
+        self._sessions[token] = [user_id, now + SESSION_TTL_SECONDS]
+        return 201, {"token": token, "expires_in": SESSION_TTL_SECONDS}
+
+    async def sign_out(self, headers, query, body):
+        self._user_id(headers)
+        del self._sessions[headers["authorization"].partition(" ")[2]]
+        return 200, {}
+
+    async def list_transactions(self, headers, query, body):
+        user_id = self._user_id(headers)
+        limit = max(min(int(query.get("limit", DEFAULT_TRANSACTION_LIMIT)),
+                        MAX_TRANSACTION_LIMIT), 1)
+        # Pages are keyset-addressed: "next" holds the after_date and
+        # after_id of the page's last row, or is null on the last page.
+        after = None
+        if "after_date" in query or "after_id" in query:
+            if "after_date" not in query or "after_id" not in query:
+                raise ApiError(400, "after_date and after_id go together")
+            after = (query["after_date"], int(query["after_id"]))
+
+        def load():
+            rows = iter_transactions(user_id, query.get("start"), query.get("end"),
+                                     query.get("category"), after=after)
+            return list(itertools.islice(rows, limit + 1))
+        rows = await self._call(load)
+        following = None
+        if len(rows) > limit:
+            del rows[limit:]
+            following = {"after_date": rows[-1][1], "after_id": rows[-1][0]}
+        return 200, {"transactions": [
+            {"id": row_id, "date": date, "amount": amount, "description": description,
+             "category": category}
+            for row_id, date, amount, description, category in rows], "next": following}
+
+    async def add_transaction(self, headers, query, body):
+        user_id = self._user_id(headers)
+        amount, description, category = self._fields(body, "amount", "description", "category")
+        if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+            raise ApiError(400, "amount must be a number")
+        date = body.get("date")
+        if date is not None:  # Anything but ISO-8601 is refused with a 400
+            date = str(date)
+        transaction_id = await self._call(add_transaction, user_id, amount, str(description),
+                                          str(category), date)
+        return 201, {"id": transaction_id}
+
+    async def delete_transactions(self, headers, query, body):
+        user_id = self._user_id(headers)
+        ids, = self._fields(body, "ids")
+        if not isinstance(ids, list) or not all(
+                isinstance(value, int) and not isinstance(value, bool) for value in ids):
+            raise ApiError(400, "ids must be a list of transaction ids")
+        deleted = await self._call(delete_transactions, user_id, ids)
+        return 200, {"deleted": [row[0] for row in deleted]}
+
+    async def balance(self, headers, query, body):
+        user_id = self._user_id(headers)
+        balance = await self._call(calculate_total_balance, user_id,
+                                   query.get("start"), query.get("end"))
+        return 200, {"balance": balance}
+
+    async def breakdown(self, headers, query, body):
+        user_id = self._user_id(headers)
+        rows = await self._call(load_category_breakdown, user_id,
+                                query.get("start"), query.get("end"))
+        return 200, {"categories": [{"category": name, "total": total} for name, total in rows]}
+
+
+def serve(host="127.0.0.1", port=8080, workers=DEFAULT_WORKERS):
+    """Run an ApiServer until interrupted."""
+    async def run():
+        server = ApiServer(workers)
+        bound = await server.start(host, port)
+        print(f"Serving the finance API on http://{bound[0]}:{bound[1]}/ "
+              f"({workers} database workers)")
+        try:
+            await server.serve_forever()
+        finally:
+            await server.close()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
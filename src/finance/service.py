@@ -0,0 +1,105 @@
+# FileName: service.py
+# Description: Background worker that runs data-layer calls off the GUI thread.
+
+import queue
+import threading
+
+from .database import get_connection
+
+
+class DataService:
+    """
+    Runs data-layer calls on a background thread so the Tk mainloop never
+    waits on SQLite.
+
+    submit() queues a call; the results are handed back by poll(), which
+    the GUI runs from root.after, so callbacks always execute on the Tk
+    thread. Calls run one at a time, in submission order, which keeps a
+    write and the refresh queued after it in sequence.
+
+    A call submitted with a key supersedes any earlier call with the same
+    key: if that call has not started it is skipped, if it is running its
+    SQLite statement is interrupted, and either way its result is dropped.
+    """
+
+    def __init__(self):
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._latest = {}      # key -> id of the newest request with that key
+        self._running = None   # (request id, key) being executed
+        self._connection = None
+        self._next_id = 0
+        self.outstanding = 0   # submitted requests whose results are not yet delivered
+        self._thread = threading.Thread(target=self._run, name="DataService", daemon=True)
+        self._thread.start()
+
+    def submit(self, func, args=(), on_done=None, on_error=None, key=None):
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            if key is not None:
+                self._supersede(key)
+                self._latest[key] = request_id
+            self.outstanding += 1
+        self._requests.put((request_id, key, func, args, on_done, on_error))
+        return request_id
+
+    def cancel(self, key):
+        """Drop any pending or running call submitted with `key`."""
+        with self._lock:
+            self._supersede(key)
+            self._latest[key] = None
+
+    def _supersede(self, key):
+        # Called with the lock held, so the worker cannot move on to another
+        # request between the check and the interrupt.
+        if self._running is not None and self._running[1] == key:
+            self._connection.interrupt()
+
+    def _is_current(self, request_id, key):
+        return key is None or self._latest.get(key) == request_id
+
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                break
+            request_id, key, func, args, on_done, on_error = request
+            with self._lock:
+                if not self._is_current(request_id, key):
+                    self._results.put((request_id, key, None, None, None))
+                    continue
+                self._running = (request_id, key)
+                self._connection = get_connection()
+            try:
+                result, error = func(*args), None
+            except Exception as exc:
+                result, error = None, exc
+            with self._lock:
+                self._running = None
+            self._results.put((request_id, key, result, error, (on_done, on_error)))
+
+    def poll(self):
+        """Deliver finished results to their callbacks. Call on the Tk thread."""
+        while True:
+            try:
+                request_id, key, result, error, callbacks = self._results.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self.outstanding -= 1
+                current = callbacks is not None and self._is_current(request_id, key)
+            if not current:
+                continue
+            on_done, on_error = callbacks
+            if error is not None:
+                if on_error is None:
+                    raise error
+                on_error(error)
+            elif on_done is not None:
+                on_done(result)
+
+    def shutdown(self):
+        self._requests.put(None)
+        self._thread.join()
@@ -1,10 +1,41 @@
 import pytest
+import asyncio
 import sqlite3
+import math
 import os
+import subprocess
+import datetime
+import itertools
+import json
+import sys
+import threading
+import time
+import urllib.parse
 from src.PersonalFinanceApp import (
     initialize_db, create_user, verify_user, add_transaction,
-    load_transactions, calculate_total_balance, hash_password
+    load_transactions, calculate_total_balance, hash_password,
+    draw_pie, find_wedge
 )
+from src.finance import (
+    get_connection, load_statement, close_connections, SCHEMA_VERSION,
+    add_transactions_bulk, import_transactions_file,
+    load_category_breakdown, load_monthly_totals, check_aggregates,
+    rebuild_aggregates, load_transactions_page, DataService,
+    get_data_version, load_changed_breakdown, delete_transactions, load_category_transactions,
+    load_category_transactions_page, enable_profiling, disable_profiling, reset_profile,
+    profile_report, export_profile, search_transactions, to_timestamp,
+    archive_transactions, archive_path, export_transactions_file, iter_transactions,
+    clear_read_cache, read_cache_stats, load_balance_history, load_changed_balance_history,
+    create_snapshot, list_snapshots, BackupError
+)
+from src.finance import analytics
+from src.finance.cache import VersionedCache
+import src.finance.database
+from src.finance.__main__ import main as finance_cli
+from benchmarks.__main__ import main as benchmark_cli
+from benchmarks.synthetic import generate_transactions, user_sizes
+from benchmarks.load_test import Client, load_test
+from src.finance.server import ApiServer
 DB_NAME = "finance_manager.db"
 
 
@@ -14,7 +45,11 @@ def setup_db():
     initialize_db()
     yield
     # Teardown: Remove the test database
+    close_connections()
     os.remove(DB_NAME)
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(DB_NAME + suffix):
+            os.remove(DB_NAME + suffix)
 
 
 def test_initialize_db(setup_db):
@@ -58,6 +93,10 @@ def test_add_transaction(setup_db):
     transactions = load_transactions(user_id)
     assert len(transactions) == 1
     assert transactions[0][0] == 100.0
+    # Stored as naive UTC, like dates given with an offset
+    stored = datetime.datetime.fromisoformat(transactions[0][3])
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    assert abs(now - stored) < datetime.timedelta(minutes=1)
     assert transactions[0][1] == "Test Income"
     assert transactions[0][2] == "Income"
 
@@ -74,3 +113,1041 @@ def test_calculate_total_balance(setup_db):
     add_transaction(user_id, -50.0, "Test Expense", "Expense")
     balance = calculate_total_balance(user_id)
     assert balance == 50.0
+
+
+def test_connection_is_shared_and_uses_wal(setup_db):
+    # Repeated calls on one thread reuse the same connection
+    conn = get_connection()
+    assert get_connection() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # Other threads get a connection of their own
+    other = []
+    thread = threading.Thread(target=lambda: other.append(get_connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_schema_is_versioned_and_indexed(setup_db):
+    conn = get_connection()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+    plan = conn.execute("""
+    EXPLAIN QUERY PLAN
+    SELECT amount, description, category, date FROM transactions WHERE user_id = ?
+    ORDER BY date DESC
+    """, (1,)).fetchall()
+    assert "idx_transactions_user_date" in str(plan)
+    assert not conn.execute("""
+    SELECT 1 FROM sqlite_master WHERE name = 'idx_transactions_user_category'
+    """).fetchone()
+
+
+def test_changed_trigger_definitions_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "triggers.db"))
+    initialize_db()
+    with get_connection() as conn:
+        conn.execute("DROP TRIGGER transactions_version_update")
+        conn.execute("UPDATE trigger_definitions SET digest = 'outdated'")
+    initialize_db()
+    conn = get_connection()
+    assert conn.execute("""
+    SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'transactions_version_update'
+    """).fetchone()
+    assert conn.execute("SELECT digest FROM trigger_definitions").fetchall() == [
+        (src.finance.database.TRIGGERS_DIGEST,)]
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    close_connections()
+
+
+def test_add_transactions_bulk(setup_db):
+    create_user("bulkuser", "bulkpassword")
+    user_id = verify_user("bulkuser", "bulkpassword")
+
+    rows = ((float(i), f"Row {i}", "Bills", f"2020-01-01T00:00:{i % 60:02d}")
+            for i in range(2500))
+    assert add_transactions_bulk(user_id, rows, batch_size=1000) == 2500
+    transactions = load_transactions(user_id)
+    assert len(transactions) == 2500
+    assert transactions[-1][3].startswith("2020-01-01")
+
+    # A bad row rolls back the whole batch
+    with pytest.raises(sqlite3.IntegrityError):
+        add_transactions_bulk(user_id, [(1.0, "ok", "Bills", None),
+                                        (None, "bad", "Bills", None)])
+    assert len(load_transactions(user_id)) == 2500
+
+
+def test_import_csv_and_ofx(setup_db, tmp_path):
+    create_user("importuser", "importpassword")
+    user_id = verify_user("importuser", "importpassword")
+
+    csv_file = tmp_path / "bank.csv"
+    csv_file.write_text(
+        "Date,Description,Debit,Credit\n"
+        "01/15/2024,Paycheck,,\"$1,500.00\"\n"
+        "01/16/2024,Groceries,42.10,\n")
+    result = import_transactions_file(user_id, str(csv_file))
+    assert result["rows"] == 2
+    assert result["rows_per_second"] > 0
+
+    ofx_file = tmp_path / "bank.ofx"
+    ofx_file.write_text(
+        "OFXHEADER:100\n<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>\n"
+        "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240201120000[-5:EST]"
+        "<TRNAMT>-9.99<FITID>1<NAME>Streaming &amp; Co</STMTTRN>\n"
+        "</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n")
+    assert import_transactions_file(user_id, str(ofx_file))["rows"] == 1
+
+    transactions = load_transactions(user_id)
+    assert [t[:2] for t in transactions] == [
+        (-9.99, "Streaming & Co"), (-42.10, "Groceries"), (1500.0, "Paycheck")]
+    # Noon EST is stored as UTC, like every other date
+    assert transactions[0][3] == "2024-02-01T17:00:00"
+
+
+def test_aggregates_follow_inserts_updates_and_deletes(setup_db):
+    create_user("aggregateuser", "aggregatepassword")
+    user_id = verify_user("aggregateuser", "aggregatepassword")
+    add_transaction(user_id, 0.1, "Interest", "Investment", "2024-03-01T00:00:00")
+    add_transaction(user_id, 0.2, "Interest", "Investment", "2024-03-02T00:00:00")
+    bill_id = add_transaction(user_id, -30.0, "Power", "Bills", "2024-04-01T00:00:00")
+    assert get_connection().execute(
+        "SELECT description FROM transactions WHERE id = ?", (bill_id,)).fetchone()[0] == "Power"
+    assert calculate_total_balance(user_id) == -29.7
+    assert load_category_breakdown(user_id) == [("Bills", -30.0), ("Investment", 0.3)]
+    assert load_monthly_totals(user_id) == [("2024-03", 0.3, 0.0), ("2024-04", 0.0, -30.0)]
+
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE transactions SET category = 'Pay' WHERE user_id = ? AND amount = 0.2",
+                     (user_id,))
+        conn.execute("DELETE FROM transactions WHERE user_id = ? AND category = 'Bills'",
+                     (user_id,))
+    assert calculate_total_balance(user_id) == 0.3
+    assert load_category_breakdown(user_id) == [("Investment", 0.1), ("Pay", 0.2)]
+    assert load_monthly_totals(user_id) == [("2024-03", 0.3, 0.0)]
+    assert set(check_aggregates().values()) == {0}
+
+
+def test_categories_are_linked_individually(setup_db):
+    create_user("categoryuser", "categorypassword")
+    user_id = verify_user("categoryuser", "categorypassword")
+    trip = add_transaction(user_id, -40.0, "Trip", "Bills, Travel", "2024-03-01T00:00:00")
+    add_transaction(user_id, -10.0, "Train", "Travel", "2024-03-02T00:00:00")
+    add_transaction(user_id, 5.0, "Found", "", "2024-03-03T00:00:00")
+    assert load_category_breakdown(user_id) == [
+        (None, 5.0), ("Bills", -40.0), ("Travel", -50.0)]
+    assert sorted(load_category_transactions(user_id, "Travel")) == [
+        (-40.0, "Trip", "2024-03-01T00:00:00"), (-10.0, "Train", "2024-03-02T00:00:00")]
+    assert load_category_transactions(user_id, None) == [(5.0, "Found", "2024-03-03T00:00:00")]
+    # Other users' rows in the same category stay out of the drill-down
+    add_transaction(verify_user("testuser", "testpassword"), -1.0, "Bus", "Travel")
+    assert len(load_category_transactions(user_id, "Travel")) == 2
+
+    with get_connection() as conn:
+        conn.execute("UPDATE transactions SET category = 'Bills', amount = -30.0 WHERE id = ?",
+                     (trip,))
+    assert load_category_breakdown(user_id) == [
+        (None, 5.0), ("Bills", -30.0), ("Travel", -10.0)]
+    delete_transactions(user_id, [trip])
+    assert load_category_breakdown(user_id) == [(None, 5.0), ("Travel", -10.0)]
+    assert set(check_aggregates().values()) == {0}
+
+
+def test_category_pages_are_sorted_in_the_database(setup_db):
+    create_user("sortuser", "sortpassword")
+    user_id = verify_user("sortuser", "sortpassword")
+    amounts = [-250.0, 3.5, -1.0, 40.0, -7.25, 0.5, 12.0, -99.0]
+    for day, amount in enumerate(amounts, start=1):
+        add_transaction(user_id, amount, f"Item {9 - day}", "Shopping",
+                        f"2024-05-{day:02d}T00:00:00")
+    add_transaction(user_id, 1.0, "Elsewhere", "Pay", "2024-05-01T00:00:00")
+
+    def read_all(sort, descending, limit):
+        rows, after = [], None
+        while True:
+            page = load_category_transactions_page(
+                user_id, "Shopping", limit, sort, descending, after)
+            rows += page
+            if len(page) < limit:
+                return rows
+            after = (page[-1][4], page[-1][0])
+
+    # Signed amounts, not absolute values; both small pages (read in index
+    # order) and one large page (read through the links) agree.
+    for limit in (3, 100):
+        assert [row[1] for row in read_all("amount", False, limit)] == sorted(amounts)
+        assert [row[1] for row in read_all("amount", True, limit)] == sorted(amounts, reverse=True)
+        assert [row[2] for row in read_all("description", False, limit)] == [
+            f"Item {i}" for i in range(1, 9)]
+        assert [row[3][:10] for row in read_all("date", True, limit)] == [
+            f"2024-05-{day:02d}" for day in range(8, 0, -1)]
+    assert load_category_transactions_page(user_id, "Missing", 10) == []
+
+
+def test_rebuild_aggregates_repairs_drift(setup_db):
+    conn = get_connection()
+    with conn:
+        conn.execute("UPDATE user_balances SET balance_cents = balance_cents + 1")
+    assert check_aggregates()["user_balances"] > 0
+    rebuild_aggregates()
+    assert set(check_aggregates().values()) == {0}
+
+
+def test_load_transactions_page_walks_history_by_keyset(setup_db):
+    create_user("pageuser", "pagepassword")
+    user_id = verify_user("pageuser", "pagepassword")
+    # Several rows share each date, so pages must tie-break on id
+    add_transactions_bulk(user_id, ((float(i), f"Row {i}", "Bills",
+                                     f"2024-05-{1 + i % 3:02d}T00:00:00")
+                                    for i in range(25)))
+    expected = [row[0] for row in get_connection().execute(
+        "SELECT id FROM transactions WHERE user_id = ? ORDER BY date DESC, id DESC",
+        (user_id,))]
+
+    pages = [load_transactions_page(user_id, 10)]
+    while len(pages[-1]) == 10:
+        last = pages[-1][-1]
+        pages.append(load_transactions_page(user_id, 10, older_than=(last[4], last[0])))
+    assert [row[0] for page in pages for row in page] == expected
+
+    # Paging back up returns the rows above, still newest first
+    first = pages[1][0]
+    above = load_transactions_page(user_id, 10, newer_than=(first[4], first[0]))
+    assert above == pages[0]
+
+
+def poll_until(service, done, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline:
+        service.poll()
+        time.sleep(0.01)
+
+
+def test_data_service_delivers_results_on_poll(setup_db):
+    service = DataService()
+    user_id = verify_user("testuser", "testpassword")
+    results, errors = [], []
+    service.submit(calculate_total_balance, (user_id,), on_done=results.append)
+    service.submit(verify_user, ("testuser",), on_error=errors.append)
+    poll_until(service, lambda: results and errors)
+    assert results == [calculate_total_balance(user_id)]
+    assert isinstance(errors[0], TypeError)
+    assert service.outstanding == 0
+    service.shutdown()
+
+
+def test_data_service_drops_superseded_requests(setup_db):
+    service = DataService()
+    release = threading.Event()
+    results = []
+    service.submit(release.wait, (5,), on_done=lambda _: results.append("blocked"))
+    service.submit(lambda: "stale", on_done=results.append, key="refresh")
+    service.submit(lambda: "fresh", on_done=results.append, key="refresh")
+    release.set()
+    poll_until(service, lambda: service.outstanding == 0)
+    assert results == ["blocked", "fresh"]
+    service.shutdown()
+
+
+def test_data_version_tracks_changes(setup_db):
+    create_user("versionuser", "versionpassword")
+    user_id = verify_user("versionuser", "versionpassword")
+    assert get_data_version(user_id) == 0
+
+    transaction_id = add_transaction(user_id, 10.0, "Gift", "Other")
+    version, breakdown = load_changed_breakdown(user_id, 0)
+    assert version > 0 and breakdown == [("Other", 10.0)]
+    assert load_changed_breakdown(user_id, version) is None
+
+    # Deleting the last transaction and rebuilding still move the version on
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+    assert get_data_version(user_id) > version
+    before_rebuild = get_data_version(user_id)
+    rebuild_aggregates()
+    assert get_data_version(user_id) > before_rebuild
+    assert set(check_aggregates().values()) == {0}
+
+
+def test_find_wedge_uses_cached_geometry():
+    from matplotlib.figure import Figure
+    ax = Figure().add_subplot()
+    wedges = draw_pie(ax, [75, 25], ["Bills", "Travel"], "Expense Breakdown", "No Data")
+    assert [w[0] for w in wedges] == ["Bills", "Travel"]
+
+    for label, center, radius, theta1, theta2 in wedges:
+        middle = math.radians((theta1 + theta2) / 2)
+        x = center[0] + radius / 2 * math.cos(middle)
+        y = center[1] + radius / 2 * math.sin(middle)
+        assert find_wedge(wedges, x, y) == label
+    # Outside the pie, or outside the axes
+    assert find_wedge(wedges, 5, 5) is None
+    assert find_wedge(wedges, None, None) is None
+    assert draw_pie(ax, [], [], "Income Breakdown", "No Income Data") == []
+
+
+class FakeTree:
+    """Just enough of ttk.Treeview for the statement updates: ordered iids."""
+
+    def __init__(self):
+        self.rows = []
+
+    def insert(self, parent, index, iid, values, tags):
+        self.rows.insert(index, iid)
+
+    def delete(self, *iids):
+        self.rows = [iid for iid in self.rows if iid not in iids]
+
+    def get_children(self):
+        return tuple(self.rows)
+
+    def exists(self, iid):
+        return iid in self.rows
+
+
+class FakeVar:
+    def set(self, value):
+        self.value = value
+
+
+@pytest.fixture
+def statement(monkeypatch):
+    import src.PersonalFinanceApp as app
+    monkeypatch.setattr(app, "statement_tree", FakeTree(), raising=False)
+    monkeypatch.setattr(app, "total_balance_var", FakeVar(), raising=False)
+    monkeypatch.setattr(app, "statement_keys", [])
+    monkeypatch.setattr(app, "statement_has_older", False)
+    monkeypatch.setattr(app, "statement_has_newer", False)
+    monkeypatch.setattr(app, "statement_balance", 0)
+    app.insert_statement_rows([
+        (4, 10.0, "d", "", "2024-03-01"),
+        (3, 10.0, "c", "", "2024-02-01"),
+        (2, 10.0, "b", "", "2024-02-01"),
+        (1, 10.0, "a", "", "2024-01-01"),
+    ], 0)
+    app.statement_balance = 40.0
+    return app
+
+
+def test_statement_position_keeps_newest_first_order(statement):
+    assert statement.statement_position(("2024-04-01", 5)) == 0
+    assert statement.statement_position(("2024-01-15", 5)) == 3
+    assert statement.statement_position(("2023-12-31", 5)) == 4
+    # Ties on the date are broken by id, higher ids first
+    assert statement.statement_position(("2024-02-01", 5)) == 1
+    assert statement.statement_position(("2024-02-01", 1)) == 3
+
+
+def test_statement_rows_are_added_and_removed_in_place(statement):
+    statement.add_statement_row(5, -2.5, "e", "", "2024-02-01")
+    assert statement.statement_tree.get_children() == ("4", "5", "3", "2", "1")
+    assert statement.statement_keys[1] == ("2024-02-01", 5)
+    assert statement.statement_balance == 37.5
+    assert statement.total_balance_var.value == "Total Balance: $37.50"
+
+    statement.remove_statement_rows([(3, 10.0), (5, -2.5)])
+    assert statement.statement_tree.get_children() == ("4", "2", "1")
+    assert [key[1] for key in statement.statement_keys] == [4, 2, 1]
+    assert statement.statement_balance == 30.0
+    assert statement.total_balance_var.value == "Total Balance: $30.00"
+
+    # A row older than the loaded window only moves the balance
+    statement.statement_has_older = True
+    statement.add_statement_row(6, 5.0, "f", "", "2023-06-01")
+    assert statement.statement_tree.get_children() == ("4", "2", "1")
+    assert statement.statement_balance == 35.0
+
+
+def test_polling_outlives_failing_callbacks_and_logouts(setup_db, monkeypatch):
+    import src.PersonalFinanceApp as app
+    scheduled = []
+
+    class FakeRoot:
+        def after(self, delay, callback):
+            scheduled.append(callback)
+    service = DataService()
+    monkeypatch.setattr(app, "root", FakeRoot())
+    monkeypatch.setattr(app, "data_service", service)
+    monkeypatch.setattr(app, "loading_var", FakeVar(), raising=False)
+
+    def broken(result):
+        raise RuntimeError("widget destroyed")
+    service.submit(lambda: 1, on_done=broken)
+    with pytest.raises(RuntimeError):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            app.poll_data_service()
+            time.sleep(0.01)
+    assert scheduled and set(scheduled) == {app.poll_data_service}
+    assert app.loading_var.value == ""
+
+    # Results of calls made before a logout are dropped
+    results = []
+    service.submit(lambda: "before", on_done=app.in_session(results.append))
+    monkeypatch.setattr(app, "login_session", app.login_session + 1)
+    service.submit(lambda: "after", on_done=app.in_session(results.append))
+    poll_until(service, lambda: service.outstanding == 0)
+    assert results == ["after"]
+    service.shutdown()
+
+
+def test_delete_transactions_by_id(setup_db):
+    create_user("deleteuser", "deletepassword")
+    user_id = verify_user("deleteuser", "deletepassword")
+    # Identical rows used to be deleted together by the value match
+    first = add_transaction(user_id, -12.5, "Lunch", "Groceries", "2024-06-01T12:00:00")
+    second = add_transaction(user_id, -12.5, "Lunch", "Groceries", "2024-06-01T12:00:00")
+    bulk_ids = [add_transaction(user_id, 1.0, f"Row {i}", "Other") for i in range(1200)]
+    other_user = verify_user("testuser", "testpassword")
+    foreign = add_transaction(other_user, 5.0, "Not yours", "Other")
+
+    deleted = delete_transactions(user_id, [first, foreign, 999999])
+    assert deleted == [(first, -12.5)]
+    assert [t[1] for t in load_transactions(user_id)].count("Lunch") == 1
+    assert "Not yours" in [t[1] for t in load_transactions(other_user)]
+
+    # Batches larger than one statement's worth of ids
+    assert len(delete_transactions(user_id, bulk_ids + [second])) == 1201
+    assert load_transactions(user_id) == []
+    assert calculate_total_balance(user_id) == 0
+
+
+def test_date_range_queries_use_numeric_timestamps(setup_db):
+    create_user("rangeuser", "rangepassword")
+    user_id = verify_user("rangeuser", "rangepassword")
+    add_transaction(user_id, 1000.0, "Salary", "Pay", "2024-01-31T23:59:59")
+    add_transaction(user_id, -200.0, "Rent", "Bills", "2024-02-01T00:00:00")
+    add_transaction(user_id, -50.0, "Trip", "Bills, Travel", datetime.date(2024, 2, 15))
+    march = add_transaction(user_id, -20.0, "Taxi", "Travel", "2024-03-01T10:00:00.250000")
+    assert get_connection().execute(
+        "SELECT timestamp FROM transactions WHERE id = ?", (march,)).fetchone()[0] == \
+        to_timestamp("2024-03-01T10:00:00") == 1709287200
+
+    february = ("2024-02-01", datetime.datetime(2024, 3, 1))
+    assert [row[1] for row in load_transactions(user_id, *february)] == ["Trip", "Rent"]
+    assert calculate_total_balance(user_id, *february) == -250.0
+    assert load_category_breakdown(user_id, *february) == [("Bills", -250.0), ("Travel", -50.0)]
+    assert [row[1] for row in load_transactions(user_id, start="2024-02-15")] == ["Taxi", "Trip"]
+    assert calculate_total_balance(user_id, end="2024-02-01") == 1000.0
+    assert calculate_total_balance(user_id, "2025-01-01", "2026-01-01") == 0
+
+    # Editing a date moves the row between periods
+    with get_connection() as conn:
+        conn.execute("UPDATE transactions SET date = '2024-02-20T00:00:00' WHERE id = ?", (march,))
+    assert calculate_total_balance(user_id, *february) == -270.0
+
+    # Dates are checked on write, and offsets stored as UTC so month and timestamp agree
+    for bad_date in ("01/02/2024", "soon", 20240102):
+        with pytest.raises(ValueError):
+            add_transaction(user_id, -1.0, "Bad date", "Bills", bad_date)
+    late = add_transaction(user_id, -30.0, "Late", "Bills", "2024-01-31T23:30:00-05:00")
+    assert get_connection().execute(
+        "SELECT date, timestamp FROM transactions WHERE id = ?", (late,)).fetchone() == (
+        "2024-02-01T04:30:00", to_timestamp("2024-01-31T23:30:00-05:00"))
+    assert ("2024-02", 0.0, -300.0) in load_monthly_totals(user_id)
+
+
+def test_archive_moves_old_years_out_and_keeps_totals(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "archive.db"))
+    close_connections()
+    initialize_db()
+    create_user("archiveuser", "archivepassword")
+    user_id = verify_user("archiveuser", "archivepassword")
+    add_transactions_bulk(user_id, [
+        (1000.0, "Salary", "Pay", "2022-03-01T09:00:00"),
+        (-80.0, "Hotel", "Bills, Travel", "2022-12-31T23:00:00"),
+        (-40.0, "Market", "Groceries", "2023-06-15T12:00:00"),
+        (-25.0, "Cinema", "Entertainment", "2024-02-01T20:00:00"),
+        (-10.0, "Bakery", "Groceries", "2024-07-01T08:00:00"),
+    ])
+    before = (calculate_total_balance(user_id), load_category_breakdown(user_id),
+              load_monthly_totals(user_id), get_data_version(user_id))
+
+    result = archive_transactions("2024-01-01")
+    assert (result["rows"], result["years"]) == (3, [2022, 2023])
+    assert os.path.exists(archive_path(2022)) and not os.path.exists(archive_path(2024))
+    assert [row[2] for row in load_statement(user_id, 10)[1]] == ["Bakery", "Cinema"]
+    assert (calculate_total_balance(user_id), load_category_breakdown(user_id),
+            load_monthly_totals(user_id)) == before[:3]
+    assert get_data_version(user_id) > before[3]
+    assert set(check_aggregates().values()) == {0}
+
+    # Range queries read the archive files they overlap
+    assert calculate_total_balance(user_id, "2022-01-01", "2023-01-01") == 920.0
+    assert load_category_breakdown(user_id, "2022-06-01", "2024-03-01") == [
+        ("Bills", -80.0), ("Entertainment", -25.0), ("Groceries", -40.0), ("Travel", -80.0)]
+    assert [row[1] for row in load_transactions(user_id)] == [
+        "Bakery", "Cinema", "Market", "Hotel", "Salary"]
+
+    # A category's drill-down lists every row behind its slice
+    assert sorted(row[1] for row in load_category_transactions(user_id, "Groceries")) == [
+        "Bakery", "Market"]
+    for limit in (1, 10):
+        rows, after = [], None
+        while True:
+            page = load_category_transactions_page(
+                user_id, "Groceries", limit, "amount", True, after)
+            rows += page
+            if len(page) < limit:
+                break
+            after = (page[-1][4], page[-1][0])
+        assert [row[1] for row in rows] == [-10.0, -40.0]
+
+    # Rows added to an archived year later are archived on the next run
+    add_transaction(user_id, -5.0, "Late receipt", "Groceries", "2023-01-02T00:00:00")
+    assert archive_transactions("2024-01-01")["rows"] == 1
+    assert calculate_total_balance(user_id, "2023-01-01", "2024-01-01") == -45.0
+    rebuild_aggregates()
+    assert calculate_total_balance(user_id) == 840.0
+    close_connections()
+
+
+def test_load_transactions_merges_late_rows_into_archived_years(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "late.db"))
+    close_connections()
+    initialize_db()
+    create_user("lateuser", "latepassword")
+    user_id = verify_user("lateuser", "latepassword")
+    add_transactions_bulk(user_id, [
+        (-1.0, "A2022", "", "2022-03-01T00:00:00"),
+        (-1.0, "B2023", "", "2023-03-01T00:00:00"),
+        (-1.0, "C2024", "", "2024-03-01T00:00:00"),
+    ])
+    archive_transactions("2024-01-01")
+    add_transaction(user_id, -1.0, "Late2022", "", "2022-06-01T00:00:00")
+
+    def descriptions(*args):
+        return [row[1] for row in load_transactions(user_id, *args)]
+    assert descriptions() == ["C2024", "B2023", "Late2022", "A2022"]
+    assert descriptions("2022-01-01", "2025-01-01") == ["C2024", "B2023", "Late2022", "A2022"]
+    close_connections()
+
+
+def test_export_streams_in_date_order_across_archives(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "export.db"))
+    close_connections()
+    initialize_db()
+    create_user("exportuser", "exportpassword")
+    user_id = verify_user("exportuser", "exportpassword")
+    add_transactions_bulk(user_id, [
+        (1000.0, "Salary, March", "Pay", "2022-03-01T09:00:00"),
+        (-40.0, "Market", "Groceries", "2023-06-15T12:00:00"),
+        (-25.0, 'Cinema "IMAX"', "", "2024-02-01T20:00:00"),
+    ])
+    archive_transactions("2024-01-01")
+    # A late row for an archived year stays in the main database
+    add_transaction(user_id, -80.0, "Hotel", "Bills, Travel", "2022-12-31T23:00:00")
+    add_transaction(user_id, -10.0, "Bakery", "Groceries", "2024-07-01T08:00:00")
+
+    def descriptions(*args, **kwargs):
+        return [row[3] for row in iter_transactions(user_id, *args, batch_size=1, **kwargs)]
+
+    assert descriptions() == ["Salary, March", "Hotel", "Market", 'Cinema "IMAX"', "Bakery"]
+    assert descriptions("2022-06-01", "2024-03-01") == ["Hotel", "Market", 'Cinema "IMAX"']
+    assert descriptions(category="Groceries") == ["Market", "Bakery"]
+    assert descriptions(category="") == ['Cinema "IMAX"']
+    assert descriptions(category="Nonexistent") == []
+    # Reading resumes after a (date, id) key, whichever file the row came from
+    keys = {row[3]: (row[1], row[0]) for row in iter_transactions(user_id)}
+    assert descriptions(after=keys["Salary, March"]) == [
+        "Hotel", "Market", 'Cinema "IMAX"', "Bakery"]
+    assert descriptions(after=keys["Hotel"]) == ["Market", 'Cinema "IMAX"', "Bakery"]
+    assert descriptions("2024-01-01", after=keys["Hotel"]) == ['Cinema "IMAX"', "Bakery"]
+
+    result = export_transactions_file(user_id, str(tmp_path / "all.csv"))
+    assert result["rows"] == 5 and result["bytes"] > 0
+    create_user("reimportuser", "reimportpassword")
+    copy_id = verify_user("reimportuser", "reimportpassword")
+    import_transactions_file(copy_id, str(tmp_path / "all.csv"))
+    assert calculate_total_balance(copy_id) == calculate_total_balance(user_id) == 845.0
+
+    path = tmp_path / "travel.jsonl"
+    assert export_transactions_file(user_id, str(path), start="2022-01-01",
+                                    category="Travel")["rows"] == 1
+    with open(path) as handle:
+        assert [json.loads(line) for line in handle] == [{
+            "id": 4, "date": "2022-12-31T23:00:00", "description": "Hotel",
+            "amount": -80.0, "category": "Bills, Travel"}]
+    with pytest.raises(ValueError):
+        export_transactions_file(user_id, str(tmp_path / "all.xlsx"))
+    close_connections()
+
+
+def test_read_cache_follows_the_data_version(setup_db):
+    create_user("cacheuser", "cachepassword")
+    user_id = verify_user("cacheuser", "cachepassword")
+    first = add_transaction(user_id, -20.0, "Lunch", "Groceries", "2024-05-01T12:00:00")
+    clear_read_cache()
+    hits = read_cache_stats()["hits"]
+    rows = load_transactions(user_id)
+    rows.append("caller's own change")
+    assert load_transactions(user_id) == [(-20.0, "Lunch", "Groceries", "2024-05-01T12:00:00")]
+    assert calculate_total_balance(user_id) == calculate_total_balance(user_id) == -20.0
+    assert read_cache_stats()["hits"] == hits + 2
+
+    # Inserts, deletes and description edits each invalidate the user's entries
+    second = add_transaction(user_id, -5.0, "Coffee", "Groceries", "2024-05-02T08:00:00")
+    assert calculate_total_balance(user_id) == -25.0
+    assert load_category_breakdown(user_id, "2024-05-02") == [("Groceries", -5.0)]
+    with get_connection() as conn:
+        conn.execute("UPDATE transactions SET description = 'Brunch' WHERE id = ?", (first,))
+    assert [row[1] for row in load_transactions(user_id)] == ["Coffee", "Brunch"]
+    delete_transactions(user_id, [second])
+    assert load_category_breakdown(user_id, "2024-05-02") == []
+    assert read_cache_stats()["invalidations"] >= 3
+
+    # Bounded by entries and by rows
+    cache = VersionedCache(max_entries=2, max_rows=5)
+    for key in "abc":
+        cache.put(key, 1, (0,) * 2)
+    assert cache.get("a", 1) == (False, None) and cache.get("c", 1) == (True, (0, 0))
+    cache.put("d", 1, (0,) * 4)
+    assert cache.stats()["entries"] == 1 and cache.stats()["rows"] == 4
+    cache.put("e", 1, (0,) * 6)
+    assert cache.get("e", 1)[0] is False and cache.get("d", 2)[0] is False
+
+
+def test_analytics_columns_agree_with_the_sql_totals(setup_db):
+    create_user("analyticsuser", "analyticspassword")
+    user_id = verify_user("analyticsuser", "analyticspassword")
+    add_transactions_bulk(user_id, generate_transactions(300, seed=3, years=2))
+    add_transaction(user_id, -10.0, "Nothing filed", "", "2024-12-31T23:59:59")
+    columns = analytics.load_columns(user_id)
+    assert len(columns) == 301
+    assert (columns.dates[:-1] <= columns.dates[1:]).all()
+
+    rollup = analytics.monthly_rollup(columns)
+    totals = {month: (income, expense) for month, income, expense in load_monthly_totals(user_id)}
+    assert len(rollup["months"]) == 24 and rollup["count"].sum() == 301
+    for month, income, expense in zip(rollup["months"], rollup["income"], rollup["expense"]):
+        assert (income / 100, expense / 100) == totals.get(str(month), (0, 0))
+    assert analytics.running_balance(columns)[-1] / 100 == pytest.approx(
+        calculate_total_balance(user_id))
+
+    months, trends = analytics.category_trends(columns)
+    assert sorted(zip(columns.categories, (trends.sum(axis=1) / 100).tolist()),
+                  key=lambda row: row[0] or "") == load_category_breakdown(user_id)
+    assert None in columns.categories
+    assert len(analytics.load_columns(user_id, "2024-12-01", "2025-01-01").months()) == 1
+    assert analytics.moving_average([2, 4, 6, 8], 2).tolist() == [2, 3, 5, 7]
+    assert analytics.moving_average([[1, 2, 3]], 5).tolist() == [[1, 1.5, 2]]
+
+
+def test_balance_history_is_downsampled_per_bucket(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "trend.db"))
+    close_connections()
+    initialize_db()
+    create_user("trenduser", "trendpassword")
+    user_id = verify_user("trenduser", "trendpassword")
+    rows = list(generate_transactions(2000, seed=5, years=4))
+    add_transactions_bulk(user_id, rows)
+    # The history orders by whole-second timestamp, then by id
+    rows.sort(key=lambda row: row[3].replace(microsecond=0))
+    balances = list(itertools.accumulate(round(row[0] * 100) for row in rows))
+
+    points = load_balance_history(user_id, 50)
+    assert len(points) <= 4 * 50 < len(rows)
+    assert [date for date, _ in points] == sorted(date for date, _ in points)
+    assert points[0] == (rows[0][3].replace(microsecond=0).isoformat(), balances[0] / 100)
+    assert points[-1][1] == pytest.approx(calculate_total_balance(user_id))
+    assert min(balance for _, balance in points) == min(balances) / 100
+    assert max(balance for _, balance in points) == max(balances) / 100
+    assert len(load_balance_history(user_id, 10**8)) == len(rows)
+
+    # A period opens at the balance of everything before it, archived or not
+    archive_transactions("2022-06-01")
+    period = [balance for row, balance in zip(rows, balances)
+              if datetime.datetime(2022, 1, 1) <= row[3] < datetime.datetime(2023, 1, 1)]
+    points = load_balance_history(user_id, 10**8, "2022-01-01", "2023-01-01")
+    assert [round(balance * 100) for _, balance in points] == period
+    assert len(load_balance_history(user_id, 10**8)) == len(rows)
+
+    version, points = load_changed_balance_history(user_id, None, 50)
+    assert load_changed_balance_history(user_id, version, 50) is None
+    add_transaction(user_id, 5.0, "Refund", "Other")
+    assert load_changed_balance_history(user_id, version, 50)[1][-1][1] == pytest.approx(
+        points[-1][1] + 5)
+    close_connections()
+
+
+def test_reports_render_each_user_from_read_only_workers(tmp_path, monkeypatch):
+    from src.finance.reports import generate_reports, report_filename
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "reports.db"))
+    close_connections()
+    initialize_db()
+    for index, name in enumerate(["alice", "bob o'neil", "carol"]):
+        create_user(name, "reportpassword")
+        user_id = verify_user(name, "reportpassword")
+        if name != "carol":  # carol has nothing to report
+            add_transactions_bulk(user_id, generate_transactions(100, seed=index, years=2))
+    archive_transactions("2024-01-01")
+
+    result = generate_reports(str(tmp_path / "out"), "pdf", start="2023-06-01", workers=2)
+    assert (result["reports"], result["failed"]) == (3, {})
+    assert report_filename(2, "bob o'neil", "pdf") == "000002-bob_o_neil.pdf"
+    for name in sorted(os.listdir(tmp_path / "out")):
+        with open(tmp_path / "out" / name, "rb") as handle:
+            assert handle.read(5) == b"%PDF-"
+    result = generate_reports(str(tmp_path / "out"), usernames=["alice"], workers=1)
+    assert result["reports"] == 1 and os.path.exists(tmp_path / "out" / "000001-alice.png")
+    with pytest.raises(ValueError):
+        generate_reports(str(tmp_path / "out"), usernames=["nobody"])
+
+    # Workers open the database read-only
+    monkeypatch.setattr(src.finance.database, "READ_ONLY", True)
+    assert calculate_total_balance(1) == calculate_total_balance(1, "2000-01-01")
+    with pytest.raises(sqlite3.OperationalError):
+        add_transaction(1, 1.0, "Refused", "Groceries")
+    monkeypatch.setattr(src.finance.database, "READ_ONLY", False)
+    close_connections()
+
+
+def test_snapshots_are_consistent_while_writers_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "live.db"))
+    close_connections()
+    initialize_db()
+    create_user("backupuser", "backuppassword")
+    user_id = verify_user("backupuser", "backuppassword")
+    add_transactions_bulk(user_id, generate_transactions(3000, seed=4, years=3))
+    archive_transactions("2023-01-01")
+    # As if archive_transactions had copied a row but not yet deleted it
+    moving = get_connection().execute(
+        "SELECT * FROM transactions ORDER BY timestamp LIMIT 1").fetchone()
+    with sqlite3.connect(archive_path(2022)) as archive:
+        archive.execute("INSERT INTO transactions (id, user_id, amount, description, category, "
+                        "date, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?)", moving)
+
+    stop = threading.Event()
+
+    def write():
+        conn = sqlite3.connect(src.finance.database.DB_NAME)
+        while not stop.is_set():
+            with conn:
+                conn.execute("INSERT INTO transactions (user_id, amount, description, date, "
+                             "timestamp) VALUES (?, -1, 'During backup', "
+                             "'2024-06-01T00:00:00', 1717200000)", (user_id,))
+        conn.close()
+    writer = threading.Thread(target=write)
+    writer.start()
+    try:
+        results = [create_snapshot(str(tmp_path / "backups"), keep=2, pages=8, sleep=0.001)
+                   for _ in range(3)]
+    finally:
+        stop.set()
+        writer.join()
+    names = list_snapshots(str(tmp_path / "backups"))
+    assert len(names) == 2 and results[2]["removed"] == [os.path.basename(results[0]["path"])]
+    assert results[2]["bytes"] > 0 and results[2]["mb_per_second"] > 0
+
+    snapshot = os.path.join(results[2]["path"], "live.db")
+    assert sorted(os.listdir(results[2]["path"])) == ["live.archive-2022.db", "live.db"]
+    with sqlite3.connect(os.path.join(results[2]["path"], "live.archive-2022.db")) as archive:
+        assert archive.execute("SELECT 1 FROM transactions WHERE id = ?",
+                               (moving[0],)).fetchone() is None
+    monkeypatch.setattr(src.finance.database, "DB_NAME", snapshot)
+    close_connections()
+    assert not any(check_aggregates().values())
+    assert calculate_total_balance(user_id, end="2024-01-01") == pytest.approx(
+        calculate_total_balance(user_id) - calculate_total_balance(user_id, "2024-01-01"))
+    close_connections()
+    with pytest.raises(ValueError):
+        create_snapshot(str(tmp_path / "backups"), keep=0)
+
+
+def test_scheduled_backups_survive_a_failed_run(tmp_path, capsys, monkeypatch):
+    import src.finance.__main__ as cli
+    monkeypatch.setattr(src.finance.database, "DB_NAME", src.finance.database.DB_NAME)
+    backups = tmp_path / "backups"
+    # Left behind by a run that was killed mid-copy
+    os.makedirs(backups / "snapshot-20240101T000000.000000Z.partial")
+    calls = []
+
+    def flaky_snapshot(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        if len(calls) == 2:
+            raise OSError(28, "No space left on device")
+        return create_snapshot(*args)
+
+    def sleep(seconds):
+        if len(calls) == 4:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(cli, "create_snapshot", flaky_snapshot)
+    monkeypatch.setattr(cli.time, "sleep", sleep)
+    finance_cli(["--db", str(tmp_path / "scheduled.db"), "backup", str(backups),
+                 "--every", "1", "--keep", "1"])
+    close_connections()
+
+    output = capsys.readouterr()
+    assert "Backup failed: database is locked" in output.err
+    assert "Backup failed: [Errno 28] No space left on device" in output.err
+    assert "Removed snapshot-20240101T000000.000000Z.partial" in output.out
+    assert len(list_snapshots(str(backups))) == 1 and len(os.listdir(backups)) == 1
+
+    # Without --every a failure is the exit status
+    def failed_snapshot(*args):
+        raise BackupError("live.db failed its integrity check")
+    monkeypatch.setattr(cli, "create_snapshot", failed_snapshot)
+    with pytest.raises(SystemExit, match="Backup failed: live.db failed"):
+        finance_cli(["--db", str(tmp_path / "scheduled.db"), "backup", str(backups)])
+    close_connections()
+
+
+def test_search_transactions_matches_prefixes_and_phrases(setup_db):
+    create_user("searchuser", "searchpassword")
+    user_id = verify_user("searchuser", "searchpassword")
+    coffee = add_transaction(user_id, -4.5, "Corner Coffee Shop", "Groceries",
+                             "2024-02-01T08:00:00")
+    add_transaction(user_id, -3.0, "Coffee beans", "Groceries", "2024-02-02T08:00:00")
+    add_transaction(user_id, -60.0, "Shop Corner Hardware", "Bills", "2024-02-03T08:00:00")
+    add_transaction(user_id, -2.0, "Café Crème", "Groceries", "2024-02-04T08:00:00")
+    add_transaction(verify_user("testuser", "testpassword"), -1.0, "Coffee", "Groceries")
+
+    def descriptions(text, **kwargs):
+        return [row[2] for row in search_transactions(user_id, text, 10, **kwargs)]
+
+    assert descriptions("cof") == ["Coffee beans", "Corner Coffee Shop"]
+    assert descriptions("corner shop") == ["Shop Corner Hardware", "Corner Coffee Shop"]
+    assert descriptions('"corner shop"') == []
+    assert descriptions('"corner coffee"') == ["Corner Coffee Shop"]
+    assert descriptions("cafe creme") == ["Café Crème"]
+    assert descriptions('   ') == [] and descriptions('"') == [] and descriptions("-") == []
+    add_transactions_bulk(user_id, [(-8.0, "Bulk coffee order", "Groceries", None)] * 3)
+    assert descriptions("bulk cof") == ["Bulk coffee order"] * 3
+    add_transaction(user_id, -1.0, "Single coffee", "Groceries")
+    assert descriptions("single") == ["Single coffee"]
+    delete_transactions(user_id, [row[0] for row in search_transactions(user_id, "bulk", 10)]
+                        + [search_transactions(user_id, "single", 1)[0][0]])
+
+    first_page = search_transactions(user_id, "corner", 1)
+    assert [row[2] for row in first_page] == ["Shop Corner Hardware"]
+    assert descriptions("corner", older_than=(first_page[0][4], first_page[0][0])) == [
+        "Corner Coffee Shop"]
+
+    # The index follows edits and deletes
+    with get_connection() as conn:
+        conn.execute("UPDATE transactions SET description = 'Bakery' WHERE id = ?", (coffee,))
+    assert descriptions("corner") == ["Shop Corner Hardware"]
+    assert descriptions("bak") == ["Bakery"]
+    delete_transactions(user_id, [coffee])
+    assert descriptions("bak") == []
+
+
+def test_profiling_records_queries_and_functions(setup_db, tmp_path):
+    user_id = verify_user("testuser", "testpassword")
+    reset_profile()
+    enable_profiling()
+    try:
+        assert type(get_connection()).__name__ == "ProfilingConnection"
+        transaction_id = add_transaction(user_id, 3.0, "Profiled", "Other")
+        load_statement(user_id, 50)
+        delete_transactions(user_id, [transaction_id, -1, -2])
+    finally:
+        disable_profiling()
+    assert type(get_connection()) is sqlite3.Connection
+    load_transactions(user_id)  # Not recorded once disabled
+
+    report = profile_report()
+    page_query = next(sql for sql in report["queries"] if "ORDER BY date DESC, id DESC LIMIT ?" in sql)
+    assert report["queries"][page_query]["calls"] == 1
+    assert 0 < report["queries"][page_query]["rows"] <= 50
+    assert "WHERE id IN (?, ...) AND user_id = ?" in " ".join(report["queries"])
+    assert report["functions"]["src.finance.data.load_statement"]["calls"] == 1
+    assert "src.finance.data.load_transactions" not in report["functions"]
+    assert report["statements"]["COMMIT"] >= 2
+    histogram = report["functions"]["src.finance.data.add_transaction"]["histogram"]
+    assert sum(histogram.values()) == 1
+
+    export_profile(tmp_path / "profile.json")
+    with open(tmp_path / "profile.json") as handle:
+        assert json.load(handle)["queries"].keys() == report["queries"].keys()
+    reset_profile()
+
+
+def test_initialize_db_upgrades_legacy_database(tmp_path, monkeypatch):
+    # A database created before schema versioning (user_version 0)
+    legacy_db = str(tmp_path / "legacy.db")
+    with sqlite3.connect(legacy_db) as conn:
+        conn.execute("""
+        CREATE TABLE users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL
+        )""")
+        conn.execute("""
+        CREATE TABLE transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            description TEXT,
+            category TEXT,
+            date TEXT NOT NULL
+        )""")
+        conn.execute("INSERT INTO users (username, password) VALUES (?, ?)",
+                     ("legacy", hash_password("secret")))
+        conn.execute("""
+        INSERT INTO transactions (user_id, amount, description, category, date)
+        VALUES (1, 25.0, 'Old Income', 'Pay', '2024-01-01T00:00:00'),
+               (1, -5.0, 'Old Trip', 'Bills, Travel', '2024-01-02T00:00:00')""")
+    conn.close()
+
+    monkeypatch.setattr(src.finance.database, "DB_NAME", legacy_db)
+    # Another process upgrades the file between our version check and our write lock
+    stale_check = src.finance.database._schema_is_current
+    racing = []
+
+    def upgrade_first(conn):
+        current = stale_check(conn)
+        if not racing:
+            racing.append(sqlite3.connect(legacy_db))
+            src.finance.database.migrate(racing[0])
+            racing[0].close()
+        return current
+    monkeypatch.setattr(src.finance.database, "_schema_is_current", upgrade_first)
+    initialize_db()
+    monkeypatch.setattr(src.finance.database, "_schema_is_current", stale_check)
+    user_id = verify_user("legacy", "secret")
+    assert load_transactions(user_id)[-1][1] == "Old Income"
+    assert [row[2] for row in search_transactions(user_id, "trip", 10)] == ["Old Trip"]
+    assert calculate_total_balance(user_id, "2024-01-02", "2024-01-03") == -5.0
+    assert calculate_total_balance(user_id) == 20.0
+    assert load_category_breakdown(user_id) == [
+        ("Bills", -5.0), ("Pay", 25.0), ("Travel", -5.0)]
+    assert get_connection().execute(
+        "PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    close_connections()
+
+
+def test_imports_have_no_gui_or_database_side_effects(tmp_path):
+    # Run in a clean interpreter and an empty directory
+    code = ("import sys, src.PersonalFinanceApp, src.finance; "
+            "assert 'matplotlib' not in sys.modules; "
+            "assert src.PersonalFinanceApp.root is None")
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env, check=True)
+    assert os.listdir(tmp_path) == []
+
+
+def test_cli_check_aggregates(tmp_path, capsys, monkeypatch):
+    # The CLI points the data layer at --db; restore it afterwards
+    monkeypatch.setattr(src.finance.database, "DB_NAME", src.finance.database.DB_NAME)
+    profile = tmp_path / "profile.json"
+    finance_cli(["--db", str(tmp_path / "cli.db"), "--profile", str(profile), "check-aggregates"])
+    assert "user_balances: ok" in capsys.readouterr().out
+    with open(profile) as handle:
+        assert "src.finance.database.check_aggregates" in json.load(handle)["functions"]
+    reset_profile()
+    close_connections()
+
+
+def test_api_server_serves_users_by_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", str(tmp_path / "api.db"))
+    close_connections()
+    initialize_db()
+
+    async def scenario():
+        server = ApiServer(workers=2)
+        host, port = await server.start(port=0)
+        alice, bob = Client(host, port), Client(host, port)
+        try:
+            assert (await alice.request("GET", "/balance"))[0] == 401
+            for client, name in ((alice, "alice"), (bob, "bob")):
+                credentials = {"username": name, "password": "pw"}
+                assert (await client.request("POST", "/users", credentials))[0] == 201
+                status, payload = await client.request("POST", "/sessions", credentials)
+                assert status == 201
+                client.token = payload["token"]
+            assert (await bob.request("POST", "/users", {"username": "bob",
+                                                         "password": "x"}))[0] == 409
+
+            added = []
+            for amount, category, date in ((1000, "Pay", "2024-01-01"),
+                                           (-50.5, "Bills, Travel", "2024-02-01T10:00:00")):
+                status, payload = await alice.request("POST", "/transactions", {
+                    "amount": amount, "description": "x", "category": category, "date": date})
+                assert status == 201
+                added.append(payload["id"])
+            assert (await alice.request("POST", "/transactions", {
+                "amount": 1, "description": "x", "category": "Pay", "date": "soon"}))[0] == 400
+            assert (await alice.request("GET", "/balance"))[1] == {"balance": 949.5}
+            assert (await alice.request("GET", "/balance?start=2024-02-01"))[1] == {
+                "balance": -50.5}
+            assert (await alice.request("GET", "/breakdown?end=2024-03-01"))[1]["categories"] == [
+                {"category": "Bills", "total": -50.5}, {"category": "Pay", "total": 1000.0},
+                {"category": "Travel", "total": -50.5}]
+            status, payload = await alice.request("GET", "/transactions?category=Travel")
+            assert [row["id"] for row in payload["transactions"]] == [added[1]]
+            # Pages follow on from the "next" cursor
+            status, payload = await alice.request("GET", "/transactions?limit=1")
+            assert [row["id"] for row in payload["transactions"]] == [added[0]]
+            assert payload["next"] == {"after_date": "2024-01-01T00:00:00", "after_id": added[0]}
+            status, payload = await alice.request("GET", "/transactions?limit=1&" +
+                                                  urllib.parse.urlencode(payload["next"]))
+            assert [row["id"] for row in payload["transactions"]] == [added[1]]
+            assert payload["next"] is None
+            assert (await alice.request("GET", "/transactions?after_id=1"))[0] == 400
+
+            # Sessions keep users apart
+            assert (await bob.request("GET", "/balance"))[1] == {"balance": 0}
+            assert (await bob.request("DELETE", "/transactions", {"ids": added}))[1] == {
+                "deleted": []}
+            assert (await alice.request("DELETE", "/transactions", {"ids": added[:1]}))[1] == {
+                "deleted": added[:1]}
+            assert (await alice.request("GET", "/balance"))[1] == {"balance": -50.5}
+
+            # An archived row that is listed can be deleted, totals and all
+            archive_transactions("2025-01-01")
+            status, payload = await alice.request("GET", "/transactions")
+            assert [row["id"] for row in payload["transactions"]] == [added[1]]
+            assert (await alice.request("DELETE", "/transactions", {"ids": added[1:]}))[1] == {
+                "deleted": added[1:]}
+            assert (await alice.request("GET", "/transactions"))[1] == {
+                "transactions": [], "next": None}
+            assert (await alice.request("GET", "/balance"))[1] == {"balance": 0}
+            assert (await alice.request("GET", "/breakdown"))[1] == {"categories": []}
+            assert set(check_aggregates().values()) == {0}
+            assert get_connection().execute(
+                "SELECT year, transaction_count FROM archives").fetchall() == [(2024, 0)]
+
+            assert (await alice.request("GET", "/nothing"))[0] == 404
+            assert (await alice.request("PUT", "/balance"))[0] == 405
+            assert (await alice.request("DELETE", "/sessions"))[0] == 200
+            assert (await alice.request("GET", "/balance"))[0] == 401
+
+            report = await load_test(host, port, clients=4, users=2, duration=0.3, seed=1)
+            assert report["requests"] > 0 and not report["errors"]
+        finally:
+            await alice.close()
+            await bob.close()
+            await server.close()
+
+    asyncio.run(scenario())
+
+
+def test_synthetic_data_is_reproducible():
+    rows = list(generate_transactions(500, seed=7))
+    assert rows == list(generate_transactions(500, seed=7))
+    assert rows != list(generate_transactions(500, seed=8))
+    assert all(row[3].year in range(2020, 2025) for row in rows)
+    assert any(row[0] > 0 for row in rows) and any(row[0] < 0 for row in rows)
+    sizes = user_sizes(10000, 5)
+    assert sum(sizes) == 10000 and max(sizes) > 2 * min(sizes)
+
+
+def test_benchmark_suite_reports_and_compares(tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(src.finance.database, "DB_NAME", src.finance.database.DB_NAME)
+    report = tmp_path / "report.json"
+    arguments = ["--scales", "300", "--users", "3", "--repeat", "2",
+                 "--data-dir", str(tmp_path)]
+    benchmark_cli(arguments + ["--json", str(report)])
+    assert "statement refresh (load_statement)" in capsys.readouterr().out
+    # A rerun reuses the kept dataset and is compared with the first run
+    benchmark_cli(arguments + ["--compare", str(report), "--tolerance", "1000"])
+    out = capsys.readouterr().out
+    assert "populate" not in out and "No case is more than" in out
+